@@ -0,0 +1,133 @@
+"""
+Multi-device scaling benchmark.
+
+Runs 1..N simulated lasers through one event loop (the MultiLaserMonitor
+setup) and reports CPU and RSS per device. The simulated lasers run in a
+separate process so their cost is not counted.
+
+Usage:
+    python3 benchmarks/bench_devices.py [--counts 1,2,4,8,16,32] [--duration 5] [--interval 0.1]
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socketserver
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from config import Config, DeviceConfig
+from monitor import LaserMonitor
+from transport import TcpTransport
+
+STATUS_LINES = [
+    b"<Run|MPos:34.900,53.963,0.000|Bf:15,128|FS:1000,800|Ov:100,100,100|A:SF>\r\n",
+    b"<Run|MPos:35.112,54.001,0.000|Bf:14,96|FS:3000,0>\r\n",
+    b"<Idle|MPos:0.000,0.000,0.000|FS:0,0>\r\n",
+]
+
+
+class FakeLaser(socketserver.BaseRequestHandler):
+    def handle(self):
+        i = 0
+        while True:
+            try:
+                data = self.request.recv(64)
+            except ConnectionError:
+                return
+            if not data:
+                return
+            for _ in range(data.count(b"?")):
+                self.request.sendall(STATUS_LINES[i % len(STATUS_LINES)] + b"ok\r\n")
+                i += 1
+
+
+def serve(port_queue):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeLaser)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class NullMqtt:
+    """Stands in for the shared paho client without recording calls."""
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        pass
+
+
+def rss_kib():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def run_devices(monitors, port, duration):
+    loop = asyncio.get_running_loop()
+    links = []
+    for _ in monitors:
+        link = TcpTransport("127.0.0.1", port)
+        await link.open_async(loop)
+        links.append(link)
+
+    executor = ThreadPoolExecutor(max_workers=min(4, len(monitors)))
+    sessions = [monitor._poll_session(loop, link, executor) for monitor, link in zip(monitors, links)]
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.gather(*sessions), timeout=duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        executor.shutdown(wait=True)
+        for link in links:
+            link.close()
+    return cpu, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-device CPU and RSS as the device count grows")
+    parser.add_argument("--counts", default="1,2,4,8,16,32", help="Comma separated device counts")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to poll at each count")
+    parser.add_argument("--interval", type=float, default=0.1, help="Polling interval per device")
+    args = parser.parse_args()
+    counts = sorted(int(c) for c in args.counts.split(","))
+
+    logging.basicConfig(level=logging.WARNING)
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(port_queue,), daemon=True)
+    server.start()
+    port = port_queue.get()
+
+    base = Config("/nonexistent.yaml")
+    base.polling_interval = args.interval
+    baseline = rss_kib()
+    monitors = []
+
+    print(f"{'devices':>8} {'polls/s':>10} {'cpu %':>8} {'cpu %/dev':>10} {'rss MiB':>9} {'rss KiB/dev':>12}")
+    for count in counts:
+        while len(monitors) < count:
+            device = DeviceConfig(base, {"name": f"laser{len(monitors)}", "bluetooth_mac": "00:00:00:00:00:00"})
+            monitors.append(LaserMonitor(device=device, mqtt_client=NullMqtt()))
+
+        for monitor in monitors:
+            monitor.poll_stats.reset()
+        cpu, wall = asyncio.run(run_devices(monitors, port, args.duration))
+
+        polls = sum(monitor.poll_stats.summary()["samples"] for monitor in monitors)
+        rss = rss_kib()
+        cpu_pct = cpu / wall * 100
+        print(f"{count:>8} {polls / wall:>10.1f} {cpu_pct:>8.2f} {cpu_pct / count:>10.3f} "
+              f"{rss / 1024:>9.1f} {(rss - baseline) / count:>12.1f}")
+
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
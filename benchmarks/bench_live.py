@@ -0,0 +1,95 @@
+"""
+Live status fan-out benchmark.
+
+Connects 1..N Server-Sent-Events clients to a LiveServer and publishes
+statuses at it. Reports the cost of serializing an event (paid once) and
+of handing it to every client, per event and per client. The clients run
+in a separate process so their reading is not counted.
+
+Usage:
+    python3 benchmarks/bench_live.py [--counts 1,10,100,250] [--events 2000]
+"""
+import argparse
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from grbl import parse_status
+from liveserver import LiveServer
+
+STATUS = parse_status("<Run|MPos:34.900,53.963,0.000|Bf:15,128|FS:1000,800|Ov:100,100,100|A:SF>", 1000, 20)
+
+
+def clients(port, count, connected, done):
+    """Opens `count` SSE connections and drains them until told to stop."""
+    selector = selectors.DefaultSelector()
+    for _ in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(b"GET /events HTTP/1.1\r\n\r\n")
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+    connected.set()
+    while not done.is_set():
+        for key, _ in selector.select(0.1):
+            try:
+                key.fileobj.recv(1 << 16)
+            except BlockingIOError:
+                pass
+
+
+def run(count, events):
+    server = LiveServer("127.0.0.1", 0, client_buffer=64 << 20).start()
+    broadcast = server._broadcast
+    spent = [0.0, 0]
+
+    def timed(*args):
+        start = time.perf_counter()
+        broadcast(*args)
+        spent[0] += time.perf_counter() - start
+        spent[1] += 1
+
+    server._broadcast = timed
+    connected, done = multiprocessing.Event(), multiprocessing.Event()
+    process = multiprocessing.Process(target=clients, args=(server.port, count, connected, done), daemon=True)
+    process.start()
+    connected.wait()
+    deadline = time.monotonic() + 10
+    while len(server.clients) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    serialize = 0.0
+    for i in range(events):
+        STATUS["timestamp"] = i
+        start = time.perf_counter()
+        server.publish("laser", "status", STATUS)
+        serialize += time.perf_counter() - start
+        while spent[1] < i - 10:
+            time.sleep(0.0005) # Let the loop keep up, as it would at poll rate
+    while spent[1] < events:
+        time.sleep(0.01)
+
+    done.set()
+    process.join(5)
+    server.stop()
+    return serialize / events, spent[0] / events, server.dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live server cost per event as clients are added")
+    parser.add_argument("--counts", default="1,10,100,250", help="Comma separated client counts")
+    parser.add_argument("--events", type=int, default=2000, help="Statuses to publish at each count")
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'serialize µs':>13} {'fan-out µs':>11} {'per client µs':>14} {'dropped':>8}")
+    for count in sorted(int(c) for c in args.counts.split(",")):
+        serialize, fanout, dropped = run(count, args.events)
+        print(f"{count:>8} {serialize * 1e6:>13.1f} {fanout * 1e6:>11.1f} {fanout * 1e6 / count:>14.2f} {dropped:>8}")
+
+
+if __name__ == "__main__":
+    main()
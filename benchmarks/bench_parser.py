@@ -0,0 +1,152 @@
+"""
+Status parser throughput benchmark.
+
+Compares the single-pass tokenizer in grbl.py against the previous
+four-regex implementation of LaserMonitor.parse_response, both on its own and
+the way the monitor calls it, with a FieldCache.
+
+The input is a status stream shaped like a real session (an idle machine
+repeating one report, then a job moving on every report) or the status lines
+of a log. The parsers take turns, with the garbage collector off, and the
+best of --repeat short rounds is reported, so a busy host slows all of them
+alike.
+
+Usage:
+    python3 benchmarks/bench_parser.py [--lines 5000] [--repeat 60] [--log status.log]
+"""
+import argparse
+import gc
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from grbl import FieldCache, parse_status
+
+IDLE_REPORTS = 400
+JOB_REPORTS = 600
+
+
+def legacy_parse(line, max_spindle_speed=1000, framing_threshold=20):
+    """The four-regex parser that parse_status replaced."""
+    data = {"raw": line}
+    state_match = re.search(r"^<([^|]+)\|", line)
+    if state_match:
+        data["state"] = state_match.group(1)
+    else:
+        return None
+    mpos_match = re.search(r"MPos:([\d.-]+),([\d.-]+),([\d.-]+)", line)
+    if mpos_match:
+        data["mpos"] = {
+            "x": float(mpos_match.group(1)),
+            "y": float(mpos_match.group(2)),
+            "z": float(mpos_match.group(3))
+        }
+    fs_match = re.search(r"FS:(\d+),(\d+)", line)
+    if fs_match:
+        data["feed_rate"] = int(fs_match.group(1))
+        data["spindle_speed"] = int(fs_match.group(2))
+        data["laser_power_pct"] = round((data["spindle_speed"] / max_spindle_speed) * 100, 1)
+    a_match = re.search(r"\|A:([^|>]+)", line)
+    if a_match:
+        acc_str = a_match.group(1)
+        data["accessories"] = {
+            "spindle_enabled": "S" in acc_str,
+            "flood_coolant": "F" in acc_str,
+            "mist_coolant": "M" in acc_str
+        }
+    else:
+        data["accessories"] = {"spindle_enabled": False, "flood_coolant": False, "mist_coolant": False}
+    if data["state"] == "Run":
+        spindle = data.get("spindle_speed", 0)
+        coolant_on = data["accessories"]["flood_coolant"] or data["accessories"]["mist_coolant"]
+        if spindle == 0:
+            data["detailed_status"] = "Moving"
+        elif coolant_on or spindle > framing_threshold:
+            data["detailed_status"] = "Lasering"
+        else:
+            data["detailed_status"] = "Framing"
+    else:
+        data["detailed_status"] = data["state"]
+    return data
+
+
+def session_lines():
+    """
+    One idle stretch and one job, as GRBL 1.1 reports them: WCO and Ov are only
+    sent every few reports (10 while idle, 30 and 20 while running) and A:
+    comes with Ov. The job alternates burning segments and travel moves.
+    """
+    lines = []
+    for i in range(IDLE_REPORTS):
+        line = "<Idle|MPos:0.000,0.000,0.000|Bf:15,128|FS:0,0"
+        if i % 10 == 0:
+            line += "|WCO:0.000,0.000,0.000"
+        elif i % 10 == 5:
+            line += "|Ov:100,100,100|A:"
+        lines.append(line + ">")
+    for i in range(JOB_REPORTS):
+        burning = (i // 50) % 2 == 0
+        line = f"<Run|MPos:{10 + i * 0.25:.3f},{20 + (i % 50) * 0.1:.3f},0.000|Bf:{12 + i % 4},{64 + i * 7 % 64}"
+        line += "|FS:1500,800" if burning else "|FS:3000,0"
+        if i % 30 == 0:
+            line += "|WCO:0.000,0.000,0.000"
+        elif i % 20 == 0:
+            line += "|Ov:100,100,100|A:S" if burning else "|Ov:100,100,100|A:"
+        lines.append(line + ">")
+    return lines
+
+
+def load_lines(path, count):
+    if path:
+        with open(path, 'r', errors='replace') as f:
+            lines = [line.strip() for line in f if line.startswith("<")]
+    else:
+        lines = session_lines()
+    if not lines:
+        raise SystemExit(f"No status lines found in {path}")
+    return (lines * (count // len(lines) + 1))[:count]
+
+
+def measure(parsers, lines, repeat):
+    """Returns the best lines/second of each parser out of `repeat` rounds."""
+    best = dict.fromkeys(parsers, 0.0)
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for name, parser in parsers.items():
+                start = time.perf_counter()
+                for line in lines:
+                    parser(line)
+                best[name] = max(best[name], len(lines) / (time.perf_counter() - start))
+    finally:
+        gc.enable()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GRBL status parser throughput")
+    parser.add_argument("--lines", type=int, default=5000, help="Number of lines to parse per round")
+    parser.add_argument("--repeat", type=int, default=60, help="Rounds per parser, the best one counts")
+    parser.add_argument("--log", help="Replay status lines from a log file instead of a generated session")
+    args = parser.parse_args()
+
+    lines = load_lines(args.log, args.lines)
+    cache = FieldCache()
+    rates = measure({
+        "legacy": legacy_parse,
+        "single": parse_status,
+        "cached": lambda line: parse_status(line, 1000, 20, cache),
+    }, lines, args.repeat)
+
+    legacy = rates["legacy"]
+    print(f"Lines per round:      {len(lines)}")
+    print(f"Regex parser:         {legacy:,.0f} lines/s")
+    print(f"Single-pass parser:   {rates['single']:,.0f} lines/s ({rates['single'] / legacy:.2f}x)")
+    print(f"  with a FieldCache:  {rates['cached']:,.0f} lines/s ({rates['cached'] / legacy:.2f}x, as the monitor parses)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+"""
+End-to-end pipeline benchmark.
+
+Measures, without a laser or a real broker:
+    parse       parse_response throughput
+    handle      handle_state_change cost with a stubbed MQTT client
+    payload     MQTT bytes and publishes per poll for each payload format
+    e2e         latency from status bytes on the socket to the MQTT PUBLISH
+                arriving at a local broker stand-in, through the asyncio run mode
+    safety      the same for safety states (Hold, Door, Alarm) on the fast lane
+    memory      allocations retained per poll over a long run (tracemalloc)
+    alloc       objects and bytes each poll leaves behind as garbage (parse and
+                JSON payload), fresh objects every poll vs the field cache and
+                the fragment encoder
+
+Results can be written as JSON and compared against an earlier run, so
+regressions show up between releases instead of as choppy HA graphs.
+
+Usage:
+    python3 benchmarks/bench_pipeline.py [--json results.json] [--compare baseline.json] [--threshold 10]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import paho.mqtt.client as mqtt
+
+from config import Config, DeviceConfig
+from monitor import LaserMonitor, disable_nagle
+from grbl import FieldCache, parse_status
+from payloads import FORMATS, FragmentEncoder, missing_dependency
+from transport import TcpTransport
+
+# Metrics where a larger value is an improvement; everything else is a cost
+HIGHER_IS_BETTER = {"parse.lines_per_s", "handle.calls_per_s", "e2e.polls_per_s"}
+
+
+def job_lines(count):
+    """A realistic status sequence: idle, framing, a moving lasering job, idle."""
+    lines = []
+    for i in range(count):
+        phase = (i * 10 // count)
+        if phase == 0 or phase == 9:
+            lines.append("<Idle|MPos:0.000,0.000,0.000|Bf:15,128|FS:0,0>")
+        elif phase == 1:
+            lines.append(f"<Run|MPos:{i % 50:.3f},0.000,0.000|Bf:15,128|FS:3000,10|A:S>")
+        else:
+            x, y = (i * 0.37) % 300, (i * 0.11) % 200
+            power = 600 + i % 200
+            lines.append(f"<Run|MPos:{x:.3f},{y:.3f},0.000|Bf:14,96|FS:1500,{power}|Ln:{i}|A:SF>")
+    return lines
+
+
+class CountingMqtt:
+    """Stands in for the paho client and only counts publishes and bytes."""
+    def __init__(self):
+        self.published = 0
+        self.bytes = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+        # Topic and payload, as in the PUBLISH packet
+        self.bytes += len(topic) + len(payload if isinstance(payload, bytes) else str(payload).encode())
+
+
+def make_monitor(mqtt_client, publish_on_change=True, interval=0.02, port=0, payload_format="json", queue_size=0):
+    base = Config("/nonexistent.yaml")
+    base.publish_on_change = publish_on_change
+    base.payload_format = payload_format
+    if queue_size is not None:
+        # Inline sinks measure the whole cost of a status; e2e keeps the configured queues
+        base.pipeline_queue_size = queue_size
+    base.polling_interval = interval
+    device = DeviceConfig(base, {"name": "bench", "transport": "tcp", "tcp_host": "127.0.0.1", "tcp_port": port})
+    return LaserMonitor(device=device, mqtt_client=mqtt_client)
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def bench_parse(count):
+    monitor = make_monitor(None)
+    lines = job_lines(count)
+    best = 0.0
+    for _ in range(3):
+        start = time.perf_counter()
+        for line in lines:
+            monitor.parse_response(line)
+        best = max(best, count / (time.perf_counter() - start))
+    return {"lines_per_s": round(best)}
+
+
+def bench_handle(count):
+    results = {}
+    for name, on_change in (("every_poll", False), ("on_change", True)):
+        stub = CountingMqtt()
+        monitor = make_monitor(stub, publish_on_change=on_change)
+        parsed = [monitor.parse_response(line) for line in job_lines(count)]
+        start = time.perf_counter()
+        for data in parsed:
+            monitor.handle_state_change(data)
+        elapsed = time.perf_counter() - start
+        results[f"{name}_us"] = round(elapsed / count * 1e6, 3)
+        results[f"{name}_published"] = stub.published
+        if not on_change:
+            results["calls_per_s"] = round(count / elapsed)
+    return results
+
+
+class StubBroker:
+    """
+    Just enough of an MQTT 3.1.1 broker for one publishing client:
+    CONNECT/CONNACK, PUBLISH (QoS 0/1), SUBSCRIBE/SUBACK and PINGREQ/PINGRESP.
+    Every PUBLISH is handed to on_publish(topic, payload, received_at).
+    """
+    def __init__(self, on_publish):
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                try:
+                    broker._serve(self.request)
+                except (ConnectionError, OSError):
+                    pass
+
+        self.on_publish = on_publish
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="stub-broker", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def _read(conn, size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client went away")
+            data += chunk
+        return data
+
+    def _serve(self, conn):
+        while True:
+            header = self._read(conn, 1)[0]
+            length, shift = 0, 0
+            while True:
+                byte = self._read(conn, 1)[0]
+                length |= (byte & 0x7F) << shift
+                shift += 7
+                if not byte & 0x80:
+                    break
+            body = self._read(conn, length)
+            received_at = time.perf_counter()
+            kind = header >> 4
+            if kind == 1: # CONNECT
+                conn.sendall(b"\x20\x02\x00\x00")
+            elif kind == 3: # PUBLISH
+                qos = (header >> 1) & 0x03
+                topic_len = int.from_bytes(body[:2], "big")
+                topic = body[2:2 + topic_len].decode()
+                offset = 2 + topic_len
+                if qos:
+                    conn.sendall(b"\x40\x02" + body[offset:offset + 2])
+                    offset += 2
+                self.on_publish(topic, body[offset:], received_at)
+            elif kind == 8: # SUBSCRIBE
+                # Packet id, then (topic length, topic, requested QoS) per filter
+                granted = bytearray()
+                i = 2
+                while i < len(body):
+                    i += 2 + int.from_bytes(body[i:i + 2], "big")
+                    granted.append(body[i] & 0x03)
+                    i += 1
+                conn.sendall(bytes([0x90, 2 + len(granted)]) + body[:2] + granted)
+            elif kind == 12: # PINGREQ
+                conn.sendall(b"\xd0\x00")
+            elif kind == 14: # DISCONNECT
+                return
+
+
+class StampedLaser(socketserver.BaseRequestHandler):
+    """Answers every '?' with a status report numbered in Ln, and remembers when it was sent."""
+    sent_at = {}
+
+    def handle(self):
+        seq = 0
+        while True:
+            try:
+                data = self.request.recv(64)
+            except ConnectionError:
+                return
+            if not data:
+                return
+            for _ in range(data.count(b"?")):
+                seq += 1
+                line = f"<Run|MPos:{seq * 0.1:.3f},0.000,0.000|Bf:15,128|FS:1500,800|Ln:{seq}|A:SF>\r\n"
+                StampedLaser.sent_at[seq] = time.perf_counter()
+                self.request.sendall(line.encode())
+
+
+class HoldingLaser(socketserver.BaseRequestHandler):
+    """Answers '?' alternately with Hold:1 and Hold:0, so every reply is a new safety state."""
+    sent_at = []
+
+    def handle(self):
+        seq = 0
+        while True:
+            try:
+                data = self.request.recv(64)
+            except ConnectionError:
+                return
+            if not data:
+                return
+            for _ in range(data.count(b"?")):
+                seq += 1
+                line = f"<Hold:{seq % 2}|MPos:10.000,0.000,0.000|Bf:15,128|FS:0,0>\r\n"
+                HoldingLaser.sent_at.append(time.perf_counter())
+                self.request.sendall(line.encode())
+
+
+def run_session(laser_handler, on_publish, duration, interval):
+    """Polls a laser stand-in through the asyncio run mode, publishing to a broker stand-in."""
+    broker = StubBroker(on_publish).start()
+    laser = socketserver.ThreadingTCPServer(("127.0.0.1", 0), laser_handler)
+    laser.daemon_threads = True
+    threading.Thread(target=laser.serve_forever, name="laser-stand-in", daemon=True).start()
+
+    client = mqtt.Client()
+    client.connect("127.0.0.1", broker.port, 60)
+    client.loop_start()
+    deadline = time.monotonic() + 5
+    while not client.is_connected() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    disable_nagle(client) # As on_connect does
+    monitor = make_monitor(client, publish_on_change=False, interval=interval, port=laser.server_address[1],
+                           queue_size=None)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        link = TcpTransport("127.0.0.1", laser.server_address[1])
+        await link.open_async(loop)
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            await asyncio.wait_for(monitor._poll_session(loop, link, executor), duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            executor.shutdown(wait=True)
+            link.close()
+
+    try:
+        asyncio.run(run())
+        time.sleep(0.2) # Let the last publishes reach the broker
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        laser.shutdown()
+        laser.server_close()
+        broker.stop()
+    return monitor
+
+
+def bench_e2e(duration, interval):
+    latencies = []
+    StampedLaser.sent_at.clear()
+
+    def on_publish(topic, payload, received_at):
+        if topic != "laser/status/bench":
+            return
+        seq = json.loads(payload).get("line_number")
+        sent = StampedLaser.sent_at.pop(seq, None)
+        if sent is not None:
+            latencies.append(received_at - sent)
+
+    monitor = run_session(StampedLaser, on_publish, duration, interval)
+    if not latencies:
+        raise SystemExit("e2e: no publishes reached the broker stand-in")
+    ordered = sorted(latencies)
+    jitter = monitor.poll_stats.summary()
+    return {
+        "polls_per_s": round(jitter["samples"] / duration, 1),
+        "publishes": len(ordered),
+        "latency_p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "latency_p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "latency_max_ms": round(ordered[-1] * 1000, 3),
+        "poll_lateness_p99_ms": jitter.get("lateness_p99_ms", 0.0),
+        "lines_dropped": monitor.lines_dropped,
+    }
+
+
+def bench_safety(duration, interval):
+    """Socket-to-broker latency of safety states, which skip the line queue, the policy and the sinks."""
+    latencies = []
+    HoldingLaser.sent_at.clear()
+
+    def on_publish(topic, payload, received_at):
+        # QoS 1 keeps the order, so publishes match replies one to one
+        if topic == "laser/status/bench/safety" and len(latencies) < len(HoldingLaser.sent_at):
+            latencies.append(received_at - HoldingLaser.sent_at[len(latencies)])
+
+    monitor = run_session(HoldingLaser, on_publish, duration, interval)
+    if not latencies:
+        raise SystemExit("safety: no publishes reached the broker stand-in")
+    ordered = sorted(latencies)
+    return {
+        "publishes": len(ordered),
+        "latency_p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "latency_p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "latency_max_ms": round(ordered[-1] * 1000, 3),
+        "lines_dropped": monitor.lines_dropped,
+    }
+
+
+def bench_payload(count):
+    results = {}
+    for payload_format in FORMATS:
+        if missing_dependency(payload_format):
+            continue
+        stub = CountingMqtt()
+        monitor = make_monitor(stub, publish_on_change=False, payload_format=payload_format)
+        parsed = [monitor.parse_response(line) for line in job_lines(count)]
+        start = time.perf_counter()
+        for data in parsed:
+            monitor.handle_state_change(data)
+        elapsed = time.perf_counter() - start
+        results[f"{payload_format}_bytes_per_poll"] = round(stub.bytes / count, 1)
+        results[f"{payload_format}_publishes_per_poll"] = round(stub.published / count, 2)
+        results[f"{payload_format}_us"] = round(elapsed / count * 1e6, 3)
+    return results
+
+
+def bench_memory(polls, warmup=2000):
+    stub = CountingMqtt()
+    monitor = make_monitor(stub)
+    lines = job_lines(polls + warmup)
+    for line in lines[:warmup]:
+        monitor.handle_line(line)
+
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for line in lines[warmup:]:
+            monitor.handle_line(line)
+        end, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "polls": polls,
+        "retained_bytes_per_poll": round((end - start) / polls, 3),
+        "peak_kib": round((peak - start) / 1024, 1),
+    }
+
+
+def bench_alloc(polls, repeat=5):
+    """
+    Keeps every poll's status and payload alive, as the sink queues do until
+    they are handled, so what a poll allocates shows up as traced memory.
+    Idle polls (most of a long-running monitor's life) and job polls are
+    measured separately.
+    """
+    lines = job_lines(polls * 10 // 8)
+    scenarios = {
+        "idle": [lines[0]] * polls,
+        "job": lines[len(lines) // 10:][:polls],
+    }
+
+    def poll(lines, cache, encode, kept):
+        for line in lines:
+            data = parse_status(line, cache=cache)
+            data["timestamp"] = time.time()
+            data["job_in_progress"] = True
+            kept.append((data, encode(data)))
+
+    results = {}
+    for scenario, lines in scenarios.items():
+        for name, make in (("fresh", lambda: (None, json.dumps)),
+                           ("cached", lambda: (FieldCache(), FragmentEncoder().encode))):
+            prefix = f"{scenario}_{name}"
+            cache, encode = make()
+            kept = []
+            tracemalloc.start()
+            try:
+                before = tracemalloc.take_snapshot()
+                poll(lines, cache, encode, kept)
+                after = tracemalloc.take_snapshot()
+            finally:
+                tracemalloc.stop()
+            growth = [stat for stat in after.compare_to(before, "filename")
+                      if stat.traceback[0].filename != tracemalloc.__file__]
+            results[f"{prefix}_blocks_per_poll"] = round(sum(stat.count_diff for stat in growth) / len(lines), 2)
+            results[f"{prefix}_bytes_per_poll"] = round(sum(stat.size_diff for stat in growth) / len(lines), 1)
+            del kept
+
+            best = float("inf")
+            for _ in range(repeat):
+                cache, encode = make()
+                start = time.perf_counter()
+                poll(lines, cache, encode, [])
+                best = min(best, time.perf_counter() - start)
+            results[f"{prefix}_us"] = round(best / len(lines) * 1e6, 3)
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def flatten(results):
+    return {f"{section}.{name}": value for section, values in results.items() for name, value in values.items()}
+
+
+def compare(current, baseline, threshold):
+    """Prints the change of every shared metric. Returns the names that regressed by more than threshold %."""
+    regressions = []
+    ours, theirs = flatten(current), flatten(baseline)
+    print(f"\n{'metric':<34} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(set(ours) & set(theirs)):
+        old, new = theirs[name], ours[name]
+        if not old or name.endswith(("_published", ".publishes", "_publishes_per_poll", ".polls", ".lines_dropped")):
+            continue
+        change = (new - old) / abs(old) * 100
+        worse = -change if name in HIGHER_IS_BETTER else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<34} {old:>12} {new:>12} {change:>+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LaserLink pipeline throughput, latency and memory")
+    parser.add_argument("--only", help="Comma separated sections to run (parse,handle,payload,e2e,safety,memory,alloc)")
+    parser.add_argument("--lines", type=int, default=100000, help="Status lines for the parse/handle sections")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to run the e2e and safety sections")
+    parser.add_argument("--interval", type=float, default=0.02, help="Polling interval for the e2e and safety sections")
+    parser.add_argument("--polls", type=int, default=50000, help="Polls for the memory and alloc sections")
+    parser.add_argument("--json", help="Write results to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="Compare against a previous --json result")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sections = {
+        "parse": lambda: bench_parse(args.lines),
+        "handle": lambda: bench_handle(args.lines),
+        "payload": lambda: bench_payload(args.lines),
+        "e2e": lambda: bench_e2e(args.duration, args.interval),
+        "safety": lambda: bench_safety(args.duration, args.interval),
+        "memory": lambda: bench_memory(args.polls),
+        "alloc": lambda: bench_alloc(args.polls),
+    }
+    selected = args.only.split(",") if args.only else list(sections)
+
+    results = {}
+    for name in selected:
+        results[name] = sections[name]()
+        for metric, value in results[name].items():
+            print(f"{name + '.' + metric:<34} {value}", file=sys.stderr)
+
+    report = {"meta": metadata(), "args": vars(args), "results": results}
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Link proxy benchmark.
+
+Runs a G-code sender against the GRBL simulator twice: connected directly,
+and through a LinkProxy while a monitor polls '?' on the same link. Reports
+the round trip of single lines (send, wait for ok) and the throughput of a
+character-counting stream (as LightBurn sends jobs) for both, so the
+difference is what the proxy adds.
+
+Usage:
+    python3 benchmarks/bench_proxy.py [--lines 2000] [--poll 0.05]
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from grbl_sim import SimulatorServer
+from linkproxy import LinkProxy, ProxyTransport, RX_BUFFER
+from transport import TcpTransport
+
+
+def gcode(count):
+    return [f"G1 X{i % 300}.{i % 7} Y{(i * 3) % 200}.5 S{600 + i % 400}\n".encode() for i in range(count)]
+
+
+def ping_pong(sock, lines):
+    """Per-line round trip in seconds: send one line, wait for its ok."""
+    times = []
+    buffer = b""
+    for line in lines:
+        start = time.perf_counter()
+        sock.sendall(line)
+        while b"ok\r\n" not in buffer:
+            buffer += sock.recv(4096)
+        buffer = buffer.split(b"ok\r\n", 1)[1]
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+
+def stream(sock, lines, rx_buffer=RX_BUFFER):
+    """Character-counting streaming. Returns lines per second."""
+    sizes = []
+    in_flight = 0
+    buffer = b""
+    sent = acked = 0
+    start = time.perf_counter()
+    while acked < len(lines):
+        while sent < len(lines) and in_flight + len(lines[sent]) <= rx_buffer:
+            sock.sendall(lines[sent])
+            sizes.append(len(lines[sent]))
+            in_flight += len(lines[sent])
+            sent += 1
+        buffer += sock.recv(4096)
+        while b"ok\r\n" in buffer:
+            buffer = buffer.split(b"ok\r\n", 1)[1]
+            in_flight -= sizes[acked]
+            acked += 1
+    return len(lines) / (time.perf_counter() - start)
+
+
+def poller(sock, interval, done):
+    """The monitor's side: '?' on a clock, replies drained."""
+    sock.settimeout(interval)
+    while not done.is_set():
+        sock.sendall(b"?\n")
+        deadline = time.monotonic() + interval
+        while time.monotonic() < deadline:
+            try:
+                sock.recv(4096)
+            except socket.timeout:
+                break
+
+
+def run(sock, lines):
+    round_trips = ping_pong(sock, lines)
+    return {
+        "rtt_p50_us": round(round_trips[len(round_trips) // 2] * 1e6, 1),
+        "rtt_p99_us": round(round_trips[int(len(round_trips) * 0.99)] * 1e6, 1),
+        "lines_per_s": round(stream(sock, lines)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and throughput added by the link proxy")
+    parser.add_argument("--lines", type=int, default=2000, help="G-code lines per measurement")
+    parser.add_argument("--poll", type=float, default=0.05, help="Monitor polling interval through the proxy")
+    args = parser.parse_args()
+    lines = gcode(args.lines)
+
+    sim = SimulatorServer().start()
+    direct = socket.create_connection(("127.0.0.1", sim.port))
+    direct.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    results = {"direct": run(direct, lines)}
+    direct.close()
+
+    proxy = LinkProxy("127.0.0.1", 0, device="bench").start()
+    link = ProxyTransport(TcpTransport("127.0.0.1", sim.port), proxy)
+    link.open()
+    done = threading.Event()
+    polling = threading.Thread(target=poller, args=(link.sock, args.poll, done), daemon=True)
+    polling.start()
+    client = socket.create_connection(("127.0.0.1", proxy.port))
+    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    results["proxied"] = run(client, lines)
+    done.set()
+    polling.join()
+    stats = proxy.stats()
+    client.close()
+    link.close()
+    proxy.stop()
+    sim.stop()
+
+    print(f"{'':>10} {'rtt p50 µs':>11} {'rtt p99 µs':>11} {'lines/s':>9}")
+    for name, result in results.items():
+        print(f"{name:>10} {result['rtt_p50_us']:>11} {result['rtt_p99_us']:>11} {result['lines_per_s']:>9}")
+    added = results["proxied"]["rtt_p50_us"] - results["direct"]["rtt_p50_us"]
+    print(f"\nAdded round trip (p50): {added:.1f} µs; proxy forwarding delay p50 {stats.get('delay_p50_us')} µs, "
+          f"max {stats.get('delay_max_us')} µs; {stats['bytes_to_laser'] / 1024:.1f} KiB to the laser, "
+          f"{stats['bytes_from_laser'] / 1024:.1f} KiB back, {stats['held']} lines held for buffer room")
+
+
+if __name__ == "__main__":
+    main()
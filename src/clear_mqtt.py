@@ -1,6 +1,11 @@
-import time
+import threading
 import paho.mqtt.client as mqtt
 from config import Config
+from discovery import DiscoveryRegistry, wait_for_publish
+
+CONNECT_TIMEOUT = 10
+SYNC_TIMEOUT = 5 # Seconds to wait for the broker's retained configs
+ACK_TIMEOUT = 10
 
 def clear_mqtt():
     cfg = Config("config.yaml")
@@ -13,49 +18,41 @@ def clear_mqtt():
     if cfg.mqtt_username and cfg.mqtt_password:
         client.username_pw_set(cfg.mqtt_username, cfg.mqtt_password)
 
+    connected = threading.Event()
+    client.on_connect = lambda client, userdata, flags, rc: rc == 0 and connected.set()
     try:
         client.connect(cfg.mqtt_broker, cfg.mqtt_port, 60)
         client.loop_start()
-        print("Connected to MQTT Broker.")
-        time.sleep(1) # Wait for connection
     except Exception as e:
         print(f"Failed to connect: {e}")
         return
+    if not connected.wait(CONNECT_TIMEOUT):
+        print("Failed to connect: no answer from the broker.")
+        client.loop_stop()
+        return
+    print("Connected to MQTT Broker.")
 
-    # List of all possible sensors (old and new) to clear
-    # We use the configured prefix and node_id
-    prefix = cfg.ha_discovery_prefix
-    node_id = cfg.ha_node_id
-    
-    sensors = [
-        "status",
-        "spindle_speed", # Old
-        "feed_rate",     # Old
-        "pos_x",
-        "pos_y",
-        "pos_z",         # Old
-        "laser_power",   # New
-        "speed"          # New
-    ]
-    
-    binary_sensors = [
-        "job_active"
-    ]
+    # Every node id this config has used: the single laser's, and one per device
+    node_ids = [cfg.ha_node_id] + [device.ha_node_id for device in cfg.devices]
+    registries = [DiscoveryRegistry(cfg.ha_discovery_prefix, node_id, f"{cfg.mqtt_topic}/discovery/sync/{node_id}")
+                  for node_id in node_ids]
+    for registry in registries:
+        registry.sync(client, repair=False)
 
     print("Clearing topics...")
-
-    for s in sensors:
-        topic = f"{prefix}/sensor/{node_id}/{s}/config"
-        print(f"Clearing {topic}")
-        client.publish(topic, "", retain=True)
-        
-    for s in binary_sensors:
-        topic = f"{prefix}/binary_sensor/{node_id}/{s}/config"
-        print(f"Clearing {topic}")
-        client.publish(topic, "", retain=True)
-
-    print("Done. Waiting for messages to send...")
-    time.sleep(2)
+    infos = []
+    for registry in registries:
+        if registry.synced.wait(SYNC_TIMEOUT):
+            topics = list(registry.known)
+        else:
+            print(f"The broker did not finish sending retained configs for {registry.node_id}, clearing those received.")
+            topics = list(registry.seen)
+        for topic in topics:
+            print(f"Clearing {topic}")
+        infos.extend(registry.clear(client, topics))
+
+    acked = wait_for_publish(infos, ACK_TIMEOUT)
+    print(f"Done. {acked} of {len(infos)} configs cleared.")
     client.loop_stop()
     client.disconnect()
 
@@ -1,5 +1,8 @@
 import os
 import yaml
+from payloads import FORMATS, BINARY_FORMATS, missing_dependency
+from pipeline import SINK_TYPES
+from safety import SAFETY_STATES
 
 class Config:
     def __init__(self, config_path="config.yaml"):
@@ -10,13 +13,28 @@ class Config:
 
         # Laser
         laser_cfg = self.config.get('laser', {})
+        self.transport = os.getenv("TRANSPORT", laser_cfg.get('transport', 'rfcomm')).lower()
         self.bluetooth_mac = os.getenv("BLUETOOTH_MAC", laser_cfg.get('bluetooth_mac'))
         self.rfcomm_port = int(os.getenv("RFCOMM_PORT", laser_cfg.get('rfcomm_port', 1)))
+        self.tcp_host = os.getenv("TCP_HOST", laser_cfg.get('tcp_host'))
+        self.tcp_port = int(os.getenv("TCP_PORT", laser_cfg.get('tcp_port', 23)))
+        self.serial_port = os.getenv("SERIAL_PORT", laser_cfg.get('serial_port'))
+        self.serial_baudrate = int(os.getenv("SERIAL_BAUDRATE", laser_cfg.get('serial_baudrate', 115200)))
         self.polling_interval = float(os.getenv("POLLING_INTERVAL", laser_cfg.get('polling_interval', 0.5)))
         self.framing_threshold = int(os.getenv("FRAMING_THRESHOLD", laser_cfg.get('framing_threshold', 20)))
         self.max_spindle_speed = int(os.getenv("MAX_SPINDLE_SPEED", laser_cfg.get('max_spindle_speed', 1000)))
         self.show_raw = os.getenv("SHOW_RAW", str(laser_cfg.get('show_raw', False))).lower() in ('true', '1', 'yes')
         self.log_level = os.getenv("LOG_LEVEL", laser_cfg.get('log_level', 'INFO')).upper()
+        self.run_mode = os.getenv("RUN_MODE", laser_cfg.get('run_mode', 'sync')).lower()
+        self.record_path = os.getenv("RECORD_PATH", laser_cfg.get('record_path'))
+        self.adaptive_polling = os.getenv("ADAPTIVE_POLLING", str(laser_cfg.get('adaptive_polling', False))).lower() in ('true', '1', 'yes')
+        # State -> [min, max] seconds, merged over the built-in defaults
+        self.poll_intervals = {state: tuple(float(v) for v in bounds)
+                               for state, bounds in (laser_cfg.get('poll_intervals') or {}).items()}
+        self.link_timeout = float(os.getenv("LINK_TIMEOUT", laser_cfg.get('link_timeout', 3.0)))
+        self.reconnect_max_delay = float(os.getenv("RECONNECT_MAX_DELAY", laser_cfg.get('reconnect_max_delay', 30)))
+        self.telemetry_capacity = int(os.getenv("TELEMETRY_CAPACITY", laser_cfg.get('telemetry_capacity', 2048)))
+        self.query_interval = float(os.getenv("QUERY_INTERVAL", laser_cfg.get('query_interval', 0)))
 
         # MQTT
         mqtt_cfg = self.config.get('mqtt', {})
@@ -26,6 +44,69 @@ class Config:
         self.mqtt_topic = os.getenv("MQTT_TOPIC", mqtt_cfg.get('topic', 'laser/status'))
         self.mqtt_username = os.getenv("MQTT_USERNAME", mqtt_cfg.get('username'))
         self.mqtt_password = os.getenv("MQTT_PASSWORD", mqtt_cfg.get('password'))
+        self.payload_format = os.getenv("MQTT_PAYLOAD_FORMAT", mqtt_cfg.get('payload_format', 'json'))
+
+        # Publish Policy
+        publish_cfg = self.config.get('publish', {})
+        self.publish_on_change = os.getenv("PUBLISH_ON_CHANGE", str(publish_cfg.get('on_change', False))).lower() in ('true', '1', 'yes')
+        self.publish_deadband_mpos = float(os.getenv("PUBLISH_DEADBAND_MPOS", publish_cfg.get('deadband_mpos', 0.5)))
+        self.publish_deadband_power = float(os.getenv("PUBLISH_DEADBAND_POWER", publish_cfg.get('deadband_power', 1.0)))
+        self.publish_deadband_feed = float(os.getenv("PUBLISH_DEADBAND_FEED", publish_cfg.get('deadband_feed', 10)))
+        self.publish_heartbeat = float(os.getenv("PUBLISH_HEARTBEAT", publish_cfg.get('heartbeat_interval', 60)))
+
+        # Job History
+        history_cfg = self.config.get('history', {})
+        self.history_path = os.getenv("HISTORY_PATH", history_cfg.get('path'))
+        self.history_flush_interval = float(os.getenv("HISTORY_FLUSH_INTERVAL", history_cfg.get('flush_interval', 30)))
+        self.history_sample_interval = float(os.getenv("HISTORY_SAMPLE_INTERVAL", history_cfg.get('sample_interval', 5)))
+        self.history_retention_days = float(os.getenv("HISTORY_RETENTION_DAYS", history_cfg.get('retention_days', 90)))
+
+        # MQTT Outbox
+        outbox_cfg = self.config.get('outbox', {})
+        self.outbox_path = os.getenv("OUTBOX_PATH", outbox_cfg.get('path'))
+        self.outbox_max_size_mb = float(os.getenv("OUTBOX_MAX_SIZE_MB", outbox_cfg.get('max_size_mb', 16)))
+        self.outbox_drop_policy = os.getenv("OUTBOX_DROP_POLICY", outbox_cfg.get('drop_policy', 'oldest'))
+        self.outbox_telemetry_interval = float(os.getenv("OUTBOX_TELEMETRY_INTERVAL", outbox_cfg.get('telemetry_interval', 5)))
+        self.outbox_batch_size = int(os.getenv("OUTBOX_BATCH_SIZE", outbox_cfg.get('batch_size', 100)))
+
+        # Event Pipeline
+        pipeline_cfg = self.config.get('pipeline', {})
+        self.pipeline_queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", pipeline_cfg.get('queue_size', 256)))
+        self.pipeline_block_timeout = float(os.getenv("PIPELINE_BLOCK_TIMEOUT", pipeline_cfg.get('block_timeout', 5)))
+        sinks = os.getenv("PIPELINE_SINKS")
+        self.pipeline_sinks = [name.strip() for name in sinks.split(",") if name.strip()] if sinks is not None \
+            else list(pipeline_cfg.get('sinks', ['mqtt', 'history', 'telegram', 'live']))
+
+        # Metrics
+        metrics_cfg = self.config.get('metrics', {})
+        self.metrics_port = int(os.getenv("METRICS_PORT", metrics_cfg.get('port', 0)))
+        self.metrics_host = os.getenv("METRICS_HOST", metrics_cfg.get('host', '0.0.0.0'))
+
+        # Job toolpath
+        toolpath_cfg = self.config.get('toolpath', {})
+        self.toolpath_max_points = int(os.getenv("TOOLPATH_MAX_POINTS", toolpath_cfg.get('max_points', 2000)))
+        self.toolpath_resolution = float(os.getenv("TOOLPATH_RESOLUTION", toolpath_cfg.get('resolution', 0.01)))
+        self.toolpath_telegram = os.getenv("TOOLPATH_TELEGRAM", str(toolpath_cfg.get('telegram', True))).lower() in ('true', '1', 'yes')
+
+        # Live status server
+        live_cfg = self.config.get('live', {})
+        self.live_port = int(os.getenv("LIVE_PORT", live_cfg.get('port', 0)))
+        self.live_host = os.getenv("LIVE_HOST", live_cfg.get('host', '0.0.0.0'))
+        self.live_client_buffer_kb = float(os.getenv("LIVE_CLIENT_BUFFER_KB", live_cfg.get('client_buffer_kb', 256)))
+
+        # Link proxy
+        proxy_cfg = self.config.get('proxy', {})
+        self.proxy_port = int(os.getenv("PROXY_PORT", proxy_cfg.get('port', 0)))
+        self.proxy_host = os.getenv("PROXY_HOST", proxy_cfg.get('host', '127.0.0.1'))
+        self.proxy_pty = os.getenv("PROXY_PTY", proxy_cfg.get('pty'))
+        self.proxy_rx_buffer = int(os.getenv("PROXY_RX_BUFFER", proxy_cfg.get('rx_buffer', 128)))
+
+        # Safety fast lane
+        safety_cfg = self.config.get('safety', {})
+        self.safety_enabled = os.getenv("SAFETY_ENABLED", str(safety_cfg.get('enabled', True))).lower() in ('true', '1', 'yes')
+        notify = os.getenv("SAFETY_NOTIFY")
+        self.safety_notify = [state.strip() for state in notify.split(",") if state.strip()] if notify is not None \
+            else list(safety_cfg.get('notify', ['Alarm', 'Door']))
 
         # Home Assistant
         ha_cfg = self.config.get('homeassistant', {})
@@ -41,12 +122,120 @@ class Config:
         self.telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID", tele_cfg.get('chat_id'))
         self.telegram_message_started = os.getenv("TELEGRAM_MESSAGE_STARTED", tele_cfg.get('message_started', "Laser Job Started!"))
         self.telegram_message_completed = os.getenv("TELEGRAM_MESSAGE_COMPLETED", tele_cfg.get('message_completed', "Laser Job Completed!"))
+        self.telegram_api_url = os.getenv("TELEGRAM_API_URL", tele_cfg.get('api_url', "https://api.telegram.org"))
+        self.telegram_max_retries = int(os.getenv("TELEGRAM_MAX_RETRIES", tele_cfg.get('max_retries', 5)))
+        self.telegram_coalesce_window = float(os.getenv("TELEGRAM_COALESCE_WINDOW", tele_cfg.get('coalesce_window', 1.0)))
+
+        # Devices (optional): several lasers served by one process and one MQTT connection
+        self.devices = [DeviceConfig(self, entry) for entry in self.config.get('devices') or []]
 
     def validate(self):
-        if not self.bluetooth_mac or self.bluetooth_mac == "XX:XX:XX:XX:XX:XX":
-            return False, "BLUETOOTH_MAC is missing or default in config.yaml."
+        if self.devices:
+            names = [device.name for device in self.devices]
+            if len(set(names)) != len(names):
+                return False, "Device names in config.yaml must be unique."
+            for device in self.devices:
+                if not device.name:
+                    return False, "Every entry in devices needs a name."
+                valid, msg = validate_transport(device)
+                if not valid:
+                    return False, f"{msg} (device '{device.name}')"
+        else:
+            valid, msg = validate_transport(self)
+            if not valid:
+                return False, msg
+        if self.run_mode not in ('sync', 'async'):
+            return False, f"Unknown run_mode '{self.run_mode}'. Use 'sync' or 'async'."
+        for state, bounds in self.poll_intervals.items():
+            if len(bounds) != 2 or not 0 < bounds[0] <= bounds[1]:
+                return False, f"poll_intervals for '{state}' must be [min, max] with 0 < min <= max."
+        if self.link_timeout <= 0:
+            return False, "link_timeout must be greater than 0."
+        if self.telemetry_capacity < 2:
+            return False, "telemetry_capacity must be at least 2."
+        if self.history_retention_days < 0:
+            return False, "history retention_days must be 0 (keep everything) or more."
+        if self.query_interval < 0:
+            return False, "query_interval must be 0 (off) or more."
+        if self.outbox_drop_policy not in ("oldest", "newest"):
+            return False, f"Unknown outbox drop_policy '{self.outbox_drop_policy}'. Use 'oldest' or 'newest'."
+        if self.pipeline_queue_size < 0:
+            return False, "pipeline queue_size must be 0 (inline) or more."
+        for name in self.pipeline_sinks:
+            if name not in SINK_TYPES and ":" not in name:
+                return False, f"Unknown sink '{name}'. Use one of {', '.join(sorted(SINK_TYPES))} or 'package.module:factory'."
+        if self.toolpath_max_points != 0 and self.toolpath_max_points < 16:
+            return False, "toolpath max_points must be 0 (off) or at least 16."
+        if self.toolpath_resolution <= 0:
+            return False, "toolpath resolution must be greater than 0."
+        if self.live_client_buffer_kb <= 0:
+            return False, "live client_buffer_kb must be greater than 0."
+        if self.proxy_rx_buffer < 16:
+            return False, "proxy rx_buffer must be at least 16 bytes."
+        for state in self.safety_notify:
+            if state not in SAFETY_STATES:
+                return False, f"Unknown safety notify state '{state}'. Use any of {', '.join(SAFETY_STATES)}."
         if self.mqtt_enabled and not self.mqtt_broker:
             return False, "MQTT enabled but broker address missing."
+        if self.payload_format not in FORMATS:
+            return False, f"Unknown payload_format '{self.payload_format}'. Use one of: {', '.join(FORMATS)}."
+        if missing_dependency(self.payload_format):
+            return False, f"payload_format '{self.payload_format}' needs the {missing_dependency(self.payload_format)} package (pip install {missing_dependency(self.payload_format)})."
+        if self.ha_enabled and self.payload_format in BINARY_FORMATS:
+            return False, f"Home Assistant can't read {self.payload_format} payloads. Use payload_format 'fields' or 'compact' with homeassistant enabled."
         if self.telegram_enabled and (not self.telegram_token or not self.telegram_chat_id):
             return False, f"Telegram enabled but token or chat_id missing. (Token: {self.telegram_token}, ChatID: {self.telegram_chat_id})"
         return True, ""
+
+
+def validate_transport(cfg):
+    if cfg.transport == "rfcomm":
+        if not cfg.bluetooth_mac or cfg.bluetooth_mac == "XX:XX:XX:XX:XX:XX":
+            return False, "BLUETOOTH_MAC is missing or default in config.yaml."
+    elif cfg.transport == "tcp":
+        if not cfg.tcp_host:
+            return False, "TCP transport selected but TCP_HOST is missing."
+    elif cfg.transport == "serial":
+        if not cfg.serial_port:
+            return False, "Serial transport selected but SERIAL_PORT is missing."
+    else:
+        return False, f"Unknown transport '{cfg.transport}'. Use 'rfcomm', 'tcp' or 'serial'."
+    return True, ""
+
+
+class DeviceConfig:
+    """
+    Settings for one laser in the devices list.
+    Laser, topic and Home Assistant settings can be set per device;
+    everything else falls through to the global Config.
+    """
+    def __init__(self, base, entry):
+        self._base = base
+        self.name = str(entry.get('name', ''))
+
+        # Laser
+        self.transport = str(entry.get('transport', base.transport)).lower()
+        self.bluetooth_mac = entry.get('bluetooth_mac')
+        self.rfcomm_port = int(entry.get('rfcomm_port', base.rfcomm_port))
+        self.tcp_host = entry.get('tcp_host')
+        self.tcp_port = int(entry.get('tcp_port', base.tcp_port))
+        self.serial_port = entry.get('serial_port')
+        self.serial_baudrate = int(entry.get('serial_baudrate', base.serial_baudrate))
+        self.polling_interval = float(entry.get('polling_interval', base.polling_interval))
+        self.framing_threshold = int(entry.get('framing_threshold', base.framing_threshold))
+        self.max_spindle_speed = int(entry.get('max_spindle_speed', base.max_spindle_speed))
+        self.record_path = entry.get('record_path') # One file per device, never inherited
+        self.proxy_port = int(entry.get('proxy_port', 0)) # Ports and terminals are per device too
+        self.proxy_pty = entry.get('proxy_pty')
+
+        # MQTT / Home Assistant
+        self.mqtt_topic = entry.get('topic', f"{base.mqtt_topic}/{self.name}")
+        self.ha_node_id = entry.get('node_id', f"{base.ha_node_id}_{self.name}")
+        self.ha_device_name = entry.get('device_name', self.name)
+
+        # Telegram
+        self.telegram_message_started = entry.get('message_started', f"{self.ha_device_name}: {base.telegram_message_started}")
+        self.telegram_message_completed = entry.get('message_completed', f"{self.ha_device_name}: {base.telegram_message_completed}")
+
+    def __getattr__(self, name):
+        return getattr(self._base, name)
@@ -0,0 +1,166 @@
+"""
+Cached controller settings and parser state, refreshed by low-frequency queries.
+
+Between status polls, at most one '$' query goes out per poll cycle: '$I'
+(build info) once per connection, and '$$' (settings), '$G' (parser state)
+and '$#' (work offsets) every `query_interval` seconds. They are only sent
+while the laser is Idle or in Alarm, where GRBL answers them; during a job
+nothing is added to the link. The '?' schedule is untouched: a query is sent
+right after a '?', never instead of one.
+
+Replies are recognised by their shape ('$30=1000', '[GC:...]', '[G54:...]',
+'[VER:...]') and end with the next 'ok' (or 'error:'). The parsed results are
+published retained to `<topic>/controller` once a query completes with
+something new:
+
+    {"settings": {"30": 1000, ...}, "modal": {"motion": "G0", "wcs": "G54", ...},
+     "offsets": {"G54": {"x": 0.0, ...}, "TLO": 0.0, ...},
+     "build": {"version": "1.1h.20190825", "options": "V", "rx_buffer": 128, ...},
+     "updated": 1700000000.0}
+
+Reconnecting clears the cache; an alarm (after which GRBL resets its parser
+state and G92 offsets) queries everything again. '$30' replaces the
+configured max_spindle_speed for the power percentage.
+"""
+import logging
+import math
+import threading
+import time
+
+from grbl import parse_setting, parse_modal, parse_offset, parse_build_info
+
+QUERIES = ("$I", "$$", "$G", "$#") # In the order they are sent when several are due
+PERIODIC = ("$$", "$G", "$#")
+QUERY_STATES = ("Idle", "Alarm") # GRBL rejects $$, $# and $I with error:8 while running
+QUERY_TIMEOUT = 10.0 # Seconds before an unanswered query is given up on
+ERROR_RETRY = 30.0 # Seconds before a rejected query is sent again
+
+
+class ControllerCache:
+    def __init__(self, monitor, interval):
+        self.monitor = monitor
+        self.interval = float(interval)
+        self.lock = threading.Lock()
+        self.pending = None # Query awaiting its 'ok'
+        self.pending_since = None
+        self.replied = False # The pending query's reply has started
+        self.changed = False
+        self.due = {}
+        self.queries_sent = 0
+        self.reset()
+
+    def reset(self):
+        """After (re)connecting: forgets everything and queries it all again."""
+        with self.lock:
+            self.settings = {}
+            self.modal = {}
+            self.offsets = {}
+            self.build = {}
+            self.updated = None
+            self.pending = None
+            self.replied = False
+            self.due = dict.fromkeys(QUERIES, 0.0)
+
+    def invalidate(self):
+        """After an alarm: parser state and offsets may have been reset, so everything is due again."""
+        with self.lock:
+            self.modal = {}
+            self.offsets = {}
+            for query in PERIODIC:
+                self.due[query] = 0.0
+
+    def next_query(self, now, state):
+        """The query to send after this poll as bytes, or None. `now` is monotonic."""
+        with self.lock:
+            if self.pending is not None:
+                if now - self.pending_since < QUERY_TIMEOUT:
+                    return None
+                logging.debug(f"{self.monitor.log_prefix}No reply to {self.pending}, giving up.")
+                self.pending = None
+            if state not in QUERY_STATES:
+                return None
+            for query in QUERIES:
+                if self.due[query] <= now:
+                    self.due[query] = now + self.interval if query in PERIODIC else math.inf
+                    self.pending, self.pending_since, self.replied = query, now, False
+                    self.queries_sent += 1
+                    return f"{query}\n".encode()
+            return None
+
+    def handle(self, line):
+        """
+        Takes the lines of a query reply. Returns True when the line was one,
+        so the caller can skip it; status reports are never passed here.
+        """
+        if self.pending is None:
+            return False
+        with self.lock:
+            if line == "ok" or line.startswith("error:"):
+                if not self.replied:
+                    if line == "ok":
+                        # The 'ok' of something sent before the query
+                        return False
+                    logging.debug(f"{self.monitor.log_prefix}{self.pending} rejected with {line}, retrying later.")
+                    self.due[self.pending] = time.monotonic() + ERROR_RETRY
+                self.pending = None
+                snapshot = self.snapshot() if self.changed else None
+                self.changed = False
+            else:
+                if not self._store(line):
+                    return False
+                self.replied = True
+                return True
+        if snapshot:
+            self.monitor.pipeline.emit("controller", snapshot)
+        return True
+
+    def _store(self, line):
+        setting = parse_setting(line)
+        if setting:
+            number, value = setting
+            if self.settings.get(number) != value:
+                self.settings[number] = value
+                self.changed = True
+                if number == 30 and isinstance(value, (int, float)) and value > 0:
+                    if value != self.monitor.max_spindle_speed:
+                        logging.info(f"{self.monitor.log_prefix}Max spindle speed is {value} ($30), was {self.monitor.max_spindle_speed}.")
+                    self.monitor.max_spindle_speed = value
+            return True
+        modal = parse_modal(line)
+        if modal is not None:
+            if self.modal != modal:
+                self.modal = modal
+                self.changed = True
+            return True
+        offset = parse_offset(line)
+        if offset:
+            tag, value = offset
+            if self.offsets.get(tag) != value:
+                self.offsets[tag] = value
+                self.changed = True
+            return True
+        info = parse_build_info(line)
+        if info:
+            for key, value in info.items():
+                if self.build.get(key) != value:
+                    self.build[key] = value
+                    self.changed = True
+            return True
+        return False
+
+    def snapshot(self):
+        """The cache as published to <topic>/controller. Called with the lock held."""
+        self.updated = time.time()
+        return {
+            "settings": {str(number): value for number, value in sorted(self.settings.items())},
+            "modal": dict(self.modal),
+            "offsets": dict(self.offsets),
+            "build": dict(self.build),
+            "updated": self.updated,
+        }
+
+    def discovery(self):
+        """State topic and template for a Home Assistant firmware sensor, with the cache as attributes."""
+        topic = f"{self.monitor.cfg.mqtt_topic}/controller"
+        return {"state_topic": topic, "value_template": "{{ value_json.build.version }}",
+                "json_attributes_topic": topic}
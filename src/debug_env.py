@@ -1,3 +1,5 @@
+import argparse
+import json
 import os
 import sys
 from config import Config
@@ -9,7 +11,41 @@ def mask_secret(secret):
         return "***"
     return secret[:3] + "***" + secret[-3:]
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Checks the environment and configuration, and optionally the laser link")
+    parser.add_argument("--link", action="store_true",
+                        help="Connect to the laser and measure round trips, loss, reconnect time and the highest poll rate")
+    parser.add_argument("--device", help="Laser to test when config.yaml has a devices list (Default: the first)")
+    parser.add_argument("--samples", type=int, default=100, help="'?' queries for the round trip measurement")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per poll rate tried")
+    parser.add_argument("--no-mqtt", action="store_true", help="Skip the MQTT publish round trip")
+    parser.add_argument("--json", action="store_true", help="Print the link report as JSON")
+    return parser.parse_args(argv)
+
+def run_link_diagnostics(cfg, args):
+    # Imported here: the plain check must work even when the monitor's dependencies are broken
+    import diagnostics
+
+    target = cfg
+    if cfg.devices:
+        target = next((device for device in cfg.devices if device.name == args.device), None) if args.device else cfg.devices[0]
+        if target is None:
+            print(f"Unknown device '{args.device}'. Devices: {', '.join(device.name for device in cfg.devices)}")
+            return False
+    try:
+        report = diagnostics.run(target, samples=args.samples, duration=args.duration, mqtt=not args.no_mqtt)
+    except (OSError, TimeoutError, ConnectionError) as e:
+        print(f"Link test failed: {e}")
+        print("If the monitor is running, stop it first: the laser link only takes one client.")
+        return False
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(diagnostics.format_report(report, target.polling_interval))
+    return True
+
+def main(argv=None):
+    args = parse_args(argv)
     print("--- Environment Variable Check ---")
     print(f"BLUETOOTH_MAC: {os.getenv('BLUETOOTH_MAC', 'Not Set')}")
     print(f"TELEGRAM_BOT_TOKEN: {mask_secret(os.getenv('TELEGRAM_BOT_TOKEN'))}")
@@ -31,6 +67,14 @@ def main():
             
     except Exception as e:
         print(f"Error loading config: {e}")
+        return
+
+    if args.link:
+        if not valid:
+            print("Fix the configuration before testing the link.")
+            sys.exit(1)
+        if not run_link_diagnostics(cfg, args):
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
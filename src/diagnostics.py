@@ -0,0 +1,292 @@
+"""
+Link diagnostics, run by `debug_env.py --link`.
+
+Connects over the configured transport, the way the monitor does, and
+measures what decides how fast the laser can be polled:
+
+*   Round trip of '?' (one at a time), as percentiles, and how many went unanswered.
+*   Reconnect time: closing the link and reopening it until the first status.
+*   Highest sustainable poll rate: '?' on a fixed clock at shorter and shorter
+    intervals, each for a few seconds, until replies are lost or fall behind.
+*   MQTT publish round trip: QoS 1 messages to the configured broker on a
+    topic we are subscribed to, timed until they come back.
+
+From these it recommends a polling_interval with headroom for a slow moment
+of the link. The laser link can only have one client: stop the monitor first
+(or point the diagnostics at its link proxy).
+"""
+import collections
+import math
+import threading
+import time
+import uuid
+
+import paho.mqtt.client as mqtt
+from framing import LineFramer
+from monitor import disable_nagle
+from scheduler import PollClock
+from transport import create_transport
+
+PROBE_INTERVALS = (1.0, 0.5, 0.25, 0.2, 0.1, 0.05, 0.025, 0.01) # Seconds, slowest first
+MAX_LOSS = 0.02 # Share of unanswered polls a sustainable rate may have
+INTERVAL_STEP = 0.05 # The recommendation is rounded up to this
+
+
+def percentiles(samples):
+    """Round trip percentiles in milliseconds."""
+    if not samples:
+        return {"samples": 0}
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return round(ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))] * 1000, 2)
+
+    return {"samples": len(ordered), "p50_ms": pick(50), "p90_ms": pick(90), "p99_ms": pick(99),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+def recommend_interval(rtt_p99, fastest=None):
+    """
+    Seconds between polls: twice the fastest sustainable interval, and at
+    least twice the p99 round trip, rounded up to 50 ms.
+    """
+    base = max(2 * rtt_p99, 2 * fastest if fastest else 0.0, INTERVAL_STEP)
+    return round(math.ceil(base / INTERVAL_STEP - 1e-9) * INTERVAL_STEP, 3)
+
+
+class LinkProbe:
+    def __init__(self, link, timeout=3.0):
+        self.link = link
+        self.timeout = timeout
+        self.framer = LineFramer()
+        self.lines = collections.deque()
+
+    def open(self):
+        """Opens the link and returns the seconds until the first status report."""
+        start = time.monotonic()
+        self.link.open()
+        self.framer.reset()
+        self.lines.clear()
+        self.link.send(b"?\n")
+        if self._next_status(start + self.timeout) is None:
+            raise TimeoutError(f"No status report within {self.timeout} s of connecting.")
+        return time.monotonic() - start
+
+    def close(self):
+        self.link.close()
+
+    def reconnect(self):
+        """Seconds from closing the link to the first status after reopening it."""
+        start = time.monotonic()
+        self.close()
+        self.open()
+        return time.monotonic() - start
+
+    def _next_status(self, deadline):
+        """Receive time (monotonic) of the next status report, or None at the deadline."""
+        while True:
+            while self.lines:
+                line, received_at = self.lines.popleft()
+                if line.startswith("<"):
+                    return received_at
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.link.settimeout(remaining)
+            try:
+                data = self.link.recv(1024)
+            except TimeoutError:
+                return None
+            if not data:
+                raise ConnectionError("The laser closed the link.")
+            now = time.monotonic()
+            self.lines.extend((line, now) for line in self.framer.feed(data))
+
+    def _drain(self):
+        """Drops late replies, so they aren't taken for the answer to the next query."""
+        self.link.recv_pending()
+        self.framer.reset()
+        self.lines.clear()
+
+    def round_trips(self, count, pause=0.02):
+        """Sends '?' `count` times, one at a time. Returns (round trips in seconds, unanswered)."""
+        rtts = []
+        lost = 0
+        for _ in range(count):
+            sent_at = time.monotonic()
+            self.link.send(b"?\n")
+            received_at = self._next_status(sent_at + self.timeout)
+            if received_at is None:
+                lost += 1
+                self._drain()
+            else:
+                rtts.append(received_at - sent_at)
+            time.sleep(pause)
+        return rtts, lost
+
+    def sustained(self, interval, duration):
+        """
+        Polls on a fixed clock for `duration` seconds. Replies are matched to
+        queries in order. Returns sent/answered counts, loss and round trips.
+        """
+        self._drain()
+        clock = PollClock(interval, time.monotonic())
+        end = clock.next_deadline + duration
+        sent = collections.deque()
+        count = answered = 0
+        rtts = []
+        while clock.next_deadline < end:
+            sent_at = time.monotonic()
+            self.link.send(b"?\n")
+            sent.append(sent_at)
+            count += 1
+            deadline = clock.advance(time.monotonic())
+            # Take replies until the next tick
+            while True:
+                received_at = self._next_status(deadline)
+                if received_at is None:
+                    break
+                if sent:
+                    rtts.append(received_at - sent.popleft())
+                    answered += 1
+        # Give the last replies time to arrive
+        while sent:
+            received_at = self._next_status(time.monotonic() + min(self.timeout, max(1.0, 4 * interval)))
+            if received_at is None:
+                break
+            rtts.append(received_at - sent.popleft())
+            answered += 1
+        loss = (count - answered) / count if count else 1.0
+        result = {"interval": interval, "sent": count, "answered": answered, "loss": round(loss, 4),
+                  "missed_ticks": clock.missed, **percentiles(rtts)}
+        # Sustainable: hardly any loss, replies keep up with the clock and no tick had to be skipped
+        result["sustainable"] = bool(rtts) and loss <= MAX_LOSS and clock.missed == 0 \
+            and result["p90_ms"] < interval * 1000
+        return result
+
+    def max_rate(self, intervals=None, duration=3.0):
+        """Tries the intervals (PROBE_INTERVALS by default) slowest first, stopping at the first that can't be sustained."""
+        results = []
+        for interval in intervals or PROBE_INTERVALS:
+            result = self.sustained(interval, duration)
+            results.append(result)
+            if not result["sustainable"]:
+                break
+        return results
+
+
+def mqtt_round_trips(cfg, count=50, timeout=5.0):
+    """
+    Publishes `count` QoS 1 messages to the configured broker and times each
+    until it is delivered back to us. Returns (round trips in seconds, lost).
+    """
+    topic = f"{cfg.mqtt_topic}/diagnostics/{uuid.uuid4().hex[:8]}"
+    connected = threading.Event()
+    subscribed = threading.Event()
+    arrived = threading.Event()
+    expected = [None]
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            disable_nagle(client)
+            connected.set()
+
+    def on_message(client, userdata, message):
+        if message.payload.decode(errors="replace") == expected[0]:
+            arrived.set()
+
+    client = mqtt.Client()
+    if cfg.mqtt_username and cfg.mqtt_password:
+        client.username_pw_set(cfg.mqtt_username, cfg.mqtt_password)
+    client.on_connect = on_connect
+    client.on_subscribe = lambda *args: subscribed.set()
+    client.on_message = on_message
+    client.connect(cfg.mqtt_broker, cfg.mqtt_port, 60)
+    client.loop_start()
+    try:
+        if not connected.wait(timeout):
+            raise TimeoutError(f"No answer from the MQTT broker at {cfg.mqtt_broker}:{cfg.mqtt_port}.")
+        client.subscribe(topic, qos=1)
+        if not subscribed.wait(timeout):
+            raise TimeoutError("The MQTT broker did not confirm the subscription.")
+        rtts = []
+        lost = 0
+        for i in range(count):
+            expected[0] = str(i)
+            arrived.clear()
+            start = time.perf_counter()
+            client.publish(topic, expected[0], qos=1)
+            if arrived.wait(timeout):
+                rtts.append(time.perf_counter() - start)
+            else:
+                lost += 1
+        return rtts, lost
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+def run(cfg, samples=100, duration=3.0, mqtt=True, log=print):
+    """Runs every measurement against `cfg` (a Config or DeviceConfig) and returns the report."""
+    report = {}
+    probe = LinkProbe(create_transport(cfg), timeout=cfg.link_timeout)
+    log(f"Connecting to {probe.link.description}...")
+    report["connect_s"] = round(probe.open(), 3)
+    try:
+        log(f"Measuring '?' round trips ({samples} queries)...")
+        rtts, lost = probe.round_trips(samples)
+        report["rtt"] = dict(percentiles(rtts), lost=lost, loss=round(lost / samples, 4) if samples else 0.0)
+
+        log("Measuring reconnect time...")
+        report["reconnect_s"] = round(probe.reconnect(), 3)
+
+        log(f"Probing poll rates ({duration:g} s each)...")
+        report["rates"] = probe.max_rate(duration=duration)
+    finally:
+        probe.close()
+    sustainable = [result["interval"] for result in report["rates"] if result["sustainable"]]
+    report["fastest_interval"] = min(sustainable) if sustainable else None
+
+    if mqtt and cfg.mqtt_enabled:
+        log(f"Measuring MQTT publish round trips to {cfg.mqtt_broker}:{cfg.mqtt_port}...")
+        try:
+            rtts, lost = mqtt_round_trips(cfg)
+            report["mqtt"] = dict(percentiles(rtts), lost=lost)
+        except (OSError, TimeoutError) as e:
+            report["mqtt"] = {"error": str(e)}
+
+    p99 = report["rtt"].get("p99_ms", cfg.link_timeout * 1000) / 1000
+    report["recommended_interval"] = recommend_interval(p99, report["fastest_interval"] or PROBE_INTERVALS[0])
+    return report
+
+
+def format_report(report, current_interval=None):
+    lines = ["", "--- Link Diagnostics ---", f"Connect: {report['connect_s'] * 1000:.0f} ms"]
+    rtt = report["rtt"]
+    if rtt["samples"]:
+        lines.append(f"'?' round trip: p50 {rtt['p50_ms']} ms, p90 {rtt['p90_ms']} ms, p99 {rtt['p99_ms']} ms, "
+                     f"max {rtt['max_ms']} ms ({rtt['samples']} answered)")
+    lines.append(f"Unanswered: {rtt['lost']} ({rtt['loss']:.1%})")
+    lines.append(f"Reconnect: {report['reconnect_s'] * 1000:.0f} ms")
+    lines.append("Poll rates:")
+    for result in report["rates"]:
+        p90 = f"p90 {result['p90_ms']} ms" if result["samples"] else "no replies"
+        lines.append(f"  {result['interval'] * 1000:>6.0f} ms: {result['answered']}/{result['sent']} answered, {p90}, "
+                     f"{'OK' if result['sustainable'] else 'too fast'}")
+    if report["fastest_interval"]:
+        lines.append(f"Fastest sustainable interval: {report['fastest_interval']} s")
+    else:
+        lines.append("No poll rate could be sustained: the link is losing replies or too slow.")
+    mqtt = report.get("mqtt")
+    if mqtt and "error" in mqtt:
+        lines.append(f"MQTT: {mqtt['error']}")
+    elif mqtt and mqtt["samples"]:
+        lines.append(f"MQTT publish round trip: p50 {mqtt['p50_ms']} ms, p99 {mqtt['p99_ms']} ms, lost {mqtt['lost']}")
+    lines.append("")
+    recommendation = f"Recommended polling_interval: {report['recommended_interval']}"
+    if current_interval is not None:
+        recommendation += f" (configured: {current_interval})"
+    lines.append(recommendation)
+    if rtt["loss"] > MAX_LOSS:
+        lines.append("The link loses replies: check the Bluetooth signal (distance, USB 3 interference) or the cable.")
+    return "\n".join(lines)
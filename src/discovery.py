@@ -0,0 +1,133 @@
+"""
+Home Assistant discovery registry.
+
+Every entity of one laser (one HA node id) is registered with its config
+payload. publish() only sends the configs whose content hash differs from what
+the broker is known to hold, so reconnecting to the broker republishes
+nothing.
+
+What the broker holds is learned with sync(): subscribe to
+`<prefix>/+/<node_id>/+/config`, and publish a token to a sync topic we are
+also subscribed to. The broker sends the retained configs right after the
+subscription, so once the token comes back every retained config of the node
+has been seen. Configs the broker lost are then published again and configs
+of entities that no longer exist (renamed or removed sensors) are cleared.
+
+clear_mqtt.py uses the same sync to find every retained config of the node,
+and clears them in one batch that waits for the broker's acknowledgements.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+
+def config_hash(payload):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return hashlib.sha1(payload).hexdigest()
+
+
+def wait_for_publish(infos, timeout):
+    """Waits until every publish is acknowledged or `timeout` passes. Returns how many were."""
+    deadline = time.monotonic() + timeout
+    for info in infos:
+        remaining = deadline - time.monotonic()
+        if info.rc != 0 or remaining <= 0:
+            continue
+        info.wait_for_publish(remaining)
+    return sum(1 for info in infos if info.rc == 0 and info.is_published())
+
+
+class DiscoveryRegistry:
+    def __init__(self, prefix, node_id, sync_topic):
+        self.prefix = prefix
+        self.node_id = node_id
+        self.subscription = f"{prefix}/+/{node_id}/+/config"
+        self.sync_topic = sync_topic
+        self.entities = {} # Config topic -> payload
+        self.known = {} # Config topic -> hash of the payload the broker holds
+        self.seen = {} # Retained configs received during a sync
+        self.lock = threading.Lock()
+        self.token = None
+        self.repair = True
+        self.synced = threading.Event()
+
+    def topic(self, component, object_id):
+        return f"{self.prefix}/{component}/{self.node_id}/{object_id}/config"
+
+    def add(self, component, object_id, config):
+        self.entities[self.topic(component, object_id)] = json.dumps(config, sort_keys=True)
+
+    def changed(self):
+        """Configs that differ from what the broker holds, as (topic, payload)."""
+        with self.lock:
+            return [(topic, payload) for topic, payload in self.entities.items()
+                    if self.known.get(topic) != config_hash(payload)]
+
+    def stale(self):
+        """Retained configs of this node that belong to no registered entity."""
+        with self.lock:
+            return [topic for topic in self.known if topic not in self.entities]
+
+    def publish(self, client):
+        """Publishes the changed configs (QoS 1, retained). Returns the MQTTMessageInfo of each."""
+        infos = []
+        for topic, payload in self.changed():
+            infos.append(client.publish(topic, payload, qos=1, retain=True))
+            with self.lock:
+                self.known[topic] = config_hash(payload)
+        if infos:
+            logging.info(f"Published {len(infos)} of {len(self.entities)} Home Assistant discovery configs for {self.node_id}.")
+        return infos
+
+    def clear(self, client, topics=None):
+        """Clears retained configs, by default every one the broker is known to hold. Returns the MQTTMessageInfo of each."""
+        if topics is None:
+            with self.lock:
+                topics = list(self.known)
+        infos = []
+        for topic in topics:
+            infos.append(client.publish(topic, "", qos=1, retain=True))
+            with self.lock:
+                self.known.pop(topic, None)
+        return infos
+
+    def sync(self, client, repair=True):
+        """
+        Starts learning which configs the broker holds; call from on_connect.
+        With `repair`, lost configs are republished and stale ones cleared once
+        it is done. `synced` is set when it is.
+        """
+        with self.lock:
+            self.seen = {}
+            self.token = uuid.uuid4().hex
+            self.repair = repair
+        self.synced.clear()
+        client.message_callback_add(self.subscription, self._on_config)
+        client.message_callback_add(self.sync_topic, self._on_sync)
+        client.subscribe([(self.subscription, 1), (self.sync_topic, 1)])
+        client.publish(self.sync_topic, self.token, qos=1)
+
+    def _on_config(self, client, userdata, message):
+        # Our own publishes come back too, only the retained ones tell what the broker had
+        if message.retain and message.payload:
+            with self.lock:
+                self.seen[message.topic] = config_hash(message.payload)
+
+    def _on_sync(self, client, userdata, message):
+        with self.lock:
+            if message.payload.decode(errors="replace") != self.token:
+                return
+            self.token = None
+            self.known = self.seen
+        client.unsubscribe([self.subscription, self.sync_topic])
+        if self.repair:
+            stale = self.stale()
+            if stale:
+                logging.info(f"Clearing {len(stale)} stale Home Assistant discovery configs for {self.node_id}: {', '.join(stale)}")
+                self.clear(client, stale)
+            self.publish(client)
+        self.synced.set()
@@ -0,0 +1,50 @@
+"""
+Splits the byte stream from the controller into lines.
+
+Bytes are collected in one bytearray and only complete lines are decoded,
+so a multi-byte sequence split across two reads is never mangled.
+"""
+import logging
+
+# GRBL lines are well under 256 bytes; anything longer without a newline is noise
+MAX_BUFFER = 4096
+
+
+class LineFramer:
+    def __init__(self, max_buffer=MAX_BUFFER):
+        self.buffer = bytearray()
+        self.max_buffer = max_buffer
+        self.discarding = False # Dropping the rest of an overlong line
+        self.overflows = 0
+
+    def reset(self):
+        self.buffer.clear()
+        self.discarding = False
+
+    def feed(self, data):
+        """Adds received bytes and returns the complete, non-empty lines they finish."""
+        buffer = self.buffer
+        buffer += data
+        end = buffer.rfind(b"\n")
+        lines = []
+        if end >= 0:
+            start = 0
+            if self.discarding:
+                start = buffer.find(b"\n") + 1
+                self.discarding = False
+            with memoryview(buffer) as view:
+                while start <= end:
+                    newline = buffer.find(b"\n", start, end + 1)
+                    line = str(view[start:newline], 'utf-8', 'replace').strip()
+                    if line:
+                        lines.append(line)
+                    start = newline + 1
+            del buffer[:end + 1]
+
+        if len(buffer) > self.max_buffer:
+            # A garbled link that never sends a newline must not grow the buffer forever
+            self.overflows += 1
+            logging.warning(f"Discarding {len(buffer)} bytes without a line ending.")
+            buffer.clear()
+            self.discarding = True
+        return lines
@@ -0,0 +1,280 @@
+"""
+GRBL / grblHAL status report parsing, and the replies to the $ queries.
+
+A status report looks like:
+    <Run|MPos:34.900,53.963,0.000|Bf:15,128|FS:1000,100|Ov:100,100,100|A:SF>
+
+The frame is split once on '|' and every field is dispatched on its prefix,
+so a report costs one split plus one comparison chain per field instead of
+one regex scan of the whole line per field.
+"""
+from functools import lru_cache
+
+AXES = ("x", "y", "z", "a", "b", "c")
+
+# Every field is off when the A: field is absent
+NO_ACCESSORIES = {
+    "spindle_enabled": False,
+    "flood_coolant": False,
+    "mist_coolant": False
+}
+
+
+def _number(value):
+    """GRBL sends integers for most fields but grblHAL may send decimals."""
+    return float(value) if "." in value else int(value)
+
+
+def _axes(value):
+    values = value.split(",")
+    if len(values) == 3:
+        x, y, z = values
+        return {"x": float(x), "y": float(y), "z": float(z)}
+    return dict(zip(AXES, map(float, values)))
+
+
+def _buffer(value):
+    blocks, _, rx = value.partition(",")
+    return {"planner_blocks": int(blocks), "rx_bytes": int(rx) if rx else None}
+
+
+def _accessories(value):
+    # S = Spindle CW, C = Spindle CCW, F = Flood Coolant (Air Assist), M = Mist Coolant
+    return {
+        "spindle_enabled": "S" in value or "C" in value,
+        "flood_coolant": "F" in value,
+        "mist_coolant": "M" in value
+    }
+
+
+def _overrides(value):
+    feed, rapid, spindle = value.split(",")[:3]
+    return {"feed": int(feed), "rapid": int(rapid), "spindle": int(spindle)}
+
+
+class FieldCache:
+    """
+    The sub-objects of the previous report of one laser, by field text.
+
+    A field that is unchanged since the last report (the position while
+    idle, overrides, buffer, accessories) returns the same dict instead of a
+    new one, so a long-running monitor allocates only what changed, and the
+    payload encoder can reuse the JSON it made of it. The shared dicts must
+    be treated as read-only; the top-level dict is still new for every report.
+
+    A report identical to the previous one, as an idle or held machine sends
+    poll after poll, is not parsed again at all.
+    """
+    __slots__ = ("mpos", "wpos", "wco", "overrides", "buffer", "accessories", "report")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, (None, None))
+
+    def get(self, name, value, parse):
+        text, parsed = getattr(self, name)
+        if text != value:
+            parsed = parse(value)
+            setattr(self, name, (value, parsed))
+        return parsed
+
+
+@lru_cache(maxsize=1024)
+def power_pct(spindle, max_spindle_speed):
+    """The laser power in percent of $30. round() is slow and the spindle only takes a few values."""
+    return round((spindle / max_spindle_speed) * 100, 1)
+
+
+def detailed_status(state, spindle, accessories, framing_threshold):
+    """
+    Derives whether the laser is actually firing or framing.
+    Only meaningful while the machine is running, otherwise the state is returned as-is.
+    """
+    if state != "Run":
+        return state
+    if spindle == 0:
+        return "Moving"
+    # Spindle is ON (>0)
+    # If Coolant is ON, it's likely a job (Lasering)
+    # If Spindle > Threshold, it's likely a job (Lasering)
+    # Otherwise, it's Framing
+    coolant_on = accessories["flood_coolant"] or accessories["mist_coolant"]
+    if coolant_on or spindle > framing_threshold:
+        return "Lasering"
+    return "Framing"
+
+
+def parse_status(line, max_spindle_speed=1000, framing_threshold=20, cache=None):
+    """
+    Parses a GRBL status line in a single pass.
+    Returns a dictionary with every reported field, or None if the line is not a status report.
+    With a FieldCache, unchanged sub-objects are shared with the previous report.
+    """
+    if cache is None:
+        return _parse_status(line, max_spindle_speed, framing_threshold, None)
+    key = (line, max_spindle_speed, framing_threshold)
+    last, data = cache.report
+    if key != last:
+        data = _parse_status(line, max_spindle_speed, framing_threshold, cache)
+        if data is None:
+            return None
+        cache.report = (key, data)
+    # Callers add to the top-level dict, the cached one must stay as parsed
+    return dict(data)
+
+
+def _parse_status(line, max_spindle_speed, framing_threshold, cache):
+    if not line.startswith("<"):
+        return None
+    end = -1 if line.endswith(">") else len(line)
+    fields = line[1:end].split("|")
+    state = fields[0]
+    if not state:
+        return None
+
+    data = {"raw": line, "state": state}
+    _, sep, sub = state.partition(":")
+    if sep:
+        # Hold:0, Door:1, ...
+        data["substate"] = _number(sub) if sub else None
+
+    # Dispatch on the field prefix, most frequent fields first
+    for field in fields[1:]:
+        key, sep, value = field.partition(":")
+        if not sep:
+            continue
+        try:
+            if key == "MPos":
+                data["mpos"] = cache.get("mpos", value, _axes) if cache else _axes(value)
+            elif key == "FS":
+                feed, _, spindle = value.partition(",")
+                data["feed_rate"] = _number(feed)
+                data["spindle_speed"] = _number(spindle)
+            elif key == "Bf":
+                data["buffer"] = cache.get("buffer", value, _buffer) if cache else _buffer(value)
+            elif key == "A":
+                data["accessories"] = cache.get("accessories", value, _accessories) if cache else _accessories(value)
+            elif key == "WPos":
+                data["wpos"] = cache.get("wpos", value, _axes) if cache else _axes(value)
+            elif key == "WCO":
+                data["wco"] = cache.get("wco", value, _axes) if cache else _axes(value)
+            elif key == "Ov":
+                data["overrides"] = cache.get("overrides", value, _overrides) if cache else _overrides(value)
+            elif key == "Ln":
+                data["line_number"] = int(value)
+            elif key == "F":
+                data["feed_rate"] = _number(value)
+            elif key == "Pn":
+                data["pins"] = value
+            else:
+                # grblHAL extensions (SD, H, T, MPG, Sc, TLR, ...) are kept verbatim
+                data.setdefault("extra", {})[key] = value
+        except ValueError:
+            # A garbled field must not discard the rest of the report
+            continue
+
+    if "spindle_speed" in data:
+        # Ensure we don't divide by zero if config is weird, though default is 1000
+        max_speed = max_spindle_speed if max_spindle_speed > 0 else 1000
+        data["laser_power_pct"] = power_pct(data["spindle_speed"], max_speed)
+
+    if "accessories" not in data:
+        data["accessories"] = NO_ACCESSORIES if cache else dict(NO_ACCESSORIES)
+
+    data["detailed_status"] = detailed_status(
+        state, data.get("spindle_speed", 0), data["accessories"], framing_threshold
+    )
+    return data
+
+
+# Replies to the '$' queries: $$ (settings), $G (parser state), $# (offsets), $I (build info)
+
+# $G word -> parser state group
+MODAL_GROUPS = {
+    "G0": "motion", "G1": "motion", "G2": "motion", "G3": "motion", "G38.2": "motion",
+    "G38.3": "motion", "G38.4": "motion", "G38.5": "motion", "G80": "motion",
+    "G54": "wcs", "G55": "wcs", "G56": "wcs", "G57": "wcs", "G58": "wcs", "G59": "wcs",
+    "G17": "plane", "G18": "plane", "G19": "plane",
+    "G20": "units", "G21": "units",
+    "G90": "distance", "G91": "distance",
+    "G93": "feed_mode", "G94": "feed_mode",
+    "M0": "program", "M1": "program", "M2": "program", "M30": "program",
+    "M3": "spindle", "M4": "spindle", "M5": "spindle",
+    "M7": "coolant", "M8": "coolant", "M9": "coolant",
+}
+
+# $# reply tags
+OFFSET_TAGS = ("G54", "G55", "G56", "G57", "G58", "G59", "G28", "G30", "G92", "TLO", "PRB")
+
+
+def parse_setting(line):
+    """(30, 1000) for '$30=1000', or None. Non-numeric values (grblHAL strings) are kept as text."""
+    if not line.startswith("$"):
+        return None
+    key, sep, value = line[1:].partition("=")
+    if not sep or not key.isdigit():
+        return None
+    try:
+        return int(key), _number(value)
+    except ValueError:
+        return int(key), value
+
+
+def parse_modal(line):
+    """Parser state from '[GC:G0 G54 G17 G21 G90 G94 M5 M9 T0 F0 S0]', or None."""
+    if not line.startswith("[GC:"):
+        return None
+    modal = {}
+    for word in line[4:].rstrip("]").split():
+        group = MODAL_GROUPS.get(word)
+        if group == "coolant" and "coolant" in modal and word != "M9":
+            # M7 and M8 may both be on
+            modal["coolant"] += " " + word
+        elif group:
+            modal[group] = word
+        elif word[0] in "TFS":
+            try:
+                modal[{"T": "tool", "F": "feed", "S": "spindle_speed"}[word[0]]] = _number(word[1:])
+            except ValueError:
+                continue
+        else:
+            modal.setdefault("other", []).append(word)
+    return modal
+
+
+def parse_offset(line):
+    """('G54', {'x': 0.0, ...}) for a '$#' reply line, or None."""
+    if not line.startswith("[") or ":" not in line:
+        return None
+    tag, _, value = line[1:].rstrip("]").partition(":")
+    if tag not in OFFSET_TAGS:
+        return None
+    try:
+        if tag == "TLO":
+            return tag, float(value)
+        if tag == "PRB":
+            # [PRB:0.000,0.000,0.000:1], the last field tells whether the probe made contact
+            position, _, success = value.rpartition(":")
+            return tag, dict(_axes(position), success=success == "1")
+        return tag, _axes(value)
+    except ValueError:
+        return None
+
+
+def parse_build_info(line):
+    """Fields of a '$I' reply line ('[VER:...]' or '[OPT:...]'), or None."""
+    if line.startswith("[VER:"):
+        version, _, name = line[5:].rstrip("]").partition(":")
+        return {"version": version, "name": name}
+    if line.startswith("[OPT:"):
+        fields = line[5:].rstrip("]").split(",")
+        info = {"options": fields[0]}
+        try:
+            if len(fields) > 1:
+                info["planner_blocks"] = int(fields[1])
+            if len(fields) > 2:
+                info["rx_buffer"] = int(fields[2])
+        except ValueError:
+            pass
+        return info
+    return None
@@ -0,0 +1,300 @@
+"""
+GRBL status simulator.
+
+Answers '?' with status reports that follow a scripted job, answers G-code
+lines with 'ok', and can delay replies and drop bytes to imitate a flaky
+Bluetooth link. Serves over TCP or a pseudo terminal, so the monitor can be
+exercised end-to-end with the tcp or serial transport.
+
+Usage:
+    python3 src/grbl_sim.py --tcp 127.0.0.1:2323 [--script job.yaml] [--loop]
+    python3 src/grbl_sim.py --pty --link /tmp/laser [--latency 0.05 --jitter 0.02 --drop 0.001]
+
+A script is a YAML/JSON list of phases:
+    - {state: Idle, duration: 2}
+    - {state: Run, duration: 10, spindle: 800, feed: 1500, accessories: SF, to: [50, 50]}
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import tty
+
+import yaml
+
+# Idle, framing, idle, a 10 second job, idle
+DEFAULT_SCRIPT = [
+    {"state": "Idle", "duration": 2},
+    {"state": "Run", "duration": 3, "spindle": 10, "feed": 3000, "accessories": "S", "to": [50, 0]},
+    {"state": "Idle", "duration": 1},
+    {"state": "Run", "duration": 10, "spindle": 800, "feed": 1500, "accessories": "SF", "to": [50, 50]},
+    {"state": "Run", "duration": 2, "spindle": 0, "feed": 6000, "to": [0, 0]},
+    {"state": "Idle", "duration": 5},
+]
+
+BUILD_INFO = b"[VER:1.1h.20190825:LaserLink simulator]\r\n[OPT:V,15,128]\r\nok\r\n"
+SETTINGS = {0: 10, 1: 25, 10: 1, 30: 1000, 31: 0, 32: 1, 110: 6000, 111: 6000, 130: 400, 131: 400}
+PARSER_STATE = b"[GC:G0 G54 G17 G21 G90 G94 M5 M9 T0 F0 S0]\r\nok\r\n"
+OFFSETS = b"".join(f"[{tag}:0.000,0.000,0.000]\r\n".encode() for tag in ("G54", "G55", "G56", "G57", "G58", "G59", "G28", "G30", "G92")) \
+    + b"[TLO:0.000]\r\n[PRB:0.000,0.000,0.000:0]\r\nok\r\n"
+
+
+class GrblSimulator:
+    def __init__(self, script=None, loop_script=False, clock=time.monotonic):
+        self.clock = clock
+        self.loop_script = loop_script
+        self.phases = []
+        position = (0.0, 0.0)
+        offset = 0.0
+        for phase in script or DEFAULT_SCRIPT:
+            end = tuple(float(v) for v in phase.get("to", position))
+            self.phases.append((offset, float(phase["duration"]), position, end, phase))
+            offset += float(phase["duration"])
+            position = end
+        self.length = offset
+        self.start = clock()
+        self.reports = 0
+        self.pending = b""
+
+    def sample(self):
+        """Returns (phase, x, y) for the current time."""
+        elapsed = self.clock() - self.start
+        if self.loop_script and self.length:
+            elapsed %= self.length
+        for offset, duration, start, end, phase in self.phases:
+            if elapsed < offset + duration:
+                progress = (elapsed - offset) / duration if duration else 1.0
+                x = start[0] + (end[0] - start[0]) * progress
+                y = start[1] + (end[1] - start[1]) * progress
+                return phase, x, y
+        offset, duration, start, end, phase = self.phases[-1]
+        return {"state": "Idle"}, end[0], end[1]
+
+    def status_report(self):
+        phase, x, y = self.sample()
+        self.reports += 1
+        fields = [phase["state"], f"MPos:{x:.3f},{y:.3f},0.000", "Bf:15,128",
+                  f"FS:{phase.get('feed', 0)},{phase.get('spindle', 0)}"]
+        # Like GRBL, overrides and work offsets are only sent every few reports
+        if self.reports % 10 == 1:
+            fields.append("WCO:0.000,0.000,0.000")
+        elif self.reports % 10 == 2:
+            fields.append("Ov:100,100,100")
+        if phase.get("accessories"):
+            fields.append(f"A:{phase['accessories']}")
+        return ("<" + "|".join(fields) + ">\r\n").encode()
+
+    def handle(self, data):
+        """Feeds received bytes, returns the replies in order."""
+        replies = []
+        for byte in data:
+            if byte == ord("?"):
+                # Real-time command, answered immediately even mid-line
+                replies.append(self.status_report())
+            elif byte == ord("\n"):
+                replies.append(self.command(self.pending.strip().decode(errors="replace")))
+                self.pending = b""
+            elif byte >= 0x80 or byte in (ord("!"), ord("~"), 0x18):
+                # Other real-time commands are accepted silently
+                continue
+            else:
+                self.pending += bytes([byte])
+        return [reply for reply in replies if reply]
+
+    def command(self, line):
+        if not line:
+            return b""
+        if line == "$I":
+            return BUILD_INFO
+        if line == "$$":
+            return "".join(f"${key}={value}\r\n" for key, value in SETTINGS.items()).encode() + b"ok\r\n"
+        if line == "$G":
+            return PARSER_STATE
+        if line == "$#":
+            return OFFSETS
+        return b"ok\r\n"
+
+
+class LinkFaults:
+    """Delays replies and drops bytes to imitate a flaky link."""
+    def __init__(self, latency=0.0, jitter=0.0, drop=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self.random = random.Random(seed)
+
+    def delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def mangle(self, data):
+        if not self.drop:
+            return data
+        return bytes(b for b in data if self.random.random() >= self.drop)
+
+
+async def _serve_link(read, write, simulator, faults):
+    """Answers one client until it disconnects."""
+    outbox = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+
+    async def sender():
+        last_due = 0.0
+        while True:
+            due, reply = await outbox.get()
+            # Keep replies in order even with jitter
+            due = max(due, last_due)
+            last_due = due
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await write(faults.mangle(reply))
+
+    task = asyncio.create_task(sender())
+    try:
+        while True:
+            data = await read()
+            if not data:
+                break
+            for reply in simulator.handle(data):
+                outbox.put_nowait((loop.time() + faults.delay(), reply))
+    finally:
+        task.cancel()
+
+
+async def serve_tcp(host, port, script=None, loop_script=False, faults=None, started=None):
+    faults = faults or LinkFaults()
+
+    async def client(reader, writer):
+        async def write(data):
+            writer.write(data)
+            await writer.drain()
+        try:
+            await _serve_link(lambda: reader.read(1024), write, GrblSimulator(script, loop_script), faults)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(client, host, port)
+    if started:
+        started(server.sockets[0].getsockname()[1])
+    async with server:
+        await server.serve_forever()
+
+
+async def serve_pty(link=None, script=None, loop_script=False, faults=None):
+    faults = faults or LinkFaults()
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    if link:
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(path, link)
+    logging.info(f"Simulator listening on {link or path}")
+    loop = asyncio.get_running_loop()
+    os.set_blocking(master, False)
+
+    async def read():
+        while True:
+            try:
+                return os.read(master, 1024)
+            except BlockingIOError:
+                ready = loop.create_future()
+                loop.add_reader(master, lambda: ready.done() or ready.set_result(None))
+                try:
+                    await ready
+                finally:
+                    loop.remove_reader(master)
+
+    async def write(data):
+        os.write(master, data)
+
+    try:
+        # We hold the slave end open ourselves, so clients can come and go without an EOF
+        await _serve_link(read, write, GrblSimulator(script, loop_script), faults)
+    finally:
+        os.close(master)
+        os.close(slave)
+        if link and os.path.islink(link):
+            os.remove(link)
+
+
+class SimulatorServer:
+    """Runs a TCP simulator on a background thread, for tests and benchmarks."""
+    def __init__(self, host="127.0.0.1", port=0, script=None, loop_script=False, faults=None):
+        self.host = host
+        self.port = port
+        self.kwargs = {"script": script, "loop_script": loop_script, "faults": faults}
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        ready = threading.Event()
+
+        def started(port):
+            self.port = port
+            ready.set()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.task = self.loop.create_task(serve_tcp(self.host, self.port, started=started, **self.kwargs))
+            try:
+                self.loop.run_until_complete(self.task)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="grbl-sim", daemon=True)
+        self.thread.start()
+        ready.wait(5)
+        return self
+
+    def stop(self):
+        if self.thread:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+            self.thread.join(5)
+            self.thread = None
+
+
+def load_script(path):
+    with open(path, 'r') as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return yaml.safe_load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated GRBL laser for LaserLink")
+    parser.add_argument("--tcp", metavar="HOST:PORT", help="Listen on TCP (e.g. 127.0.0.1:2323)")
+    parser.add_argument("--pty", action="store_true", help="Create a pseudo terminal")
+    parser.add_argument("--link", help="Symlink the pseudo terminal to this path")
+    parser.add_argument("--script", help="YAML/JSON job script (Default: built-in framing + job)")
+    parser.add_argument("--loop", action="store_true", help="Repeat the script forever")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to delay every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument("--drop", type=float, default=0.0, help="Probability of dropping each sent byte")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    script = load_script(args.script) if args.script else None
+    faults = LinkFaults(args.latency, args.jitter, args.drop)
+
+    try:
+        if args.pty:
+            asyncio.run(serve_pty(args.link, script, args.loop, faults))
+        else:
+            host, _, port = (args.tcp or "127.0.0.1:2323").rpartition(":")
+            logging.info(f"Simulator listening on {host}:{port}")
+            asyncio.run(serve_tcp(host, int(port), script, args.loop, faults))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Job and telemetry history in SQLite.
+
+The poll path only puts rows on a bounded queue. A writer thread inserts
+them in one transaction every `flush_interval` seconds (or every
+`batch_size` rows), in WAL mode with synchronous=NORMAL, so polling never
+waits on the disk and an SD card sees a few large writes instead of one
+fsync per status. Telemetry is thinned to one row per `sample_interval`
+per device, plus every state change. Telemetry older than `retention_days`
+is deleted by the same thread once an hour, a few thousand rows per
+transaction; jobs are kept.
+
+Usage:
+    python3 src/history.py history.db jobs-per-day [--days 30] [--device NAME] [--json]
+    python3 src/history.py history.db utilization [--days 7]
+    python3 src/history.py history.db longest [--limit 10]
+    python3 src/history.py history.db toolpath [--job ID] > job.svg
+"""
+import argparse
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from toolpath import Toolpath
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    started REAL,
+    ended REAL NOT NULL,
+    duration_s REAL,
+    lasering_s REAL,
+    travel_mm REAL,
+    lasering_mm REAL,
+    mean_power_pct REAL,
+    peak_feed REAL,
+    toolpath BLOB
+);
+CREATE INDEX IF NOT EXISTS jobs_device_ended ON jobs (device, ended);
+CREATE INDEX IF NOT EXISTS jobs_ended ON jobs (ended);
+
+CREATE TABLE IF NOT EXISTS telemetry (
+    device TEXT NOT NULL,
+    t REAL NOT NULL,
+    status TEXT,
+    x REAL,
+    y REAL,
+    feed REAL,
+    power REAL,
+    job INTEGER
+);
+CREATE INDEX IF NOT EXISTS telemetry_device_t ON telemetry (device, t);
+CREATE INDEX IF NOT EXISTS telemetry_t ON telemetry (t);
+"""
+
+PRUNE_INTERVAL = 3600 # Seconds between deletes of old telemetry
+PRUNE_BATCH = 5000 # Rows deleted per transaction, so the WAL stays small
+
+JOB_COLUMNS = ("device", "started", "ended", "duration_s", "lasering_s", "travel_mm",
+               "lasering_mm", "mean_power_pct", "peak_feed", "toolpath")
+
+
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    if "toolpath" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+        # Databases from before toolpaths were kept
+        conn.execute("ALTER TABLE jobs ADD COLUMN toolpath BLOB")
+    return conn
+
+
+class JobHistory:
+    def __init__(self, path, flush_interval=30.0, sample_interval=5.0, batch_size=500, queue_size=10000,
+                 retention_days=90.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.sample_interval = sample_interval
+        self.retention_days = retention_days # 0 keeps all telemetry
+        self.next_prune = 0.0 # Monotonic
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.last_sample = {} # device -> (time, status)
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.pruned = 0
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            cfg.history_path,
+            flush_interval=float(cfg.history_flush_interval),
+            sample_interval=float(cfg.history_sample_interval),
+            retention_days=float(cfg.history_retention_days)
+        )
+
+    def start(self):
+        if self.thread is None:
+            # Created here so a bad path fails at startup, not on the first flush
+            connect(self.path).close()
+            self.next_prune = 0.0 # Prune right away, a restarted daemon may have been down for long
+            self.thread = threading.Thread(target=self._writer, name="laserlink-history", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=10):
+        """Writes everything still queued and stops the writer."""
+        if self.thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            # Not through _put: the sentinel must not be dropped. A full queue means the
+            # writer is busy with it, so room comes soon
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            logging.error(f"Job history writer did not make room within {timeout}s, stopping without flushing.")
+        else:
+            self.thread.join(max(0.0, deadline - time.monotonic()))
+        self.thread = None
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # The disk can't keep up; losing a sample is better than stalling the poll loop
+            self.dropped += 1
+
+    def record_status(self, device, now, data, job_in_progress):
+        """Queues a telemetry row if the status changed or sample_interval has passed. Never blocks."""
+        status = data.get("detailed_status", data.get("state"))
+        last = self.last_sample.get(device)
+        if last and last[1] == status and now - last[0] < self.sample_interval:
+            return
+        self.last_sample[device] = (now, status)
+        mpos = data.get("mpos") or {}
+        self._put(("telemetry", (device, now, status, mpos.get("x"), mpos.get("y"),
+                                 data.get("feed_rate"), data.get("laser_power_pct"), int(job_in_progress))))
+
+    def record_job(self, device, summary, toolpath=None):
+        """Queues a finished job (the summary published to <topic>/job) and its encoded toolpath. Never blocks."""
+        row = dict(summary, device=device, toolpath=toolpath)
+        self._put(("job", tuple(row.get(column) for column in JOB_COLUMNS)))
+
+    def _writer(self):
+        conn = connect(self.path)
+        running = True
+        try:
+            while running:
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        running = False
+                        break
+                    batch.append(item)
+                if batch:
+                    self._flush(conn, batch)
+                if self.retention_days and time.monotonic() >= self.next_prune:
+                    self._prune(conn)
+        finally:
+            conn.close()
+
+    def _flush(self, conn, batch):
+        jobs = [row for kind, row in batch if kind == "job"]
+        samples = [row for kind, row in batch if kind == "telemetry"]
+        try:
+            with conn:
+                if samples:
+                    conn.executemany("INSERT INTO telemetry VALUES (?, ?, ?, ?, ?, ?, ?, ?)", samples)
+                if jobs:
+                    conn.executemany(f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})", jobs)
+            self.written += len(batch)
+            self.flushes += 1
+        except sqlite3.Error as e:
+            logging.error(f"Error writing job history: {e}")
+
+    def _prune(self, conn):
+        """Deletes telemetry older than retention_days, PRUNE_BATCH rows per transaction."""
+        self.next_prune = time.monotonic() + PRUNE_INTERVAL
+        cutoff = time.time() - self.retention_days * 86400
+        try:
+            while True:
+                with conn:
+                    deleted = conn.execute(
+                        "DELETE FROM telemetry WHERE rowid IN (SELECT rowid FROM telemetry WHERE t < ? LIMIT ?)",
+                        (cutoff, PRUNE_BATCH)).rowcount
+                self.pruned += deleted
+                if deleted < PRUNE_BATCH:
+                    break
+        except sqlite3.Error as e:
+            logging.error(f"Error deleting old telemetry: {e}")
+
+
+def _where(days, device, column="ended"):
+    clauses, params = [f"{column} >= ?"], [time.time() - days * 86400]
+    if device:
+        clauses.append("device = ?")
+        params.append(device)
+    return " AND ".join(clauses), params
+
+
+def jobs_per_day(conn, days=30, device=None):
+    where, params = _where(days, device)
+    rows = conn.execute(
+        f"SELECT date(ended, 'unixepoch', 'localtime') AS day, device, COUNT(*), "
+        f"ROUND(SUM(duration_s) / 60.0, 1), ROUND(SUM(lasering_s) / 60.0, 1) "
+        f"FROM jobs WHERE {where} GROUP BY day, device ORDER BY day, device", params)
+    return [{"day": day, "device": dev, "jobs": count, "job_minutes": minutes, "lasering_minutes": lasering}
+            for day, dev, count, minutes, lasering in rows]
+
+
+def utilization(conn, days=7, device=None):
+    """Share of the last `days` spent in jobs and actually lasering, per device."""
+    where, params = _where(days, device)
+    window = days * 86400
+    rows = conn.execute(
+        f"SELECT device, COUNT(*), SUM(duration_s), SUM(lasering_s) FROM jobs WHERE {where} GROUP BY device ORDER BY device",
+        params)
+    return [{"device": dev, "jobs": count,
+             "job_pct": round((busy or 0) / window * 100, 2),
+             "lasering_pct": round((lasering or 0) / window * 100, 2)}
+            for dev, count, busy, lasering in rows]
+
+
+def longest_jobs(conn, limit=10, days=3650, device=None):
+    where, params = _where(days, device)
+    rows = conn.execute(
+        f"SELECT id, device, datetime(started, 'unixepoch', 'localtime'), duration_s, lasering_s, travel_mm, mean_power_pct "
+        f"FROM jobs WHERE {where} ORDER BY duration_s DESC LIMIT ?", params + [limit])
+    return [{"id": job, "device": dev, "started": started, "duration_s": duration, "lasering_s": lasering,
+             "travel_mm": travel, "mean_power_pct": power}
+            for job, dev, started, duration, lasering, travel, power in rows]
+
+
+def job_toolpath(conn, job=None, device=None):
+    """The SVG of a job's toolpath (default: the latest job with one), or None."""
+    clauses, params = ["toolpath IS NOT NULL"], []
+    if job is not None:
+        clauses.append("id = ?")
+        params.append(job)
+    if device:
+        clauses.append("device = ?")
+        params.append(device)
+    row = conn.execute(
+        f"SELECT id, device, started, toolpath FROM jobs WHERE {' AND '.join(clauses)} ORDER BY ended DESC LIMIT 1",
+        params).fetchone()
+    if row is None:
+        return None
+    job, device, started, blob = row
+    title = f"{device} job {job}, {time.strftime('%Y-%m-%d %H:%M', time.localtime(started or 0))}"
+    return Toolpath.from_bytes(blob).svg(title=title)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the LaserLink job history")
+    parser.add_argument("database", help="File set by the history path setting")
+    parser.add_argument("report", choices=("jobs-per-day", "utilization", "longest", "toolpath"))
+    parser.add_argument("--days", type=int, help="How far back to look (Default: 30, utilization 7)")
+    parser.add_argument("--device", help="Only this device")
+    parser.add_argument("--limit", type=int, default=10, help="Number of longest jobs (Default: 10)")
+    parser.add_argument("--job", type=int, help="Job id for toolpath, as listed by longest (Default: the latest job)")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+    if args.report == "toolpath":
+        svg = job_toolpath(conn, args.job, args.device)
+        conn.close()
+        if svg is None:
+            sys.exit("No toolpath recorded for that job.")
+        print(svg)
+        return
+    if args.report == "jobs-per-day":
+        rows = jobs_per_day(conn, args.days or 30, args.device)
+    elif args.report == "utilization":
+        rows = utilization(conn, args.days or 7, args.device)
+    else:
+        rows = longest_jobs(conn, args.limit, args.days or 3650, args.device)
+    conn.close()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    elif rows:
+        columns = list(rows[0])
+        widths = [max(len(c), *(len(str(row[c])) for row in rows)) for c in columns]
+        print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+        for row in rows:
+            print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+    else:
+        print("No jobs recorded.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+Shares the laser link between LaserLink and control software.
+
+An RFCOMM channel takes a single client, so LightBurn and LaserLink can't
+both connect to the laser. In proxy mode LaserLink owns the link and serves
+the control software on a local TCP port and/or a pseudo terminal:
+
+    LightBurn ──TCP/pty──┐
+                         ├── LinkProxy ── laser link (RFCOMM, TCP, serial)
+    LaserMonitor ─pair───┘
+
+The monitor is one more client, on its end of a socket pair, so both run
+modes work unchanged. From the clients:
+
+* Real-time bytes (? ! ~ Ctrl-X and 0x80-0xFF) go to the laser at once, even
+  in the middle of a line, as GRBL expects.
+* Lines go to the laser whole, so two senders never interleave within a line.
+  Every line gets exactly one ok/error from GRBL, so the proxy remembers who
+  sent each line in flight and hands the reply back to that client. Empty
+  lines are answered with 'ok' by the proxy itself (GRBL does the same, so
+  the monitor's "?\\n" costs the laser nothing).
+* Lines are held back while GRBL's receive buffer (`rx_buffer` bytes, 128 on
+  GRBL) is full with lines in flight from all clients together, because each
+  sender counts characters only for itself.
+
+From the laser, status reports go to the monitor and to every client that
+sent a '?' since the last report; ok/error go to the line's sender; replies
+to a command ([GC:...], $N=...) to the sender of the oldest line in flight;
+ALARM, [MSG:...] and the startup banner to everyone.
+"""
+import asyncio
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import tty
+from collections import deque
+
+import metrics
+from framing import LineFramer
+from transport import SocketTransport
+
+RX_BUFFER = 128 # GRBL's serial receive buffer
+_REALTIME = re.compile(rb"[?!~\x18\x80-\xff]")
+# Sent by GRBL on its own, not in reply to a line
+_PUSH_PREFIXES = ("ALARM:", "[MSG:", "Grbl", "[echo:", ">")
+
+
+class _Client(asyncio.Protocol):
+    """One sender: a TCP connection, or the monitor's end of a socket pair."""
+    def __init__(self, proxy, name, monitor=False):
+        self.proxy = proxy
+        self.name = name
+        self.monitor = monitor
+        self.transport = None
+        self.buffer = bytearray() # Unfinished line
+        self.wants_status = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.proxy._connected(self)
+
+    def data_received(self, data):
+        self.proxy._from_client(self, data)
+
+    def connection_lost(self, exc):
+        self.proxy._disconnected(self)
+
+    def write(self, data):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(data)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.abort()
+
+
+class _PtyClient(_Client):
+    """A pseudo terminal for control software that only talks to serial ports."""
+    def __init__(self, proxy, link):
+        super().__init__(proxy, "pty")
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.link = link
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(self.path, link)
+        os.set_blocking(self.master, False)
+
+    def start(self, loop):
+        # We hold the slave end open ourselves, so senders can come and go without an EOF
+        loop.add_reader(self.master, self._readable)
+        self.proxy._connected(self)
+
+    def _readable(self):
+        try:
+            data = os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        if data:
+            self.proxy._from_client(self, data)
+
+    def write(self, data):
+        try:
+            os.write(self.master, data)
+        except (BlockingIOError, OSError):
+            pass # Nobody is reading the terminal
+
+    def close(self):
+        if self.master is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.master)
+        os.close(self.master)
+        os.close(self.slave)
+        self.master = self.slave = None
+        if os.path.islink(self.link):
+            os.remove(self.link)
+        self.proxy._disconnected(self)
+
+
+class LinkProxy:
+    def __init__(self, host="127.0.0.1", port=0, pty_link=None, rx_buffer=RX_BUFFER, device="laser"):
+        self.host = host
+        self.port = port # None: no TCP endpoint
+        self.pty_link = pty_link
+        self.pty = None
+        self.rx_buffer = rx_buffer
+        self.device = device
+        self.loop = None
+        self.server = None
+        self.clients = set()
+
+        # The attached laser link
+        self.link = None
+        self.monitor_client = None
+        self.tasks = []
+        self.link_sock = None # Written to directly when nothing is queued
+        self.outgoing = [] # (bytes, received perf_counter) for the writer
+        self.writing = False
+        self.wake = None
+        self.pending = deque() # (client, size) per line in flight, oldest first
+        self.waiting = deque() # (client, line, received at) held back for room in GRBL's buffer
+        self.in_flight = 0
+
+        # Statistics
+        self.lines = 0
+        self.held = 0
+        self.bytes_to_laser = 0
+        self.bytes_from_laser = 0
+        self.delays = deque(maxlen=1024)
+        self.metric_to_laser = metrics.PROXY_BYTES.labels(device, "to_laser")
+        self.metric_from_laser = metrics.PROXY_BYTES.labels(device, "from_laser")
+        self.metric_delay = metrics.PROXY_FORWARD_DELAY.labels(device)
+        self.metric_clients = metrics.PROXY_CLIENTS.labels(device)
+
+    @classmethod
+    def from_config(cls, cfg, device):
+        return cls(cfg.proxy_host, cfg.proxy_port or None, cfg.proxy_pty, int(cfg.proxy_rx_buffer), device)
+
+    def start(self):
+        """Runs the proxy on its own event loop thread. Returns once it listens (port has the real port)."""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.wake = asyncio.Event()
+            try:
+                self.loop.run_until_complete(self._listen())
+            except OSError as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self.loop.run_forever()
+            self.loop.close()
+
+        threading.Thread(target=run, name=f"laserlink-proxy-{self.device}", daemon=True).start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        endpoints = [f"{self.host}:{self.port}"] if self.server else []
+        if self.pty:
+            endpoints.append(f"{self.pty_link} ({self.pty.path})")
+        logging.info(f"Sharing the laser link with control software on {' and '.join(endpoints)}")
+        return self
+
+    async def _listen(self):
+        if self.port is not None:
+            self.server = await self.loop.create_server(lambda: _Client(self, "tcp"), self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        if self.pty_link:
+            self.pty = _PtyClient(self, self.pty_link)
+            self.pty.start(self.loop)
+
+    def stop(self):
+        if self.loop and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _shutdown(self):
+        if self.server:
+            self.server.close()
+        for client in list(self.clients):
+            client.close()
+        await self._detach()
+
+    def attach(self, link):
+        """
+        Opens `link` (any transport) inside the proxy and returns the monitor's
+        end of it, a connected socket. Thread-safe; opening errors are raised.
+        """
+        return asyncio.run_coroutine_threadsafe(self._attach(link), self.loop).result()
+
+    async def attach_async(self, link):
+        """attach() for the monitor's event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._attach(link), self.loop))
+
+    async def _attach(self, link):
+        await self._detach()
+        await link.open_async(self.loop)
+        ours, theirs = socket.socketpair()
+        ours.setblocking(False)
+        _, self.monitor_client = await self.loop.connect_accepted_socket(lambda: _Client(self, "monitor", monitor=True), ours)
+        self.link = link
+        self.link_sock = getattr(link, "sock", None)
+        self._reset()
+        self.tasks = [self.loop.create_task(self._read_link(link)), self.loop.create_task(self._write_link(link))]
+        return theirs
+
+    async def _detach(self):
+        """Closes the laser link and the monitor's end; the monitor sees the link drop and reconnects."""
+        link, self.link = self.link, None
+        if link is None:
+            return
+        self.link_sock = None
+        current = asyncio.current_task()
+        for task in self.tasks:
+            if task is not current:
+                task.cancel()
+        self.tasks = []
+        link.close()
+        self.monitor_client.close()
+        self.monitor_client = None
+        self._reset()
+        self._broadcast("[MSG:LaserLink: laser link closed]\r\n", monitor=False)
+        self.log_stats()
+
+    def _reset(self):
+        """GRBL forgets the lines in its buffer on reset and on a new connection."""
+        self.pending.clear()
+        self.waiting.clear()
+        self.in_flight = 0
+        self.outgoing.clear()
+
+    async def _read_link(self, link):
+        framer = LineFramer()
+        try:
+            while True:
+                data = await link.recv_async(self.loop, 4096)
+                if not data:
+                    break
+                self.bytes_from_laser += len(data)
+                self.metric_from_laser.inc(len(data))
+                for line in framer.feed(data):
+                    self._route(line)
+        except OSError as e:
+            logging.warning(f"Laser link error in the proxy: {e}")
+        finally:
+            if self.link is link:
+                await self._detach()
+
+    async def _write_link(self, link):
+        wake = self.wake
+        while True:
+            await wake.wait()
+            wake.clear()
+            while self.outgoing:
+                batch, self.outgoing = self.outgoing, []
+                data = b"".join(chunk for chunk, _ in batch)
+                self.writing = True
+                try:
+                    await link.send_async(self.loop, data)
+                except OSError as e:
+                    logging.warning(f"Laser link error in the proxy: {e}")
+                    if self.link is link:
+                        await self._detach()
+                    return
+                finally:
+                    self.writing = False
+                self._sent(len(data), [received_at for _, received_at in batch])
+
+    def _send(self, data, received_at):
+        sock = self.link_sock
+        if sock is not None and not self.outgoing and not self.writing:
+            # Nothing queued: write straight away, the writer task only takes what the socket didn't
+            try:
+                sent = sock.send(data)
+            except OSError:
+                sent = 0 # Full, or broken: the writer finds out
+            if sent:
+                self._sent(sent, (received_at,))
+            if sent == len(data):
+                return
+            data = data[sent:]
+        self.outgoing.append((data, received_at))
+        self.wake.set()
+
+    def _sent(self, size, received):
+        now = time.perf_counter()
+        for received_at in received:
+            self.delays.append(now - received_at)
+            self.metric_delay.observe(now - received_at)
+        self.bytes_to_laser += size
+        self.metric_to_laser.inc(size)
+
+    def _connected(self, client):
+        self.clients.add(client)
+        self.metric_clients.set(sum(1 for c in self.clients if not c.monitor))
+        if not client.monitor:
+            logging.info(f"Control software connected to the shared link ({client.name}).")
+
+    def _disconnected(self, client):
+        if client not in self.clients:
+            return
+        self.clients.discard(client)
+        self.metric_clients.set(sum(1 for c in self.clients if not c.monitor))
+        if client is self.monitor_client:
+            # The monitor closed its link: close the laser's too, it opens a fresh one
+            self.loop.create_task(self._detach())
+
+    def _from_client(self, client, data):
+        received_at = time.perf_counter()
+        if self.link is None:
+            logging.debug(f"Laser not connected, dropped {len(data)} bytes from {client.name}.")
+            return
+        if _REALTIME.search(data):
+            realtime = b"".join(_REALTIME.findall(data))
+            if b"?" in realtime:
+                client.wants_status = True
+            if b"\x18" in realtime:
+                # Soft reset: GRBL drops every buffered line, and their replies with them
+                self._reset()
+            self._send(realtime, received_at)
+            data = _REALTIME.sub(b"", data)
+        buffer = client.buffer
+        buffer += data
+        if b"\n" not in buffer and b"\r" not in buffer:
+            return
+        # GRBL ends a line at \r or \n
+        lines = buffer.replace(b"\r", b"\n").split(b"\n")
+        client.buffer = bytearray(lines.pop())
+        for line in lines:
+            if not line.strip():
+                client.write(b"ok\r\n")
+                continue
+            line = bytes(line) + b"\n"
+            if self.waiting or (self.pending and self.in_flight + len(line) > self.rx_buffer):
+                self.waiting.append((client, line, received_at))
+                self.held += 1
+            else:
+                self._forward(client, line, received_at)
+
+    def _forward(self, client, line, received_at):
+        self.pending.append((client, len(line)))
+        self.in_flight += len(line)
+        self.lines += 1
+        self._send(line, received_at)
+
+    def _route(self, line):
+        """Hands one line from the laser to the clients it is meant for."""
+        data = line.encode() + b"\r\n"
+        if line[0] == "<":
+            for client in self.clients:
+                if client.monitor or client.wants_status:
+                    client.wants_status = False
+                    client.write(data)
+        elif line == "ok" or line.startswith("error:"):
+            if not self.pending:
+                return # Answer to a line sent before the proxy attached
+            client, size = self.pending.popleft()
+            self.in_flight -= size
+            client.write(data)
+            waiting = self.waiting
+            while waiting and (not self.pending or self.in_flight + len(waiting[0][1]) <= self.rx_buffer):
+                self._forward(*waiting.popleft())
+        elif line.startswith(_PUSH_PREFIXES) or not self.pending:
+            self._broadcast(data)
+        else:
+            self.pending[0][0].write(data)
+
+    def _broadcast(self, data, monitor=True):
+        if isinstance(data, str):
+            data = data.encode()
+        for client in self.clients:
+            if monitor or not client.monitor:
+                client.write(data)
+
+    def stats(self):
+        delays = sorted(self.delays)
+        stats = {
+            "clients": sum(1 for c in self.clients if not c.monitor),
+            "lines": self.lines,
+            "held": self.held,
+            "bytes_to_laser": self.bytes_to_laser,
+            "bytes_from_laser": self.bytes_from_laser,
+        }
+        if delays:
+            stats["delay_p50_us"] = round(delays[len(delays) // 2] * 1e6, 1)
+            stats["delay_max_us"] = round(delays[-1] * 1e6, 1)
+        return stats
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info(
+            f"Link proxy: {stats['lines']} lines forwarded ({stats['held']} held for buffer room), "
+            f"{stats['bytes_to_laser'] / 1024:.1f} KiB to the laser, {stats['bytes_from_laser'] / 1024:.1f} KiB back, "
+            f"forwarding delay p50 {stats.get('delay_p50_us', '-')} µs, max {stats.get('delay_max_us', '-')} µs"
+        )
+
+
+class ProxyTransport(SocketTransport):
+    """The monitor's link when the laser is shared: opening it opens the laser link inside the proxy."""
+    def __init__(self, link, proxy):
+        super().__init__()
+        self.link = link
+        self.proxy = proxy
+
+    @property
+    def description(self):
+        return f"{self.link.description}, shared through the link proxy"
+
+    def open(self):
+        self.sock = self.proxy.attach(self.link)
+
+    async def open_async(self, loop):
+        self.sock = await self.proxy.attach_async(self.link)
+        self.sock.setblocking(False)
@@ -0,0 +1,268 @@
+"""
+Live status for dashboards and displays, straight from LaserLink.
+
+    GET /status            latest status of every laser: {"<device>": {...}}
+    GET /status/<device>   latest status of one laser
+    GET /events            Server-Sent Events stream
+    GET /ws                WebSocket stream (text frames)
+
+Both streams take `?device=<name>` to follow one laser. Every message is
+`{"device": ..., "event": ..., "data": ...}`, with event one of status,
+job_started, job_finished or offline; a new client gets the latest status
+of each laser first.
+
+An event is serialized once, into the ready-to-send SSE and WebSocket
+frames, and the same bytes are written to every client, so another client
+costs one socket write. Writes never wait: a client whose unsent data grows
+past `client_buffer` bytes is disconnected instead of holding anything up.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import struct
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from payloads import compact
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+REQUEST_TIMEOUT = 10
+MAX_REQUEST_BYTES = 8192
+
+_compact_json = json.JSONEncoder(separators=(",", ":")).encode
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def websocket_frame(payload, opcode=0x1):
+    """A final, unmasked (server to client) WebSocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def websocket_accept(key):
+    return base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+
+
+class _Client:
+    __slots__ = ("writer", "transport", "device", "websocket")
+
+    def __init__(self, writer, device, websocket):
+        self.writer = writer
+        self.transport = writer.transport
+        self.device = device
+        self.websocket = websocket
+
+
+class LiveServer:
+    def __init__(self, host="0.0.0.0", port=8080, client_buffer=256 * 1024):
+        self.host = host
+        self.port = port
+        self.client_buffer = client_buffer
+        self.clients = set()
+        self.connections = set()
+        self.latest = {} # device -> serialized status
+        self.loop = None
+        self.server = None
+        self.dropped = 0
+        self.metric_clients = metrics.LIVE_CLIENTS
+        self.metric_dropped = metrics.LIVE_CLIENTS_DROPPED
+
+    def start(self):
+        """Runs the server on its own event loop thread. Returns once it listens (port has the real port)."""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.server = self.loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port, limit=MAX_REQUEST_BYTES))
+            except OSError as e:
+                errors.append(e)
+                ready.set()
+                return
+            self.port = self.server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="laserlink-live", daemon=True).start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        logging.info(f"Serving live status on http://{self.host}:{self.port}/status (streams: /events, /ws)")
+        return self
+
+    def stop(self):
+        if self.loop and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _shutdown(self):
+        self.server.close()
+        # Closed connections end their handlers; cancelling them instead upsets asyncio's streams
+        for transport in list(self.connections):
+            transport.abort()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=1)
+
+    def publish(self, device, kind, data):
+        """Thread-safe. Serializes the event once and hands the bytes to the event loop."""
+        if self.loop is None:
+            return
+        body = _compact_json(compact(data)).encode()
+        message = b'{"device":' + _compact_json(device).encode() + b',"event":"' + kind.encode() + b'","data":' + body + b"}"
+        status = body if kind in ("status", "offline") else None
+        self.loop.call_soon_threadsafe(self._broadcast, device, status, b"data: " + message + b"\n\n", websocket_frame(message))
+
+    def _broadcast(self, device, status, sse, ws):
+        if status is not None:
+            self.latest[device] = status
+        limit = self.client_buffer
+        slow = None
+        for client in self.clients:
+            if client.device is not None and client.device != device:
+                continue
+            transport = client.transport
+            if transport.get_write_buffer_size() > limit:
+                slow = slow or []
+                slow.append(client)
+                continue
+            transport.write(ws if client.websocket else sse)
+        if slow:
+            for client in slow:
+                logging.warning(f"Live client {client.writer.get_extra_info('peername')} is too slow, disconnecting it.")
+                self._drop(client)
+                self.dropped += 1
+                self.metric_dropped.inc()
+
+    def _drop(self, client):
+        if client in self.clients:
+            self.clients.discard(client)
+            self.metric_clients.set(len(self.clients))
+        client.transport.abort()
+
+    def _status_document(self, device=None):
+        if device is not None:
+            return self.latest.get(device)
+        return b"{" + b",".join(_compact_json(name).encode() + b":" + body for name, body in self.latest.items()) + b"}"
+
+    async def _handle(self, reader, writer):
+        self.connections.add(writer.transport)
+        try:
+            await self._serve(reader, writer)
+        finally:
+            self.connections.discard(writer.transport)
+
+    async def _serve(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            await self._respond(writer, 400, b"Bad Request")
+            return
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        device = parse_qs(url.query).get("device", [None])[0]
+
+        if method != "GET":
+            await self._respond(writer, 405, b"Method Not Allowed")
+        elif url.path == "/status" or url.path.startswith("/status/"):
+            body = self._status_document(unquote(url.path[len("/status/"):]) or None)
+            if body is None:
+                await self._respond(writer, 404, b"Unknown device")
+            else:
+                await self._respond(writer, 200, body, "application/json")
+        elif url.path == "/events":
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n")
+            await self._stream(reader, writer, device, websocket=False)
+        elif url.path == "/ws":
+            key = headers.get("sec-websocket-key")
+            if headers.get("upgrade", "").lower() != "websocket" or not key:
+                await self._respond(writer, 400, b"Expected a WebSocket upgrade")
+                return
+            writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                         b"Sec-WebSocket-Accept: " + websocket_accept(key).encode() + b"\r\n\r\n")
+            await self._stream(reader, writer, device, websocket=True)
+        else:
+            await self._respond(writer, 404, b"Not Found")
+
+    async def _respond(self, writer, code, body, content_type="text/plain; charset=utf-8"):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}[code]
+        writer.write(f"HTTP/1.1 {code} {reason}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n".encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _stream(self, reader, writer, device, websocket):
+        client = _Client(writer, device, websocket)
+        # Start with what a new display needs to draw
+        for name, body in self.latest.items():
+            if device is None or device == name:
+                message = b'{"device":' + _compact_json(name).encode() + b',"event":"status","data":' + body + b"}"
+                writer.write(websocket_frame(message) if websocket else b"data: " + message + b"\n\n")
+        self.clients.add(client)
+        self.metric_clients.set(len(self.clients))
+        try:
+            if websocket:
+                await self._read_websocket(reader, writer)
+            else:
+                # Nothing is expected from an SSE client; this returns when it disconnects
+                while await reader.read(1024):
+                    pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._drop(client)
+
+    async def _read_websocket(self, reader, writer):
+        """Answers pings and the closing handshake; anything the client sends is ignored."""
+        while True:
+            first, second = await reader.readexactly(2)
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await reader.readexactly(8))[0]
+            mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+            if length > MAX_REQUEST_BYTES:
+                return
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+            if opcode == 0x8:
+                writer.write(websocket_frame(payload[:2], 0x8))
+                return
+            if opcode == 0x9:
+                writer.write(websocket_frame(payload, 0xA))
+
+
+def shared(host, port, client_buffer=256 * 1024):
+    """The live server on host:port, started on first use (every laser of a process shares it)."""
+    with _servers_lock:
+        server = _servers.get((host, port))
+        if server is None:
+            server = _servers[(host, port)] = LiveServer(host, port, client_buffer).start()
+        return server
@@ -0,0 +1,262 @@
+"""
+Prometheus metrics for the monitor itself.
+
+A small, dependency-free implementation of counters, gauges and histograms
+rendered in the Prometheus text format (which OpenMetrics scrapers accept).
+Callers resolve labelled children once (e.g. per device at startup), so the
+hot path is a bisect and an add. Children can be written from several
+threads (the asyncio loop, the processing executor, the notifier), so
+increments and observations take the child's lock; a gauge set is a single
+store. A scrape copies the children under the metric's lock, and a
+histogram's buckets and sum under the child's.
+"""
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds, from sub-millisecond parsing up to slow Bluetooth round trips
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.children[()] = self._child()
+
+    def labels(self, *values):
+        """Returns the child for these label values. Resolve it once, outside the hot path."""
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            # labels() may add a child from another thread meanwhile
+            children = sorted(self.children.items())
+        for values, child in children:
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def _samples(self, values, child):
+        return [f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _Value()
+
+    def set(self, value):
+        self.children[()].set(value)
+
+    def _samples(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # The last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def _samples(self, values, child):
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+POLL_RTT = REGISTRY.register(Histogram(
+    "laserlink_poll_rtt_seconds", "Time from sending '?' to receiving its status report.", ("device",)))
+PARSE_DURATION = REGISTRY.register(Histogram(
+    "laserlink_parse_seconds", "Time spent in parse_response per status line.", ("device",)))
+PUBLISH_DURATION = REGISTRY.register(Histogram(
+    "laserlink_mqtt_publish_seconds", "Time to encode a status and hand it to the MQTT client.", ("device",)))
+TELEGRAM_LATENCY = REGISTRY.register(Histogram(
+    "laserlink_telegram_delivery_seconds", "Time from queueing a Telegram message to its delivery."))
+
+LINK_RECOVERY = REGISTRY.register(Histogram(
+    "laserlink_link_recovery_seconds", "Time from losing the laser link to the first status after reconnecting.",
+    ("device",), buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)))
+
+CONNECTS = REGISTRY.register(Counter(
+    "laserlink_connects", "Successful connections to the laser.", ("device",)))
+RECONNECTS = REGISTRY.register(Counter(
+    "laserlink_reconnects", "Connections to the laser after the first one.", ("device",)))
+SOCKET_ERRORS = REGISTRY.register(Counter(
+    "laserlink_socket_errors", "Failed connection attempts and lost connections.", ("device",)))
+PARSE_FAILURES = REGISTRY.register(Counter(
+    "laserlink_parse_failures", "Lines starting with '<' that could not be parsed.", ("device",)))
+LINES_SKIPPED = REGISTRY.register(Counter(
+    "laserlink_status_skipped", "Stale status reports superseded by a newer one in the same batch.", ("device",)))
+LINES_DROPPED = REGISTRY.register(Counter(
+    "laserlink_lines_dropped", "Status reports dropped because processing fell behind (async run mode).", ("device",)))
+JOBS = REGISTRY.register(Counter(
+    "laserlink_jobs", "Jobs completed.", ("device",)))
+
+STATE = REGISTRY.register(Gauge(
+    "laserlink_state", "1 for the current detailed status of the laser, 0 for the others.", ("device", "state")))
+JOB_IN_PROGRESS = REGISTRY.register(Gauge(
+    "laserlink_job_in_progress", "1 while a job is running.", ("device",)))
+CONNECTED = REGISTRY.register(Gauge(
+    "laserlink_connected", "1 while the link to the laser is open.", ("device",)))
+POLL_INTERVAL = REGISTRY.register(Gauge(
+    "laserlink_poll_interval_seconds", "Current poll interval.", ("device",)))
+
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "laserlink_queue_depth", "Items waiting between pipeline stages: 'lines' before parsing, or a sink's queue.",
+    ("device", "stage")))
+QUEUE_DROPPED = REGISTRY.register(Counter(
+    "laserlink_queue_dropped", "Events dropped because a sink's queue was full.", ("device", "stage")))
+
+SAFETY_LATENCY = REGISTRY.register(Histogram(
+    "laserlink_safety_publish_seconds", "Time from reading a safety state off the link to handing it to the MQTT client.",
+    ("device",), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)))
+SAFETY_EVENTS = REGISTRY.register(Counter(
+    "laserlink_safety_events", "Changes into a safety state (Alarm, Door, Hold).", ("device", "state")))
+
+PROXY_BYTES = REGISTRY.register(Counter(
+    "laserlink_proxy_bytes", "Bytes through the link proxy, by direction (to_laser, from_laser).", ("device", "direction")))
+PROXY_FORWARD_DELAY = REGISTRY.register(Histogram(
+    "laserlink_proxy_forward_seconds", "Time from a client's bytes reaching the link proxy to their write to the laser.",
+    ("device",), buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 1.0)))
+PROXY_CLIENTS = REGISTRY.register(Gauge(
+    "laserlink_proxy_clients", "Control software connected to the link proxy.", ("device",)))
+
+LIVE_CLIENTS = REGISTRY.register(Gauge(
+    "laserlink_live_clients", "Clients connected to the live status streams."))
+LIVE_CLIENTS_DROPPED = REGISTRY.register(Counter(
+    "laserlink_live_clients_dropped", "Live stream clients disconnected for not keeping up."))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host, port, registry=REGISTRY):
+    """Serves /metrics on a background thread. Returns the server (server_address has the real port)."""
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="laserlink-metrics", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -1,35 +1,190 @@
 import sys
 import time
-import re
 import socket
-import json
-import requests
+import asyncio
 import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import paho.mqtt.client as mqtt
 from config import Config
+from grbl import parse_status, FieldCache
+from scheduler import PollClock, JitterStats, AdaptivePoller, ReconnectBackoff
+from publish_policy import PublishPolicy
+from payloads import PayloadEncoder
+from pipeline import Pipeline
+from notifier import TelegramNotifier
+from framing import LineFramer
+from recorder import SessionRecorder, read_records
+from transport import create_transport
+from linkproxy import LinkProxy, ProxyTransport
+from telemetry import TelemetryBuffer
+from toolpath import Toolpath
+from safety import SafetyLane
+from discovery import DiscoveryRegistry
+from controller import ControllerCache
+from history import JobHistory
+from outbox import DiskOutbox, BufferedPublisher
+import metrics
 
-class LaserMonitor:
-    def __init__(self, config_path="config.yaml"):
-        self.cfg = Config(config_path)
-        
-        # Configure Logging
-        logging.basicConfig(
-            level=getattr(logging, self.cfg.log_level, logging.INFO),
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+# asyncio run mode
+LINE_QUEUE_SIZE = 64
+POLL_STATS_INTERVAL = 60 # Seconds between jitter reports
 
-        valid, msg = self.cfg.validate()
-        if not valid:
-            logging.error(f"Configuration Error: {msg}")
-            sys.exit(1)
+PUBLISH_STATS_INTERVAL = 600 # Seconds between publish policy reports
 
-        self.mqtt_client = None
+# Sent while the laser can't be reached, with the time added; shared, so never changed in place
+OFFLINE_STATUS = {
+    "state": "Offline",
+    "detailed_status": "Offline",
+    "job_in_progress": False,
+    "laser_power_pct": 0,
+    "feed_rate": 0,
+    "spindle_speed": 0,
+    "mpos": {"x": 0, "y": 0, "z": 0},
+}
+
+def load_config(config_path):
+    cfg = Config(config_path)
+
+    # Configure Logging
+    logging.basicConfig(
+        level=getattr(logging, cfg.log_level, logging.INFO),
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    valid, msg = cfg.validate()
+    if not valid:
+        logging.error(f"Configuration Error: {msg}")
+        sys.exit(1)
+    return cfg
+
+def disable_nagle(client):
+    """
+    Sends small publishes as soon as they are written. With Nagle's algorithm a
+    QoS 1 publish can wait for the ACK of the previous one, 20-40 ms on Linux.
+    """
+    sock = client.socket()
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+class LineQueue(asyncio.Queue):
+    """Queue between the link reader and the parser that can replace its newest status report."""
+
+    def collapse(self, line):
+        """
+        Puts the status report ``line`` in place of the newest queued line if that
+        is a status report too, then only the fresher one is worth parsing.
+        Returns False, leaving the queue alone, for anything else: replies and
+        alarms are never dropped.
+        """
+        if not line.startswith("<") or not self._queue or not self._queue[-1].startswith("<"):
+            return False
+        self._queue[-1] = line
+        return True
+
+class LaserMonitor:
+    def __init__(self, config_path="config.yaml", device=None, mqtt_client=None, notifier=None, history=None):
+        if device is not None:
+            # One laser of a MultiLaserMonitor, which owns logging and the MQTT connection
+            self.cfg = device
+            self.log_prefix = f"[{device.name}] "
+            self.device_name = device.name
+        else:
+            self.cfg = load_config(config_path)
+            self.log_prefix = ""
+            self.device_name = self.cfg.ha_node_id
+
+        self.mqtt_client = mqtt_client
+        self.discovery = None # Home Assistant entities, registered on the first connect
+        self.notifier = notifier
+        self.history = history
+        self.availability_topic = f"{self.cfg.mqtt_topic}/availability"
         self.last_state = "Idle" # Assume Idle initially
         self.last_detailed_status = "Idle"
         self.job_in_progress = False
+        self.last_wco = None
+        self.derived_mpos = (None, None, None) # (wpos, wco, mpos) of the last MPos derived from WPos
+        self.fields = FieldCache() # Unchanged status fields are shared between polls
+        self.max_spindle_speed = self.cfg.max_spindle_speed # Replaced by $30 once it is known
 
-        if self.cfg.mqtt_enabled:
+        # Change-driven publishing (None publishes every poll)
+        self.publish_policy = None
+        if self.cfg.publish_on_change:
+            self.publish_policy = PublishPolicy(
+                deadband_mpos=float(self.cfg.publish_deadband_mpos),
+                deadband_power=float(self.cfg.publish_deadband_power),
+                deadband_feed=float(self.cfg.publish_deadband_feed),
+                heartbeat_interval=float(self.cfg.publish_heartbeat)
+            )
+        self.next_publish_stats = time.monotonic() + PUBLISH_STATS_INTERVAL
+        self.payloads = PayloadEncoder(self.cfg.payload_format, self.cfg.mqtt_topic)
+
+        # Adaptive polling (None polls every polling_interval)
+        self.poller = None
+        if self.cfg.adaptive_polling:
+            self.poller = AdaptivePoller(self.cfg.polling_interval, self.cfg.poll_intervals)
+        self.poll_sent_at = None # Monotonic time of the last unanswered '?'
+        self.unanswered_since = None # Monotonic time of the oldest unanswered '?'
+
+        # Laser link recovery. The MQTT connection lives on independently.
+        self.backoff = ReconnectBackoff(max_delay=float(self.cfg.reconnect_max_delay))
+        self.link_down_since = None
+        self.last_recovery = None # Seconds from losing the link to the first status after reconnecting
+
+        # Recent samples and running totals for the job summary
+        self.telemetry = TelemetryBuffer(int(self.cfg.telemetry_capacity))
+        self.toolpath = None
+        if self.cfg.toolpath_max_points:
+            self.toolpath = Toolpath(int(self.cfg.toolpath_max_points), float(self.cfg.toolpath_resolution))
+        self.job_started_at = None
+
+        # Raw session recording for offline replay
+        self.recorder = SessionRecorder(self.cfg.record_path) if self.cfg.record_path else None
+
+        # asyncio run mode statistics
+        self.poll_stats = JitterStats()
+        self.polls_missed = 0
+        self.lines_dropped = 0
+        self.status_skipped = 0 # Stale status reports superseded by a newer one
+
+        # Metric children for this device, resolved once to keep the hot path cheap
+        self.connections = 0
+        self.metric_rtt = metrics.POLL_RTT.labels(self.device_name)
+        self.metric_parse = metrics.PARSE_DURATION.labels(self.device_name)
+        self.metric_publish = metrics.PUBLISH_DURATION.labels(self.device_name)
+        self.metric_parse_failures = metrics.PARSE_FAILURES.labels(self.device_name)
+        self.metric_skipped = metrics.LINES_SKIPPED.labels(self.device_name)
+        self.metric_dropped = metrics.LINES_DROPPED.labels(self.device_name)
+        self.metric_lines_queued = metrics.QUEUE_DEPTH.labels(self.device_name, "lines")
+        self.metric_socket_errors = metrics.SOCKET_ERRORS.labels(self.device_name)
+        self.metric_interval = metrics.POLL_INTERVAL.labels(self.device_name)
+        self.metric_state = None # STATE child currently set to 1
+        self.metric_recovery = metrics.LINK_RECOVERY.labels(self.device_name)
+
+        # Alarm, Door and Hold skip the publish policy and the queues
+        self.safety = SafetyLane(self) if self.cfg.safety_enabled else None
+
+        # Settings and parser state, queried now and then between polls
+        self.controller = None
+        if self.cfg.query_interval:
+            self.controller = ControllerCache(self, self.cfg.query_interval)
+
+        # Shares the laser link with control software such as LightBurn
+        self.proxy = None
+        if self.cfg.proxy_port or self.cfg.proxy_pty:
+            self.proxy = LinkProxy.from_config(self.cfg, self.device_name).start()
+
+        if device is None and self.cfg.mqtt_enabled:
             self.setup_mqtt()
+        if device is None and self.cfg.telegram_enabled:
+            self.notifier = TelegramNotifier.from_config(self.cfg)
+            self.notifier.start()
+        if device is None and self.cfg.history_path:
+            self.history = JobHistory.from_config(self.cfg)
+            self.history.start()
+
+        # Sinks for statuses and job events, each behind its own queue
+        self.pipeline = Pipeline.from_config(self)
 
     def setup_mqtt(self):
         self.mqtt_client = mqtt.Client()
@@ -38,33 +193,67 @@ class LaserMonitor:
         
         # Last Will and Testament (LWT)
         # Publish "offline" to availability topic if we disconnect unexpectedly
-        availability_topic = f"{self.cfg.mqtt_topic}/availability"
+        availability_topic = self.availability_topic
         self.mqtt_client.will_set(availability_topic, "offline", retain=True)
 
         def on_connect(client, userdata, flags, rc):
             if rc == 0:
                 logging.info("Connected to MQTT Broker")
+                disable_nagle(client)
                 # Publish "online" to availability topic
                 client.publish(availability_topic, "online", retain=True)
+                # The broker may have lost retained field topics
+                self.payloads.reset()
+                if self.safety:
+                    self.safety.republish()
                 
                 if self.cfg.ha_enabled:
-                    self.publish_ha_discovery()
+                    self.sync_ha_discovery()
+                if isinstance(self.mqtt_client, BufferedPublisher):
+                    self.mqtt_client.resume()
             else:
                 logging.error(f"Failed to connect, return code {rc}")
 
         self.mqtt_client.on_connect = on_connect
+        if self.cfg.outbox_path:
+            # Buffer to disk instead of dropping statuses while the broker is unreachable
+            self.mqtt_client = BufferedPublisher(self.mqtt_client, DiskOutbox.from_config(self.cfg),
+                                                 batch_size=int(self.cfg.outbox_batch_size))
+            self.mqtt_client.telemetry_topics.add(self.cfg.mqtt_topic)
         
         try:
-            self.mqtt_client.connect(self.cfg.mqtt_broker, self.cfg.mqtt_port, 60)
+            # paho's network loop reconnects on its own, also when the broker is down at startup
+            self.mqtt_client.reconnect_delay_set(min_delay=1, max_delay=30)
+            self.mqtt_client.connect_async(self.cfg.mqtt_broker, self.cfg.mqtt_port, 60)
             self.mqtt_client.loop_start()
         except Exception as e:
             logging.error(f"Could not connect to MQTT Broker: {e}")
             self.mqtt_client = None
 
     def publish_ha_discovery(self):
-        """Publishes Home Assistant Auto-Discovery payloads."""
-        logging.info("Publishing Home Assistant Discovery payloads...")
-        
+        """Publishes the Home Assistant Auto-Discovery configs the broker doesn't hold yet."""
+        if self.discovery is None:
+            self.discovery = self.build_ha_discovery()
+        self.discovery.publish(self.mqtt_client)
+
+    def sync_ha_discovery(self):
+        """
+        After connecting: once the broker's retained configs are in, publishes
+        the ones it lacks or holds outdated and clears stale ones. Publishing
+        before then would resend every config, nothing is known yet.
+        """
+        if self.discovery is None:
+            self.discovery = self.build_ha_discovery()
+        client = self.mqtt_client
+        if isinstance(client, BufferedPublisher):
+            # The sync token must not wait behind an outbox replay
+            client = client.client
+        self.discovery.sync(client)
+
+    def build_ha_discovery(self):
+        """The registry of this laser's Home Assistant entities."""
+        registry = DiscoveryRegistry(self.cfg.ha_discovery_prefix, self.cfg.ha_node_id,
+                                     f"{self.cfg.mqtt_topic}/discovery/sync")
         device_info = {
             "identifiers": [self.cfg.ha_node_id],
             "name": self.cfg.ha_device_name,
@@ -72,64 +261,55 @@ class LaserMonitor:
             "manufacturer": "LaserLink"
         }
 
-        # Helper to publish a sensor config
-        def publish_sensor(object_id, name, value_template, icon=None, unit=None, device_class=None):
-            topic = f"{self.cfg.ha_discovery_prefix}/sensor/{self.cfg.ha_node_id}/{object_id}/config"
+        # Helper to register a sensor config
+        def add_sensor(object_id, name, field, icon=None, unit=None, device_class=None, state=None):
             payload = {
                 "name": f"{self.cfg.ha_device_name} {name}",
-                "state_topic": self.cfg.mqtt_topic,
-                "value_template": value_template,
+                **(state or self.payloads.discovery(field)),
                 "unique_id": f"{self.cfg.ha_node_id}_{object_id}",
                 "device": device_info,
-                "availability_topic": f"{self.cfg.mqtt_topic}/availability" # Optional: Implement LWT later
+                "availability_topic": self.availability_topic
             }
             if icon: payload["icon"] = icon
             if unit: payload["unit_of_measurement"] = unit
             if device_class: payload["device_class"] = device_class
             
-            self.mqtt_client.publish(topic, json.dumps(payload), retain=True)
+            registry.add("sensor", object_id, payload)
 
         # Helper for binary sensor
-        def publish_binary_sensor(object_id, name, value_template, device_class=None):
-            topic = f"{self.cfg.ha_discovery_prefix}/binary_sensor/{self.cfg.ha_node_id}/{object_id}/config"
+        def add_binary_sensor(object_id, name, field, device_class=None, state=None):
             payload = {
                 "name": f"{self.cfg.ha_device_name} {name}",
-                "state_topic": self.cfg.mqtt_topic,
-                "value_template": value_template,
+                **(state or self.payloads.discovery(field, binary=True)),
                 "unique_id": f"{self.cfg.ha_node_id}_{object_id}",
-                "device": device_info,
-                "payload_on": True,
-                "payload_off": False
+                "device": device_info
             }
             if device_class: payload["device_class"] = device_class
             
-            self.mqtt_client.publish(topic, json.dumps(payload), retain=True)
+            registry.add("binary_sensor", object_id, payload)
 
         # Sensors
-        publish_sensor("status", "Status", "{{ value_json.detailed_status }}", icon="mdi:laser-pointer")
-        publish_sensor("laser_power", "Laser Power", "{{ value_json.laser_power_pct }}", unit="%", icon="mdi:flash")
-        publish_sensor("speed", "Speed", "{{ value_json.feed_rate }}", unit="mm/min", icon="mdi:speedometer")
-        publish_sensor("pos_x", "Position X", "{{ value_json.mpos.x }}", unit="mm", icon="mdi:axis-x-arrow")
-        publish_sensor("pos_y", "Position Y", "{{ value_json.mpos.y }}", unit="mm", icon="mdi:axis-y-arrow")
+        add_sensor("status", "Status", ("detailed_status",), icon="mdi:laser-pointer")
+        add_sensor("laser_power", "Laser Power", ("laser_power_pct",), unit="%", icon="mdi:flash")
+        add_sensor("speed", "Speed", ("feed_rate",), unit="mm/min", icon="mdi:speedometer")
+        add_sensor("pos_x", "Position X", ("mpos", "x"), unit="mm", icon="mdi:axis-x-arrow")
+        add_sensor("pos_y", "Position Y", ("mpos", "y"), unit="mm", icon="mdi:axis-y-arrow")
+        if self.controller:
+            # Firmware version, with the settings, parser state and offsets as attributes
+            add_sensor("firmware", "Firmware", None, icon="mdi:chip", state=self.controller.discovery())
         
         # Binary Sensors
-        publish_binary_sensor("job_active", "Job Active", "{{ value_json.job_in_progress }}", device_class="running")
+        add_binary_sensor("job_active", "Job Active", ("job_in_progress",), device_class="running")
+        if self.safety:
+            # Read from the fast lane's own topic, whatever the payload format
+            add_binary_sensor("safety", "Safety", None, device_class="problem", state=self.safety.discovery())
+        return registry
 
-    def send_telegram_notification(self, message):
-        if not self.cfg.telegram_enabled:
+    def send_telegram_notification(self, message, document=None, urgent=False):
+        """Hands the message to the background notifier, so polling never waits on the Telegram API."""
+        if not self.cfg.telegram_enabled or not self.notifier:
             return
-
-        url = f"https://api.telegram.org/bot{self.cfg.telegram_token}/sendMessage"
-        payload = {
-            "chat_id": self.cfg.telegram_chat_id,
-            "text": message
-        }
-        try:
-            response = requests.post(url, json=payload, timeout=5)
-            if response.status_code != 200:
-                logging.error(f"Failed to send Telegram message: {response.text}")
-        except Exception as e:
-            logging.error(f"Error sending Telegram message: {e}")
+        self.notifier.notify(message, document, urgent=urgent)
 
     def parse_response(self, line):
         """
@@ -137,101 +317,83 @@ class LaserMonitor:
         Example: <Run|MPos:34.900,53.963,0.000|FS:1000,100|Ov:100,100,100|A:SF>
         Returns a dictionary with parsed data.
         """
-        data = {"raw": line}
-        
-        # 1. State (Idle, Run, Alarm, etc.)
-        state_match = re.search(r"^<([^|]+)\|", line)
-        if state_match:
-            data["state"] = state_match.group(1)
-        else:
+        start = time.perf_counter()
+        data = parse_status(line, self.max_spindle_speed, self.cfg.framing_threshold, self.fields)
+        if data is None:
+            if line.startswith("<"):
+                self.metric_parse_failures.inc()
             return None
+        self.metric_parse.observe(time.perf_counter() - start)
 
-        # 2. Machine Position (MPos:x,y,z)
-        mpos_match = re.search(r"MPos:([\d.-]+),([\d.-]+),([\d.-]+)", line)
-        if mpos_match:
-            data["mpos"] = {
-                "x": float(mpos_match.group(1)),
-                "y": float(mpos_match.group(2)),
-                "z": float(mpos_match.group(3))
-            }
-
-        # 3. Feed and Spindle (FS:feed,spindle)
-        fs_match = re.search(r"FS:(\d+),(\d+)", line)
-        if fs_match:
-            data["feed_rate"] = int(fs_match.group(1))
-            data["spindle_speed"] = int(fs_match.group(2))
-            # Calculate Laser Power Percentage
-            # Ensure we don't divide by zero if config is weird, though default is 1000
-            max_speed = self.cfg.max_spindle_speed if self.cfg.max_spindle_speed > 0 else 1000
-            data["laser_power_pct"] = round((data["spindle_speed"] / max_speed) * 100, 1)
-            
-        # 4. Accessories (A:SF...)
-        # S = Spindle On, F = Flood Coolant (Air Assist), M = Mist Coolant
-        a_match = re.search(r"\|A:([^|>]+)", line)
-        if a_match:
-            acc_str = a_match.group(1)
-            data["accessories"] = {
-                "spindle_enabled": "S" in acc_str,
-                "flood_coolant": "F" in acc_str,
-                "mist_coolant": "M" in acc_str
-            }
-        else:
-            data["accessories"] = {
-                "spindle_enabled": False,
-                "flood_coolant": False,
-                "mist_coolant": False
-            }
-
-        # Derived status: Is the laser actually firing or framing?
-        if data["state"] == "Run":
-            spindle = data.get("spindle_speed", 0)
-            coolant_on = data["accessories"]["flood_coolant"] or data["accessories"]["mist_coolant"]
-            
-            if spindle == 0:
-                data["detailed_status"] = "Moving"
-            else:
-                # Spindle is ON (>0)
-                # If Coolant is ON, it's likely a job (Lasering)
-                # If Spindle > Threshold, it's likely a job (Lasering)
-                # Otherwise, it's Framing
-                if coolant_on or spindle > self.cfg.framing_threshold:
-                    data["detailed_status"] = "Lasering"
-                else:
-                    data["detailed_status"] = "Framing"
-        else:
-            data["detailed_status"] = data["state"]
+        # Controllers configured with $10=0 report WPos instead of MPos.
+        # WCO is only sent every few reports, so remember the last one to derive MPos.
+        if "wco" in data:
+            self.last_wco = data["wco"]
+        if "mpos" not in data and "wpos" in data and self.last_wco:
+            wpos, wco, mpos = self.derived_mpos
+            if wpos is not data["wpos"] or wco is not self.last_wco:
+                wpos, wco = data["wpos"], self.last_wco
+                mpos = {axis: round(value + wco.get(axis, 0.0), 3) for axis, value in wpos.items()}
+                self.derived_mpos = (wpos, wco, mpos)
+            data["mpos"] = mpos
 
         return data
 
     def handle_state_change(self, parsed_data):
         current_state = parsed_data["state"]
         current_detailed = parsed_data.get("detailed_status", current_state)
-        
-        # Publish to MQTT
-        if self.mqtt_client:
-            # Add timestamp
-            parsed_data["timestamp"] = time.time()
-            # Add job status to MQTT
-            parsed_data["job_in_progress"] = self.job_in_progress
-            try:
-                payload = json.dumps(parsed_data)
-                self.mqtt_client.publish(self.cfg.mqtt_topic, payload)
-            except Exception as e:
-                logging.error(f"Error publishing to MQTT: {e}")
+        if current_state == "Alarm" and self.last_state != "Alarm" and self.controller:
+            self.controller.invalidate()
+
+        mpos = parsed_data.get("mpos")
+        if mpos:
+            self.telemetry.append(time.monotonic(), mpos["x"], mpos["y"], mpos.get("z", 0.0),
+                                  parsed_data.get("feed_rate", 0), parsed_data.get("laser_power_pct", 0),
+                                  current_detailed == "Lasering")
+            if self.job_in_progress and self.toolpath is not None:
+                self.toolpath.append(mpos["x"], mpos["y"], current_detailed == "Lasering")
+
+        # Hand the status to the sinks (MQTT, history, ...)
+        parsed_data["timestamp"] = time.time()
+        parsed_data["job_in_progress"] = self.job_in_progress
+        self.pipeline.emit("status", parsed_data)
+        if self.publish_policy:
+            now = time.monotonic()
+            if now >= self.next_publish_stats:
+                self.log_publish_stats()
+                self.next_publish_stats = now + PUBLISH_STATS_INTERVAL
 
         # Job State Machine
         # 1. Start Job: If we hit "Lasering" and we weren't in a job.
         if current_detailed == "Lasering" and not self.job_in_progress:
-            logging.info("Job Started! Sending notification...")
+            logging.info(f"{self.log_prefix}Job Started! Sending notification...")
             self.job_in_progress = True
-            self.send_telegram_notification(self.cfg.telegram_message_started)
+            self.job_started_at = time.time()
+            metrics.JOB_IN_PROGRESS.labels(self.device_name).set(1)
+            self.telemetry.reset_totals()
+            if self.toolpath is not None:
+                self.toolpath.reset()
+                if mpos:
+                    self.toolpath.append(mpos["x"], mpos["y"], True)
+            self.pipeline.emit("job_started", {"started": self.job_started_at})
 
         # 2. End Job: If we hit "Idle" and we WERE in a job.
         elif current_detailed == "Idle" and self.job_in_progress:
-             logging.info("Job Completed! Sending notification...")
+             logging.info(f"{self.log_prefix}Job Completed! Sending notification...")
              self.job_in_progress = False
-             self.send_telegram_notification(self.cfg.telegram_message_completed)
+             metrics.JOB_IN_PROGRESS.labels(self.device_name).set(0)
+             metrics.JOBS.labels(self.device_name).inc()
+             if self.toolpath is not None and len(self.toolpath):
+                 # Ahead of the summary, so sinks can keep it with the job
+                 self.pipeline.emit("toolpath", {"started": self.job_started_at, "toolpath": self.toolpath.snapshot()})
+             self.pipeline.emit("job_finished", self.job_summary())
         
+        if self.poller:
+            self.poller.observe(current_detailed)
+
+        if self.metric_state is None or current_detailed != self.last_detailed_status:
+            self.set_state_metric(current_detailed)
+
         # 3. Travel Moves (Moving):
         # If we are "Moving", we just stay in whatever job state we were in.
         # If job_in_progress was True, it stays True (traveling during job).
@@ -240,97 +402,542 @@ class LaserMonitor:
         self.last_state = current_state
         self.last_detailed_status = current_detailed
 
+    def set_state_metric(self, status):
+        if self.metric_state:
+            self.metric_state.set(0)
+        self.metric_state = metrics.STATE.labels(self.device_name, status)
+        self.metric_state.set(1)
+
+    def create_link(self):
+        """The laser link, through the link proxy when it is shared."""
+        link = create_transport(self.cfg)
+        if self.proxy:
+            return ProxyTransport(link, self.proxy)
+        return link
+
+    def note_connected(self):
+        self.poll_sent_at = None
+        self.unanswered_since = None
+        self.connections += 1
+        if self.connections > 1:
+            metrics.RECONNECTS.labels(self.device_name).inc()
+        metrics.CONNECTS.labels(self.device_name).inc()
+        metrics.CONNECTED.labels(self.device_name).set(1)
+        if self.controller:
+            self.controller.reset()
+
+    def job_summary(self):
+        """Statistics of the job that just ended, as published to <topic>/job (retained)."""
+        ended = time.time()
+        summary = {
+            "started": self.job_started_at,
+            "ended": ended,
+            "duration_s": round(ended - self.job_started_at, 1) if self.job_started_at else None,
+        }
+        summary.update(self.telemetry.summary())
+        logging.info(
+            f"{self.log_prefix}Job summary: {summary['duration_s']} s, lasering {summary['lasering_s']} s, "
+            f"travel {summary['travel_mm']} mm, mean power {summary['mean_power_pct']}%, peak feed {summary['peak_feed']}"
+        )
+        return summary
+
+    def poll_interval(self):
+        """Seconds until the next status query."""
+        if self.poller:
+            return self.poller.interval
+        return self.cfg.polling_interval
+
+    def note_poll_sent(self, now):
+        if self.poll_sent_at is not None and self.poller:
+            # The previous query was never answered
+            self.poller.record_late()
+        self.poll_sent_at = now
+        if self.unanswered_since is None:
+            self.unanswered_since = now
+
+    def note_status_received(self, now):
+        self.unanswered_since = None
+        if self.link_down_since is not None:
+            self.last_recovery = now - self.link_down_since
+            self.link_down_since = None
+            self.backoff.reset()
+            self.metric_recovery.observe(self.last_recovery)
+            logging.info(f"{self.log_prefix}Laser back online after {self.last_recovery:.1f} s.")
+        if self.poll_sent_at is None:
+            return
+        rtt = now - self.poll_sent_at
+        self.metric_rtt.observe(rtt)
+        if self.poller:
+            self.poller.record_response(rtt)
+        self.poll_sent_at = None
+
+    def handle_line(self, line):
+        """Parses one complete line from the controller and acts on it."""
+        self.handle_lines([line])
+
+    def handle_lines(self, lines, received_at=None, safety_checked=False):
+        """
+        Handles a batch of lines that arrived together.
+        Only the newest of several status reports is acted on. Older ones are
+        parsed (to keep WCO current) and skipped, unless they show a different
+        detailed status than the report after them, so no transition is lost.
+        Safety states are passed to the fast lane first, unless the reader
+        already did (`safety_checked`).
+        """
+        if self.safety and not safety_checked:
+            for line in lines:
+                self.safety.check(line, received_at)
+        statuses = []
+        for line in lines:
+            parsed_data = self.parse_response(line) if line.startswith("<") else None
+            if parsed_data:
+                statuses.append((line, parsed_data))
+            elif self.controller and self.controller.handle(line):
+                continue
+            elif line != "ok":
+                logging.debug(f"Response: {line}")
+
+        for i, (line, parsed_data) in enumerate(statuses):
+            if i + 1 < len(statuses) and statuses[i + 1][1]["detailed_status"] == parsed_data["detailed_status"]:
+                self.status_skipped += 1
+                self.metric_skipped.inc()
+                continue
+            self.handle_status(line, parsed_data)
+
+    def handle_status(self, line, parsed_data):
+        # Print a nice summary
+        status_str = f"State: {parsed_data['state']}"
+        if 'detailed_status' in parsed_data:
+            status_str += f" ({parsed_data['detailed_status']})"
+        if 'mpos' in parsed_data:
+            status_str += f" Pos: {parsed_data['mpos']['x']},{parsed_data['mpos']['y']}"
+
+        if self.cfg.show_raw:
+            status_str += f" | Raw: {line}"
+
+        logging.debug(status_str)
+
+        self.handle_state_change(parsed_data)
+
+    def replay(self, path, speed=1.0):
+        """
+        Feeds a recording made with record_path back through the same framing,
+        parsing and state handling as a live connection.
+        speed is a playback multiplier, None replays as fast as possible.
+        Returns (number of lines, seconds taken).
+        """
+        framer = LineFramer()
+        count = 0
+        start = time.monotonic()
+        for offset, chunk in read_records(path):
+            if not chunk:
+                # New connection in the recording
+                framer.reset()
+                continue
+            if speed:
+                delay = start + offset / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            lines = framer.feed(chunk)
+            self.handle_lines(lines)
+            count += len(lines)
+        return count, time.monotonic() - start
+
+    def log_publish_stats(self):
+        """Logs how many status messages the publish policy saved."""
+        stats = self.publish_policy.stats()
+        logging.info(
+            f"{self.log_prefix}MQTT publish policy: sent {stats['sent']} "
+            f"(heartbeats {stats['heartbeats']}), suppressed {stats['suppressed']} ({stats['suppressed_pct']}%)"
+        )
+
     def publish_offline_status(self):
-        """Publishes an 'Offline' status to MQTT."""
-        if self.mqtt_client:
-            payload = {
-                "state": "Offline",
-                "detailed_status": "Offline",
-                "job_in_progress": False,
-                "laser_power_pct": 0,
-                "feed_rate": 0,
-                "spindle_speed": 0,
-                "mpos": {"x": 0, "y": 0, "z": 0},
-                "timestamp": time.time()
-            }
-            try:
-                logging.info("Publishing Offline status to MQTT...")
-                self.mqtt_client.publish(self.cfg.mqtt_topic, json.dumps(payload))
-            except Exception as e:
-                logging.error(f"Error publishing Offline status: {e}")
+        """Publishes an 'Offline' status to the sinks."""
+        metrics.CONNECTED.labels(self.device_name).set(0)
+        self.set_state_metric("Offline")
+        if self.link_down_since is None:
+            self.link_down_since = time.monotonic()
+        # Whatever the laser does until it is back is not lasering time of the job
+        self.telemetry.mark_gap()
+        self.pipeline.emit("offline", dict(OFFLINE_STATUS, timestamp=time.time()))
 
     def run(self):
-        logging.info(f"Connecting to {self.cfg.bluetooth_mac} on channel {self.cfg.rfcomm_port}...")
+        link = self.create_link()
+        logging.info(f"Connecting to {link.description}...")
+        
+        try:
+            while True:
+                connected = False
+                try:
+                    link.open()
+                    connected = True
+                    # A laser that disappears without closing the link must not block recv forever
+                    link.settimeout(self.cfg.link_timeout)
+                    logging.info("Connected. Starting polling loop...")
+                    self.note_connected()
+                    self._poll_sync(link)
+                except socket.error as e:
+                    logging.error(f"Socket error: {e}" if connected else f"Connection failed: {e}")
+                    self.metric_socket_errors.inc()
+                finally:
+                    link.close()
+
+                # Only the laser link is retried, MQTT keeps its own connection and network loop
+                self.publish_offline_status()
+                delay = self.backoff.next_delay()
+                logging.info(f"Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+        except KeyboardInterrupt:
+            logging.info("\nStopping...")
+        finally:
+            self.pipeline.close()
+            if self.notifier:
+                self.notifier.stop()
+            if self.history:
+                self.history.stop()
+            if self.recorder:
+                self.recorder.close()
+            if self.proxy:
+                self.proxy.stop()
+            if self.mqtt_client:
+                self.mqtt_client.loop_stop()
+
+    def _poll_sync(self, link):
+        """Polls until the laser closes the link. Socket errors are raised."""
+        framer = LineFramer()
+        if self.recorder:
+            self.recorder.mark_session()
         
         while True:
-            sock = None
-            try:
-                sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
-                sock.connect((self.cfg.bluetooth_mac, self.cfg.rfcomm_port))
-                logging.info("Connected. Starting polling loop...")
-                
-                buffer = ""
-                
-                while True:
-                    try:
-                        sock.send(b"?\n")
-                        
-                        data = sock.recv(1024).decode('utf-8')
-                        if not data:
-                            logging.warning("Connection closed by remote device.")
-                            self.publish_offline_status()
-                            break
-                            
-                        buffer += data
-                        
-                        while '\n' in buffer:
-                            line, buffer = buffer.split('\n', 1)
-                            line = line.strip()
-                            if not line:
-                                continue
-                                
-                            parsed_data = self.parse_response(line)
-                            if parsed_data:
-                                # Print a nice summary
-                                status_str = f"State: {parsed_data['state']}"
-                                if 'detailed_status' in parsed_data:
-                                    status_str += f" ({parsed_data['detailed_status']})"
-                                if 'mpos' in parsed_data:
-                                    status_str += f" Pos: {parsed_data['mpos']['x']},{parsed_data['mpos']['y']}"
-                                
-                                if self.cfg.show_raw:
-                                    status_str += f" | Raw: {line}"
-                                    
-                                logging.debug(status_str)
-                                
-                                self.handle_state_change(parsed_data)
-                            elif line != "ok":
-                                logging.debug(f"Response: {line}")
-                        
-                        time.sleep(self.cfg.polling_interval)
-                        
-                    except socket.error as e:
-                        logging.error(f"Socket error: {e}")
-                        self.publish_offline_status()
-                        break
-                        
-            except socket.error as e:
-                logging.error(f"Connection failed: {e}")
+            self.note_poll_sent(time.monotonic())
+            link.send(b"?\n")
+            
+            data = link.recv(1024)
+            if not data:
+                logging.warning("Connection closed by remote device.")
+                return
+            received_at = time.perf_counter()
+            # Take everything that is already waiting, not just one read per poll
+            data += link.recv_pending()
+            if self.recorder:
+                self.recorder.write(data)
+            
+            lines = framer.feed(data)
+            if any(line.startswith("<") for line in lines):
+                self.note_status_received(time.monotonic())
+            self.handle_lines(lines, received_at)
+            if self.controller:
+                # Between this poll and the next, so the poll rate is unchanged
+                query = self.controller.next_query(time.monotonic(), self.last_state)
+                if query:
+                    link.send(query)
+            
+            interval = self.poll_interval()
+            self.metric_interval.set(interval)
+            time.sleep(interval)
+
+    def run_async(self):
+        """
+        asyncio run mode.
+        A scheduler task sends '?' on a fixed clock, a reader task drains the socket
+        and a processing task handles complete lines, so a slow recv or a slow sink
+        no longer stretches the poll period.
+        """
+        logging.info(f"Connecting to {self.create_link().description} (asyncio mode)...")
+        try:
+            asyncio.run(self._run_async())
+        except KeyboardInterrupt:
+            logging.info("\nStopping...")
+        finally:
+            self.pipeline.close()
+            if self.notifier:
+                self.notifier.stop()
+            if self.history:
+                self.history.stop()
+            if self.recorder:
+                self.recorder.close()
+            if self.proxy:
+                self.proxy.stop()
+            if self.mqtt_client:
+                self.mqtt_client.loop_stop()
+
+    async def _run_async(self, executor=None):
+        loop = asyncio.get_running_loop()
+        # Processing runs on a worker thread: blocking sinks (MQTT, Telegram) can't stall
+        # the scheduler, and lines stay in order because each one is awaited before the next.
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="laserlink-process")
+        try:
+            while True:
+                link = self.create_link()
+                try:
+                    await link.open_async(loop)
+                    logging.info(f"{self.log_prefix}Connected to {link.description}. Starting asyncio polling loop...")
+                    self.note_connected()
+                    await self._poll_session(loop, link, executor)
+                except OSError as e:
+                    logging.error(f"{self.log_prefix}Connection lost: {e}")
+                    self.metric_socket_errors.inc()
+                finally:
+                    link.close()
+                    self.log_poll_stats()
+
+                # Safe on the loop thread: the session has waited for its last batch
                 self.publish_offline_status()
-                logging.info(f"Retrying in 5 seconds...")
-                time.sleep(5)
-            except KeyboardInterrupt:
-                logging.info("\nStopping...")
-                break
+                delay = self.backoff.next_delay()
+                logging.info(f"{self.log_prefix}Retrying in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+        finally:
+            if own_executor:
+                executor.shutdown(wait=False)
+
+    async def _poll_session(self, loop, link, executor):
+        lines = LineQueue(maxsize=LINE_QUEUE_SIZE)
+        self.poll_stats.reset()
+        tasks = [
+            asyncio.create_task(self._poll_scheduler(loop, link)),
+            asyncio.create_task(self._link_reader(loop, link, lines)),
+            asyncio.create_task(self._line_processor(loop, lines, executor)),
+            asyncio.create_task(self._link_watchdog(loop))
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _poll_scheduler(self, loop, link):
+        clock = self.poll_clock = PollClock(self.poll_interval(), loop.time())
+        self.poll_wakeup = asyncio.Event()
+        next_report = loop.time() + POLL_STATS_INTERVAL
+        sent_at = loop.time()
+        while True:
+            deadline = clock.next_deadline
+            delay = deadline - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.poll_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    # A state transition shortened the poll interval
+                    self.poll_wakeup.clear()
+                    clock.retime(self.poll_interval(), sent_at)
+                    continue
+            sent_at = loop.time()
+            self.note_poll_sent(sent_at)
+            await link.send_async(loop, b"?\n")
+            self.poll_stats.record(deadline, sent_at)
+            if self.controller:
+                query = self.controller.next_query(time.monotonic(), self.last_state)
+                if query:
+                    await link.send_async(loop, query)
+            clock.interval = self.poll_interval()
+            self.metric_interval.set(clock.interval)
+            clock.advance(loop.time())
+            self.polls_missed = clock.missed
+
+            if sent_at >= next_report:
+                self.log_poll_stats()
+                next_report = sent_at + POLL_STATS_INTERVAL
+
+    async def _link_watchdog(self, loop):
+        """Drops the link when a query stays unanswered for link_timeout, e.g. after a laser power-cycle."""
+        timeout = self.cfg.link_timeout
+        while True:
+            since = self.unanswered_since
+            if since is None:
+                await asyncio.sleep(timeout)
+                continue
+            remaining = since + timeout - loop.time()
+            if remaining <= 0:
+                raise ConnectionError(f"No reply from the laser for {timeout:.1f} s.")
+            await asyncio.sleep(remaining)
+
+    async def _link_reader(self, loop, link, lines):
+        framer = LineFramer()
+        dropping = False
+        if self.recorder:
+            self.recorder.mark_session()
+        while True:
+            data = await link.recv_async(loop, 1024)
+            if not data:
+                # Let the processor finish what was already received
+                await lines.join()
+                raise ConnectionError("Connection closed by remote device.")
+            received_at = time.perf_counter()
+            if self.recorder:
+                self.recorder.write(data)
+            for line in framer.feed(data):
+                if self.safety:
+                    # Straight from the reader, ahead of the line queue
+                    self.safety.check(line, received_at)
+                if line.startswith("<"):
+                    self.note_status_received(loop.time())
+                if not lines.full():
+                    lines.put_nowait(line)
+                    continue
+                # Processing fell behind: a status report stands in for the one before it,
+                # anything else waits for room
+                if lines.collapse(line):
+                    self.lines_dropped += 1
+                    self.metric_dropped.inc()
+                    log = logging.debug if dropping else logging.warning
+                    log(f"{self.log_prefix}Line queue full, dropped status report {self.lines_dropped}: {line}")
+                    dropping = True
+                else:
+                    await lines.put(line)
+            if not lines.full():
+                dropping = False
+            self.metric_lines_queued.set(lines.qsize())
+
+    async def _line_processor(self, loop, lines, executor):
+        while True:
+            # Everything queued while the last batch was processed is handled together
+            batch = [await lines.get()]
+            while not lines.empty():
+                batch.append(lines.get_nowait())
+            self.metric_lines_queued.set(0)
+            done = loop.run_in_executor(executor, functools.partial(self.handle_lines, batch, safety_checked=True))
+            try:
+                await asyncio.shield(done)
+            except asyncio.CancelledError:
+                # The worker thread can't be interrupted: wait for the batch, so the offline
+                # handling after the session never writes the telemetry buffer alongside it
+                await asyncio.wait([done])
+                raise
             finally:
-                if sock:
-                    sock.close()
-                if self.mqtt_client:
-                    self.mqtt_client.loop_stop()
-                
-                if sys.exc_info()[0] == KeyboardInterrupt:
-                    break
+                for _ in batch:
+                    lines.task_done()
+            if self.poller and self.poller.interval < self.poll_clock.interval:
+                self.poll_wakeup.set()
+
+    def log_poll_stats(self):
+        """Logs the poll jitter achieved by the asyncio scheduler."""
+        stats = self.poll_stats.summary()
+        if not stats["samples"]:
+            return
+        logging.info(
+            f"{self.log_prefix}Poll jitter over {stats['samples']} polls: "
+            f"p50 {stats['lateness_p50_ms']} ms, p99 {stats['lateness_p99_ms']} ms, max {stats['lateness_max_ms']} ms, "
+            f"period {stats.get('period_mean_ms', '-')} ± {stats.get('period_stddev_ms', '-')} ms, "
+            f"missed {self.polls_missed}, dropped statuses {self.lines_dropped}, skipped stale {self.status_skipped}"
+        )
+
+class MultiLaserMonitor:
+    """
+    Monitors every laser in the devices list of config.yaml.
+    Each device gets its own LaserMonitor (state machine, topic and HA node id),
+    and all of them share one asyncio event loop and one MQTT connection.
+    """
+    def __init__(self, config_path="config.yaml"):
+        self.cfg = load_config(config_path)
+        self.mqtt_client = None
+        self.availability_topic = f"{self.cfg.mqtt_topic}/availability"
+        # One notifier and one HTTP session for all devices
+        self.notifier = None
+        if self.cfg.telegram_enabled:
+            self.notifier = TelegramNotifier.from_config(self.cfg)
+            self.notifier.start()
+        # One history database and writer thread for all devices
+        self.history = None
+        if self.cfg.history_path:
+            self.history = JobHistory.from_config(self.cfg)
+            self.history.start()
+        self.monitors = [LaserMonitor(device=device, notifier=self.notifier, history=self.history)
+                         for device in self.cfg.devices]
+        for monitor in self.monitors:
+            # One connection can only have one Last Will, so every device shares the bridge's availability
+            monitor.availability_topic = self.availability_topic
+
+        if self.cfg.mqtt_enabled:
+            self.setup_mqtt()
+            for monitor in self.monitors:
+                monitor.mqtt_client = self.mqtt_client
+
+    def setup_mqtt(self):
+        self.mqtt_client = mqtt.Client()
+        if self.cfg.mqtt_username and self.cfg.mqtt_password:
+            self.mqtt_client.username_pw_set(self.cfg.mqtt_username, self.cfg.mqtt_password)
+
+        # Last Will and Testament (LWT)
+        self.mqtt_client.will_set(self.availability_topic, "offline", retain=True)
+
+        def on_connect(client, userdata, flags, rc):
+            if rc == 0:
+                logging.info("Connected to MQTT Broker")
+                disable_nagle(client)
+                client.publish(self.availability_topic, "online", retain=True)
+                for monitor in self.monitors:
+                    # The monitors get the client only once setup is done
+                    monitor.mqtt_client = self.mqtt_client
+                    monitor.payloads.reset()
+                    if monitor.safety:
+                        monitor.safety.republish()
+
+                if self.cfg.ha_enabled:
+                    for monitor in self.monitors:
+                        monitor.sync_ha_discovery()
+                if isinstance(self.mqtt_client, BufferedPublisher):
+                    self.mqtt_client.resume()
+            else:
+                logging.error(f"Failed to connect, return code {rc}")
+
+        self.mqtt_client.on_connect = on_connect
+        if self.cfg.outbox_path:
+            # One outbox for all devices, replayed in the order it was written
+            self.mqtt_client = BufferedPublisher(self.mqtt_client, DiskOutbox.from_config(self.cfg),
+                                                 batch_size=int(self.cfg.outbox_batch_size))
+            self.mqtt_client.telemetry_topics.update(device.mqtt_topic for device in self.cfg.devices)
+
+        try:
+            # paho's network loop reconnects on its own, also when the broker is down at startup
+            self.mqtt_client.reconnect_delay_set(min_delay=1, max_delay=30)
+            self.mqtt_client.connect_async(self.cfg.mqtt_broker, self.cfg.mqtt_port, 60)
+            self.mqtt_client.loop_start()
+        except Exception as e:
+            logging.error(f"Could not connect to MQTT Broker: {e}")
+            self.mqtt_client = None
+
+    def run(self):
+        logging.info(f"Monitoring {len(self.monitors)} lasers: {', '.join(d.name for d in self.cfg.devices)}")
+        try:
+            asyncio.run(self._run())
+        except KeyboardInterrupt:
+            logging.info("\nStopping...")
+        finally:
+            for monitor in self.monitors:
+                monitor.pipeline.close()
+            if self.notifier:
+                self.notifier.stop()
+            if self.history:
+                self.history.stop()
+            for monitor in self.monitors:
+                if monitor.recorder:
+                    monitor.recorder.close()
+                if monitor.proxy:
+                    monitor.proxy.stop()
+            if self.mqtt_client:
+                self.mqtt_client.loop_stop()
+
+    async def _run(self):
+        executor = ThreadPoolExecutor(max_workers=min(4, len(self.monitors)), thread_name_prefix="laserlink-process")
+        try:
+            await asyncio.gather(*(monitor._run_async(executor) for monitor in self.monitors))
+        finally:
+            executor.shutdown(wait=False)
 
 if __name__ == "__main__":
-    monitor = LaserMonitor()
-    monitor.run()
+    if Config().devices:
+        monitor = MultiLaserMonitor()
+        run = monitor.run
+    else:
+        monitor = LaserMonitor()
+        run = monitor.run_async if monitor.cfg.run_mode == "async" else monitor.run
+    if monitor.cfg.metrics_port:
+        metrics.serve(monitor.cfg.metrics_host, monitor.cfg.metrics_port)
+    run()
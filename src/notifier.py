@@ -0,0 +1,197 @@
+"""
+Non-blocking Telegram notifications.
+
+notify() only puts the message on a bounded queue. A background worker
+delivers it over one keep-alive requests.Session, retrying with exponential
+back-off. Messages that arrive within the coalescing window, or while a
+delivery is being retried, are merged into a single Telegram message. A
+message may carry a document (e.g. the job's toolpath SVG); it is then sent
+with sendDocument and the merged text as its caption. Urgent messages
+(safety alarms) skip the coalescing window and go out right away, together
+with whatever was already queued.
+"""
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+import metrics
+
+
+class TelegramNotifier:
+    def __init__(self, token, chat_id, api_url="https://api.telegram.org", queue_size=32,
+                 max_retries=5, retry_base=1.0, retry_max=60.0, coalesce_window=1.0, timeout=5):
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.document_url = f"{api_url.rstrip('/')}/bot{token}/sendDocument"
+        self.chat_id = chat_id
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+
+        # Statistics
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.latencies = deque(maxlen=256)
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            cfg.telegram_token,
+            cfg.telegram_chat_id,
+            api_url=cfg.telegram_api_url,
+            max_retries=int(cfg.telegram_max_retries),
+            coalesce_window=float(cfg.telegram_coalesce_window)
+        )
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._worker, name="laserlink-telegram", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=5):
+        """Delivers what is still queued (within `timeout`) and stops the worker."""
+        if self.thread is None:
+            return
+        self._put((None, time.monotonic(), None, False))
+        self.thread.join(timeout)
+        self.thread = None
+
+    def notify(self, message, document=None, urgent=False):
+        """
+        Queues a message, optionally with a (filename, bytes, mime type) document. Never blocks.
+        An urgent message is sent without waiting for the coalescing window.
+        """
+        self._put((message, time.monotonic(), document, urgent))
+
+    def _put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    # The oldest notification is the least relevant one
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                    logging.warning("Telegram queue full, dropped the oldest message.")
+                except queue.Empty:
+                    pass
+
+    def _drain(self, batch, wait=0):
+        """Moves queued messages into `batch`, waiting up to `wait` seconds for more. Returns False on stop."""
+        deadline = time.monotonic() + wait
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self.queue.get(timeout=remaining)
+                else:
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                return True
+            if item[0] is None:
+                return False
+            batch.append(item)
+            if item[3]:
+                deadline = 0 # Urgent: send what we have now
+
+    def _worker(self):
+        running = True
+        while running:
+            item = self.queue.get()
+            if item[0] is None:
+                break
+            batch = [item]
+            running = self._drain(batch, 0 if item[3] else self.coalesce_window)
+            running = self._deliver(batch) and running
+
+    def _deliver(self, batch):
+        """Sends `batch` as one message, retrying with back-off. Returns False if stopped meanwhile."""
+        running = True
+        delay = self.retry_base
+        for attempt in range(self.max_retries + 1):
+            text = self._merge(batch)
+            document = self._document(batch)
+            try:
+                if document:
+                    # Captions are limited to 1024 characters
+                    response = self.session.post(url=self.document_url, data={"chat_id": self.chat_id, "caption": text[:1024]},
+                                                 files={"document": document}, timeout=self.timeout)
+                else:
+                    response = self.session.post(url=self.url, json={"chat_id": self.chat_id, "text": text}, timeout=self.timeout)
+                if response.status_code == 200:
+                    latency = time.monotonic() - batch[0][1]
+                    self.latencies.append(latency)
+                    metrics.TELEGRAM_LATENCY.observe(latency)
+                    self.sent += 1
+                    self.coalesced += len(batch) - 1
+                    logging.info(f"Telegram message delivered in {latency * 1000:.0f} ms (attempt {attempt + 1}).")
+                    return running
+                if response.status_code == 429:
+                    # Rate limited, Telegram tells us how long to wait
+                    try:
+                        delay = max(delay, float(response.json()["parameters"]["retry_after"]))
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                elif 400 <= response.status_code < 500:
+                    logging.error(f"Failed to send Telegram message: {response.text}")
+                    break
+                self._log_retry(f"Telegram API returned {response.status_code}", attempt, delay)
+            except requests.RequestException as e:
+                self._log_retry(f"Error sending Telegram message: {e}", attempt, delay)
+
+            if attempt == self.max_retries:
+                break
+            # Messages queued during the back-off go out with this one
+            time.sleep(delay * random.uniform(0.8, 1.2))
+            running = self._drain(batch) and running
+            delay = min(self.retry_max, delay * 2)
+
+        self.failed += 1
+        self.coalesced += len(batch) - 1
+        return running
+
+    def _log_retry(self, problem, attempt, delay):
+        if attempt == self.max_retries:
+            logging.error(f"{problem}, giving up after {attempt + 1} attempt(s).")
+        else:
+            logging.warning(f"{problem}, retrying in {delay:.1f}s...")
+
+    def _merge(self, batch):
+        """Joins a burst of messages, skipping consecutive duplicates."""
+        lines = []
+        for message, _, _, _ in batch:
+            if not lines or lines[-1] != message:
+                lines.append(message)
+        return "\n".join(lines)
+
+    def _document(self, batch):
+        """The newest document in a burst; Telegram takes one per message."""
+        documents = [document for _, _, document, _ in batch if document]
+        return documents[-1] if documents else None
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        stats = {
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "queued": self.queue.qsize()
+        }
+        if latencies:
+            stats["latency_p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 1)
+            stats["latency_max_ms"] = round(latencies[-1] * 1000, 1)
+        return stats
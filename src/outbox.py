@@ -0,0 +1,289 @@
+"""
+Disk-backed MQTT outbox for broker outages.
+
+While the broker is unreachable, messages are appended to segment files
+(`00000001.seg`, ...) in the outbox directory instead of piling up in
+paho's memory. Once the connection is back they are replayed in order, in
+batches, each batch waiting for the previous one to be written before the
+next is read. New messages keep going to the outbox until it is empty, so
+nothing overtakes older data.
+
+The outbox is bounded by `max_bytes`. Status telemetry is low priority: it
+is thinned to one message per topic every `telemetry_interval` seconds
+while buffering, and the drop policy decides what goes when the outbox is
+full ("oldest" deletes the oldest segment, "newest" rejects new telemetry
+but still makes room for events such as job summaries).
+
+Record layout: flags (bit 0 retain, bit 1 low priority), qos, topic length,
+payload length (struct "<BBHI"), topic, payload.
+"""
+import logging
+import os
+import struct
+import threading
+import time
+
+HEADER = struct.Struct("<BBHI")
+FLAG_RETAIN = 1
+FLAG_LOW_PRIORITY = 2
+CURSOR_FILE = "cursor"
+
+
+class DiskOutbox:
+    def __init__(self, directory, max_bytes=16 * 1024 * 1024, segment_bytes=1024 * 1024,
+                 drop_policy="oldest", telemetry_interval=5.0):
+        if drop_policy not in ("oldest", "newest"):
+            raise ValueError(f"Unknown drop policy '{drop_policy}'")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Several segments fit in the limit, so evicting one never empties the outbox
+        self.segment_bytes = max(HEADER.size, min(segment_bytes, max_bytes // 4))
+        self.drop_policy = drop_policy
+        self.telemetry_interval = telemetry_interval
+        self.last_telemetry = {} # topic -> monotonic time of the last buffered telemetry message
+
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith(".seg"))
+        self.size = sum(os.path.getsize(self._path(segment)) for segment in self.segments)
+        self.writer = None
+        self.write_segment = None
+
+        # Replay position: (segment, offset) of the next unsent record
+        self.read_segment, self.read_offset = self._load_cursor()
+        self.dropped = 0
+        self.thinned = 0
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            cfg.outbox_path,
+            max_bytes=int(float(cfg.outbox_max_size_mb) * 1024 * 1024),
+            drop_policy=cfg.outbox_drop_policy,
+            telemetry_interval=float(cfg.outbox_telemetry_interval)
+        )
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}.seg")
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), 'r') as f:
+                segment, offset = (int(v) for v in f.read().split())
+            if segment in self.segments:
+                return segment, offset
+        except (OSError, ValueError):
+            pass
+        return (self.segments[0] if self.segments else None), 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", 'w') as f:
+            f.write(f"{self.read_segment or 0} {self.read_offset}")
+        os.replace(path + ".tmp", path)
+
+    @property
+    def empty(self):
+        return not self.segments
+
+    def append(self, topic, payload, qos=0, retain=False, low_priority=False):
+        """Stores one message. Returns False if it was thinned out or dropped by the policy."""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        payload = payload or b""
+        if low_priority:
+            now = time.monotonic()
+            last = self.last_telemetry.get(topic)
+            if last is not None and now - last < self.telemetry_interval:
+                self.thinned += 1
+                return False
+            self.last_telemetry[topic] = now
+
+        topic_bytes = topic.encode('utf-8')
+        record = HEADER.pack((FLAG_RETAIN if retain else 0) | (FLAG_LOW_PRIORITY if low_priority else 0),
+                             qos, len(topic_bytes), len(payload)) + topic_bytes + payload
+        while self.size + len(record) > self.max_bytes:
+            if low_priority and self.drop_policy == "newest":
+                self.dropped += 1
+                return False
+            if not self._evict_oldest():
+                self.dropped += 1
+                return False
+
+        if self.writer is None or self.writer.tell() >= self.segment_bytes:
+            self._roll()
+        self.writer.write(record)
+        self.writer.flush()
+        self.size += len(record)
+        return True
+
+    def _roll(self):
+        if self.writer:
+            self.writer.close()
+        self.write_segment = (self.segments[-1] + 1) if self.segments else 1
+        self.segments.append(self.write_segment)
+        self.writer = open(self._path(self.write_segment), 'ab')
+        if self.read_segment is None:
+            self.read_segment, self.read_offset = self.write_segment, 0
+
+    def _evict_oldest(self):
+        """Deletes the oldest segment. Returns False if only the one being written is left."""
+        if len(self.segments) < 2:
+            return False
+        segment = self.segments.pop(0)
+        path = self._path(segment)
+        size = os.path.getsize(path)
+        self.size -= size
+        self.dropped += 1
+        os.remove(path)
+        logging.warning(f"MQTT outbox full, dropped {size} bytes of the oldest buffered messages.")
+        if self.read_segment == segment:
+            self.read_segment, self.read_offset = self.segments[0], 0
+        return True
+
+    def read_batch(self, count):
+        """
+        Returns up to `count` of the oldest messages as (topic, payload, qos, retain),
+        and the position after them to hand to commit().
+        """
+        batch = []
+        segment, offset = self.read_segment, self.read_offset
+        while segment is not None:
+            with open(self._path(segment), 'rb') as f:
+                f.seek(offset)
+                while len(batch) < count:
+                    header = f.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        break
+                    flags, qos, topic_len, payload_len = HEADER.unpack(header)
+                    body = f.read(topic_len + payload_len)
+                    if len(body) < topic_len + payload_len:
+                        break # Torn write from a crash
+                    batch.append((body[:topic_len].decode('utf-8', errors='replace'), body[topic_len:],
+                                  qos, bool(flags & FLAG_RETAIN)))
+                    offset = f.tell()
+            if len(batch) >= count or segment == self.write_segment:
+                break
+            # This segment is finished, continue with the next one
+            index = self.segments.index(segment)
+            if index + 1 >= len(self.segments):
+                offset = os.path.getsize(self._path(segment)) # Skip a torn tail so commit() deletes it
+                break
+            segment, offset = self.segments[index + 1], 0
+        return batch, (segment, offset)
+
+    def commit(self, position):
+        """Marks everything before `position` (from read_batch) as delivered and deletes finished segments."""
+        segment, offset = position
+        if segment is not None and segment not in self.segments:
+            return # Evicted while the batch was being sent, the read position moved on already
+        while segment is not None and self.segments[0] != segment:
+            self._remove(self.segments.pop(0))
+        self.read_segment, self.read_offset = segment, offset
+        if segment is not None and segment != self.write_segment and offset >= os.path.getsize(self._path(segment)):
+            self.segments.remove(segment)
+            self._remove(segment)
+            self.read_segment = self.segments[0] if self.segments else None
+            self.read_offset = 0
+        elif segment is not None and segment == self.write_segment and offset >= self.writer.tell():
+            # Everything was delivered, start over with a fresh segment next time
+            self.writer.close()
+            self.writer = None
+            self.write_segment = None
+            self.segments.remove(segment)
+            self._remove(segment)
+            self.read_segment, self.read_offset = None, 0
+        self._save_cursor()
+
+    def _remove(self, segment):
+        path = self._path(segment)
+        try:
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+
+class BufferedPublisher:
+    """
+    Stands in for the paho client: publish() goes straight to the broker while
+    it is connected and the outbox is empty, and to the outbox otherwise.
+    Status telemetry (QoS 0 on one of `telemetry_topics`) is low priority in
+    the outbox. Call resume() from on_connect to start replaying. Everything
+    else is passed through to the client.
+    """
+    def __init__(self, client, outbox, batch_size=100, batch_timeout=10.0):
+        self.client = client
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.telemetry_topics = set()
+        self.lock = threading.Lock()
+        self.replaying = False
+        self.replayed = 0
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self.lock:
+            connected = self.client.is_connected()
+            if connected and self.outbox.empty and not self.replaying:
+                return self.client.publish(topic, payload, qos, retain)
+            self.outbox.append(topic, payload, qos, retain,
+                               low_priority=qos == 0 and topic in self.telemetry_topics)
+            if connected:
+                # The connection came back between on_connect and this append
+                self._start_replay()
+
+    def resume(self):
+        """Starts replaying the outbox on a background thread, if there is anything to replay."""
+        with self.lock:
+            self._start_replay()
+
+    def _start_replay(self):
+        if self.replaying or self.outbox.empty:
+            return
+        self.replaying = True
+        threading.Thread(target=self._replay, name="laserlink-outbox", daemon=True).start()
+
+    def loop_stop(self):
+        self.client.loop_stop()
+        self.outbox.close()
+
+    def _replay(self):
+        start = time.monotonic()
+        count = 0
+        try:
+            while True:
+                with self.lock:
+                    batch, position = self.outbox.read_batch(self.batch_size)
+                    if not batch:
+                        # Nothing left, the next publish() goes straight to the broker again
+                        self.outbox.commit(position)
+                        self.replaying = False
+                        break
+                infos = [self.client.publish(topic, payload, qos, retain) for topic, payload, qos, retain in batch]
+                if any(info.rc != 0 for info in infos):
+                    raise ConnectionError(f"publish returned {infos[-1].rc}")
+                # Flow control: don't read the next batch before this one has left
+                infos[-1].wait_for_publish(self.batch_timeout)
+                if not infos[-1].is_published():
+                    raise ConnectionError("batch was not sent in time")
+                with self.lock:
+                    self.outbox.commit(position)
+                count += len(batch)
+        except Exception as e:
+            # Disconnected again; the rest stays in the outbox for the next resume()
+            logging.warning(f"MQTT outbox replay interrupted after {count} messages: {e}")
+            with self.lock:
+                self.replaying = False
+            return
+        finally:
+            self.replayed += count
+        if count:
+            logging.info(f"Replayed {count} buffered MQTT messages in {time.monotonic() - start:.1f}s.")
@@ -0,0 +1,181 @@
+"""
+MQTT status payload formats.
+
+    json     the full parsed status, including the raw GRBL line (default)
+    compact  JSON without `raw` and empty values, without whitespace
+    fields   one retained topic per field (`<topic>/detailed_status`,
+             `<topic>/mpos/x`, ...), published only when its value changes
+    msgpack  the compact document as MessagePack (needs the msgpack package)
+    cbor     the compact document as CBOR (needs the cbor2 package)
+
+Home Assistant discovery asks the encoder where each field lives, so its
+sensors read the per-field topics directly instead of running a template
+over the whole document.
+
+The json and compact documents are written a field at a time by a
+FragmentEncoder: a sub-object (mpos, accessories, overrides, ...) that is the
+same object as in the previous status, which the parser's FieldCache makes it
+when the field didn't change, reuses the JSON made of it then.
+"""
+import json
+from json.encoder import encode_basestring_ascii
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+FORMATS = ("json", "compact", "fields", "msgpack", "cbor")
+BINARY_FORMATS = ("msgpack", "cbor")
+
+# Published as <topic>/<path> in the fields format
+FIELD_PATHS = (
+    ("state",),
+    ("detailed_status",),
+    ("job_in_progress",),
+    ("laser_power_pct",),
+    ("feed_rate",),
+    ("spindle_speed",),
+    ("mpos", "x"),
+    ("mpos", "y"),
+    ("mpos", "z"),
+)
+
+# Only useful to someone reading the full document
+COMPACT_SKIP = ("raw",)
+
+class FragmentEncoder:
+    """
+    Encodes a status dict (string keys) exactly like json.dumps() with the
+    same separators, keeping the JSON of each key and of the last object seen
+    under it. Sub-objects must not be changed in place once encoded.
+    """
+    __slots__ = ("encoder", "item_separator", "key_separator", "keys", "fragments", "skip_none")
+
+    def __init__(self, separators=(", ", ": "), skip=(), skip_none=False):
+        self.encoder = json.JSONEncoder(separators=separators).encode
+        self.item_separator, self.key_separator = separators
+        self.keys = dict.fromkeys(skip, "") # key -> '"key": ', or "" to leave it out
+        self.fragments = {} # key -> (last object, its JSON)
+        self.skip_none = skip_none
+
+    def encode(self, data):
+        keys = self.keys
+        fragments = self.fragments
+        parts = []
+        for key, value in data.items():
+            if value is None and self.skip_none:
+                continue
+            prefix = keys.get(key)
+            if prefix is None:
+                prefix = keys[key] = encode_basestring_ascii(key) + self.key_separator
+            if not prefix:
+                continue
+            kind = type(value)
+            if kind is str:
+                fragment = encode_basestring_ascii(value)
+            elif kind is float and value - value == 0: # NaN and infinity are spelled by the encoder
+                fragment = float.__repr__(value)
+            elif kind is int:
+                fragment = int.__repr__(value)
+            elif kind is bool:
+                fragment = "true" if value else "false"
+            elif value is None:
+                fragment = "null"
+            elif kind is dict:
+                last = fragments.get(key)
+                if last is not None and last[0] is value:
+                    fragment = last[1]
+                else:
+                    fragment = self.encoder(value)
+                    fragments[key] = (value, fragment)
+            else:
+                fragment = self.encoder(value)
+            parts.append(prefix + fragment)
+        return "{" + self.item_separator.join(parts) + "}"
+
+
+def missing_dependency(payload_format):
+    """Returns the package a format needs but isn't installed, or None."""
+    if payload_format == "msgpack" and msgpack is None:
+        return "msgpack"
+    if payload_format == "cbor" and cbor2 is None:
+        return "cbor2"
+    return None
+
+
+def compact(data):
+    return {key: value for key, value in data.items() if value is not None and key not in COMPACT_SKIP}
+
+
+def _lookup(data, path):
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def _field_payload(value):
+    # Strings as they are, so HA shows `Lasering` and not `"Lasering"`
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return value if isinstance(value, str) else str(value)
+
+
+class PayloadEncoder:
+    def __init__(self, payload_format, topic):
+        if payload_format not in FORMATS:
+            raise ValueError(f"Unknown payload format '{payload_format}'")
+        self.format = payload_format
+        self.topic = topic
+        self.field_topics = {path: f"{topic}/{'/'.join(path)}" for path in FIELD_PATHS}
+        self.last_fields = {} # path -> last published payload (fields format)
+        if payload_format == "compact":
+            self.json = FragmentEncoder(separators=(",", ":"), skip=COMPACT_SKIP, skip_none=True)
+        else:
+            self.json = FragmentEncoder()
+
+    def reset(self):
+        """Forget what was published, so the next status sends every field again."""
+        self.last_fields = {}
+
+    def encode(self, data):
+        """Returns the (topic, payload, retain) messages for one status."""
+        if self.format in ("json", "compact"):
+            return [(self.topic, self.json.encode(data), False)]
+        if self.format == "msgpack":
+            return [(self.topic, msgpack.packb(compact(data)), False)]
+        if self.format == "cbor":
+            return [(self.topic, cbor2.dumps(compact(data)), False)]
+
+        messages = []
+        last_fields = self.last_fields
+        for path, topic in self.field_topics.items():
+            value = data.get(path[0]) if len(path) == 1 else _lookup(data, path)
+            if value is None:
+                continue
+            payload = _field_payload(value)
+            if last_fields.get(path) != payload:
+                last_fields[path] = payload
+                messages.append((topic, payload, True))
+        return messages
+
+    def discovery(self, path, binary=False):
+        """The state topic (and template or payloads) for a Home Assistant entity reading this field."""
+        if self.format == "fields":
+            config = {"state_topic": self.field_topics[path]}
+            if binary:
+                config.update(payload_on="true", payload_off="false")
+            return config
+        config = {"state_topic": self.topic, "value_template": "{{ value_json." + ".".join(path) + " }}"}
+        if binary:
+            config.update(payload_on=True, payload_off=False)
+        return config
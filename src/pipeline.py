@@ -0,0 +1,301 @@
+"""
+Event fan-out from the job state machine to its sinks.
+
+The state machine emits events (a status, a job that started or ended, the
+path a job burned, the controller's settings, the link going offline) and
+every sink gets them through its own bounded queue and worker thread, so a
+slow sink only ever delays itself, never the next status query. When a queue
+is full, the oldest status is dropped to make room; other events instead wait
+up to `block_timeout` for space, because losing one means a missing
+notification or history row.
+
+Sinks are plugins: built-in ones register under a name with @register_sink,
+and `pipeline.sinks` in config.yaml may also name any `package.module:factory`
+on the Python path. A factory is called with the LaserMonitor and returns a
+Sink, or None if it has nothing to do for that laser. With `queue_size: 0`
+events are handled inline, in the poll path.
+"""
+import collections
+import importlib
+import json
+import logging
+import threading
+import time
+
+import liveserver
+import metrics
+
+# Events that may be dropped (oldest first) when a sink falls behind
+TELEMETRY_EVENTS = ("status",)
+
+SINK_TYPES = {}
+
+
+def register_sink(name):
+    """Class or factory decorator: makes a sink available under `name` in pipeline.sinks."""
+    def decorator(factory):
+        SINK_TYPES[name] = factory
+        return factory
+    return decorator
+
+
+def load_sink_factory(name):
+    if name in SINK_TYPES:
+        return SINK_TYPES[name]
+    if ":" not in name:
+        raise ValueError(f"Unknown sink '{name}'. Built-in sinks: {', '.join(sorted(SINK_TYPES))}")
+    module_name, attribute = name.split(":", 1)
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class Event:
+    __slots__ = ("kind", "device", "data", "time")
+
+    def __init__(self, kind, device, data, now=None):
+        self.kind = kind
+        self.device = device
+        self.data = data
+        self.time = time.time() if now is None else now
+
+
+class Sink:
+    """Base class for sinks. handle() runs on the sink's own thread (or inline with queue_size 0)."""
+    name = "sink"
+
+    def handle(self, event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SinkQueue:
+    """A bounded queue and worker thread in front of one sink."""
+    def __init__(self, sink, device, size, block_timeout=5.0):
+        self.sink = sink
+        self.size = size
+        self.block_timeout = block_timeout
+        self.events = collections.deque()
+        self.cond = threading.Condition()
+        self.busy = False
+        self.closed = False
+        self.dropped = 0
+        self.handled = 0
+        self.metric_depth = metrics.QUEUE_DEPTH.labels(device, sink.name)
+        self.metric_dropped = metrics.QUEUE_DROPPED.labels(device, sink.name)
+        self.thread = threading.Thread(target=self._worker, name=f"laserlink-sink-{sink.name}", daemon=True)
+        self.thread.start()
+
+    def put(self, event):
+        with self.cond:
+            if len(self.events) >= self.size:
+                if not self._make_room(event):
+                    self.dropped += 1
+                    self.metric_dropped.inc()
+                    if event.kind not in TELEMETRY_EVENTS:
+                        logging.error(f"Sink '{self.sink.name}' is stuck, dropped a '{event.kind}' event.")
+                    return
+            self.events.append(event)
+            self.metric_depth.set(len(self.events))
+            self.cond.notify_all()
+
+    def _make_room(self, event):
+        # Drop the oldest status, wherever it is in the queue
+        for i, queued in enumerate(self.events):
+            if queued.kind in TELEMETRY_EVENTS:
+                del self.events[i]
+                self.dropped += 1
+                self.metric_dropped.inc()
+                return True
+        if event.kind in TELEMETRY_EVENTS:
+            # Only job events queued: the new status is the one to go
+            return False
+        # Wait for the worker to make room
+        return self.cond.wait_for(lambda: len(self.events) < self.size or self.closed, self.block_timeout) and not self.closed
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.events or self.closed)
+                if not self.events:
+                    return
+                event = self.events.popleft()
+                self.busy = True
+                self.metric_depth.set(len(self.events))
+                self.cond.notify_all()
+            try:
+                self.sink.handle(event)
+            except Exception as e:
+                logging.error(f"Sink '{self.sink.name}' failed on a '{event.kind}' event: {e}")
+            with self.cond:
+                self.busy = False
+                self.handled += 1
+                self.cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until every queued event was handled. Returns False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.events and not self.busy, timeout)
+
+    def close(self, timeout=10):
+        """Handles what is still queued, then stops the worker."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+
+class Pipeline:
+    def __init__(self, device, queue_size=256, block_timeout=5.0):
+        self.device = device
+        self.queue_size = queue_size
+        self.block_timeout = block_timeout
+        self.sinks = []
+        self.queues = []
+
+    @classmethod
+    def from_config(cls, monitor):
+        cfg = monitor.cfg
+        pipeline = cls(monitor.device_name, int(cfg.pipeline_queue_size), float(cfg.pipeline_block_timeout))
+        for name in cfg.pipeline_sinks:
+            sink = load_sink_factory(name)(monitor)
+            if sink is not None:
+                pipeline.add(sink)
+        return pipeline
+
+    def add(self, sink):
+        self.sinks.append(sink)
+        if self.queue_size > 0:
+            self.queues.append(SinkQueue(sink, self.device, self.queue_size, self.block_timeout))
+
+    def emit(self, kind, data):
+        event = Event(kind, self.device, data)
+        if self.queues:
+            for queue in self.queues:
+                queue.put(event)
+            return
+        for sink in self.sinks:
+            try:
+                sink.handle(event)
+            except Exception as e:
+                logging.error(f"Sink '{sink.name}' failed on a '{kind}' event: {e}")
+
+    def flush(self, timeout=None):
+        return all(queue.flush(timeout) for queue in self.queues)
+
+    def stats(self):
+        return {queue.sink.name: {"depth": len(queue.events), "handled": queue.handled, "dropped": queue.dropped}
+                for queue in self.queues}
+
+    def close(self):
+        for queue in self.queues:
+            queue.close()
+        for sink in self.sinks:
+            sink.close()
+
+
+@register_sink("mqtt")
+def mqtt_sink(monitor):
+    return MqttSink(monitor) if monitor.mqtt_client or monitor.cfg.mqtt_enabled else None
+
+
+class MqttSink(Sink):
+    """Statuses (after the publish policy), job summaries, the controller cache and the Offline status."""
+    name = "mqtt"
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+
+    def handle(self, event):
+        monitor = self.monitor
+        client = monitor.mqtt_client # Set late by a MultiLaserMonitor
+        if event.kind == "status":
+            policy = monitor.publish_policy
+            if client and (policy is None or policy.should_publish(event.data, time.monotonic())):
+                start = time.perf_counter()
+                for topic, payload, retain in monitor.payloads.encode(event.data):
+                    client.publish(topic, payload, retain=retain)
+                monitor.metric_publish.observe(time.perf_counter() - start)
+        elif event.kind == "job_finished":
+            if client:
+                client.publish(f"{monitor.cfg.mqtt_topic}/job", json.dumps(event.data), retain=True)
+        elif event.kind == "controller":
+            if client:
+                client.publish(f"{monitor.cfg.mqtt_topic}/controller", json.dumps(event.data), retain=True)
+        elif event.kind == "offline":
+            if monitor.publish_policy:
+                # The first status after reconnecting must replace the Offline one
+                monitor.publish_policy.reset()
+            if client:
+                logging.info(f"{monitor.log_prefix}Publishing Offline status to MQTT...")
+                # QoS 1 so an outbox keeps it with the events instead of thinning it like telemetry
+                for topic, payload, retain in monitor.payloads.encode(event.data):
+                    client.publish(topic, payload, qos=1, retain=retain)
+
+
+@register_sink("history")
+def history_sink(monitor):
+    return HistorySink(monitor.history) if monitor.history else None
+
+
+class HistorySink(Sink):
+    name = "history"
+
+    def __init__(self, history):
+        self.history = history
+        self.toolpath = None # Sent just before the job it belongs to
+
+    def handle(self, event):
+        if event.kind == "status":
+            self.history.record_status(event.device, event.time, event.data, event.data["job_in_progress"])
+        elif event.kind == "toolpath":
+            self.toolpath = event.data["toolpath"]
+        elif event.kind == "job_finished":
+            toolpath, self.toolpath = self.toolpath, None
+            self.history.record_job(event.device, event.data, toolpath.to_bytes() if toolpath else None)
+
+
+@register_sink("live")
+def live_sink(monitor):
+    cfg = monitor.cfg
+    if not cfg.live_port:
+        return None
+    return LiveSink(liveserver.shared(cfg.live_host, cfg.live_port, int(cfg.live_client_buffer_kb * 1024)))
+
+
+class LiveSink(Sink):
+    """Every JSON event, to the clients of the live status server."""
+    name = "live"
+    kinds = ("status", "job_started", "job_finished", "offline")
+
+    def __init__(self, server):
+        self.server = server
+
+    def handle(self, event):
+        if event.kind in self.kinds:
+            self.server.publish(event.device, event.kind, event.data)
+
+
+@register_sink("telegram")
+class TelegramSink(Sink):
+    name = "telegram"
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.toolpath = None
+
+    def handle(self, event):
+        cfg = self.monitor.cfg
+        if event.kind == "job_started":
+            self.monitor.send_telegram_notification(cfg.telegram_message_started)
+        elif event.kind == "toolpath":
+            self.toolpath = event.data["toolpath"]
+        elif event.kind == "job_finished":
+            toolpath, self.toolpath = self.toolpath, None
+            document = None
+            if toolpath and cfg.toolpath_telegram and cfg.telegram_enabled:
+                # Rendered here, off the poll path
+                name, ended = self.monitor.device_name, time.localtime(event.data["ended"])
+                svg = toolpath.svg(title=f"{name} {time.strftime('%Y-%m-%d %H:%M', ended)}")
+                document = (f"{name}-{time.strftime('%Y%m%d-%H%M', ended)}.svg", svg.encode(), "image/svg+xml")
+            self.monitor.send_telegram_notification(cfg.telegram_message_completed, document)
@@ -0,0 +1,96 @@
+"""
+Change-driven MQTT publishing.
+
+A status is only published when the machine state changes, a numeric field
+moves past its deadband, or the heartbeat interval has passed since the last
+publish. Everything else is counted as suppressed.
+"""
+
+# Fields that trigger a publish on any change.
+# They are compared only when present, because GRBL sends some of them
+# (Ov, WCO) only every few reports.
+STATE_FIELDS = ("state", "detailed_status", "job_in_progress", "accessories", "overrides", "pins", "wco")
+
+# Position fields, compared per axis against the "mpos" deadband
+POSITION_FIELDS = ("mpos", "wpos")
+
+# Fields that change on every report while running and never trigger a publish on their own
+# raw, timestamp, buffer, line_number
+
+
+class PublishPolicy:
+    def __init__(self, deadband_mpos=0.0, deadband_power=0.0, deadband_feed=0.0, heartbeat_interval=60.0):
+        # spindle_speed is covered by laser_power_pct
+        self.deadbands = {
+            "laser_power_pct": deadband_power,
+            "feed_rate": deadband_feed,
+        }
+        self.deadband_mpos = deadband_mpos
+        self.heartbeat_interval = heartbeat_interval
+        self.last = {}
+        self.last_publish_time = None
+        self.sent = 0
+        self.suppressed = 0
+        self.heartbeats = 0
+
+    def reset(self):
+        """Forget the last published status, so the next one is always published."""
+        self.last = {}
+        self.last_publish_time = None
+
+    def _changed(self, data):
+        if not self.last:
+            return True
+        for key in STATE_FIELDS:
+            if key in data and data[key] != self.last.get(key):
+                return True
+        for key in POSITION_FIELDS:
+            if key in data:
+                previous = self.last.get(key)
+                if previous is None:
+                    return True
+                for axis, value in data[key].items():
+                    if abs(value - previous.get(axis, 0.0)) > self.deadband_mpos:
+                        return True
+        for key, deadband in self.deadbands.items():
+            if key not in data:
+                continue
+            previous = self.last.get(key)
+            if previous is None or abs(data[key] - previous) > deadband:
+                return True
+        # Numeric values that drift back to exactly zero must always be published,
+        # otherwise HA would keep showing the last non-zero power or speed.
+        for key in ("laser_power_pct", "feed_rate"):
+            if data.get(key) == 0 and self.last.get(key, 0) != 0:
+                return True
+        return False
+
+    def should_publish(self, data, now):
+        """
+        Decides whether `data` has to be published at monotonic time `now`.
+        A True result records `data` as the last published status.
+        """
+        publish = self._changed(data)
+        if not publish and self.last_publish_time is not None and now - self.last_publish_time >= self.heartbeat_interval:
+            publish = True
+            self.heartbeats += 1
+
+        if not publish:
+            self.suppressed += 1
+            return False
+
+        self.sent += 1
+        self.last_publish_time = now
+        for key in STATE_FIELDS + POSITION_FIELDS + tuple(self.deadbands):
+            if key in data:
+                self.last[key] = data[key]
+        return True
+
+    def stats(self):
+        total = self.sent + self.suppressed
+        return {
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+            "heartbeats": self.heartbeats,
+            "suppressed_pct": round(self.suppressed / total * 100, 1) if total else 0.0
+        }
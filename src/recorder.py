@@ -0,0 +1,92 @@
+"""
+Compact append-only recording of the raw bytes received from the controller.
+
+File layout:
+    b"LLREC1\n" header, then one record per received chunk:
+    varint(microseconds since the previous record) varint(length) bytes
+
+A zero-length record marks the start of a new connection.
+Timestamps come from the monotonic clock, so they are immune to NTP steps.
+"""
+import os
+import time
+
+MAGIC = b"LLREC1\n"
+FLUSH_INTERVAL = 5 # Seconds, keeps SD card writes infrequent
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class SessionRecorder:
+    def __init__(self, path):
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab')
+        if new_file:
+            self.file.write(MAGIC)
+        self.last_ns = time.monotonic_ns()
+        self.last_flush = self.last_ns
+
+    def _append(self, data, now_ns):
+        delta_us = max(0, now_ns - self.last_ns) // 1000
+        self.last_ns = now_ns
+        self.file.write(_varint(delta_us) + _varint(len(data)) + data)
+        if now_ns - self.last_flush >= FLUSH_INTERVAL * 1_000_000_000:
+            self.file.flush()
+            self.last_flush = now_ns
+
+    def mark_session(self):
+        """Records that a new connection to the laser was made."""
+        self._append(b"", time.monotonic_ns())
+
+    def write(self, data):
+        """Records one chunk exactly as it was received."""
+        if data:
+            self._append(data, time.monotonic_ns())
+
+    def close(self):
+        self.file.close()
+
+
+def read_records(path):
+    """
+    Yields (seconds since the start of the recording, chunk) tuples.
+    An empty chunk marks the start of a new connection.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a LaserLink recording")
+    pos = len(MAGIC)
+    elapsed_us = 0
+    while pos < len(data):
+        try:
+            delta_us, pos = _read_varint(data, pos)
+            length, pos = _read_varint(data, pos)
+        except IndexError:
+            # Truncated by a crash or power loss mid-record
+            return
+        chunk = data[pos:pos + length]
+        if len(chunk) < length:
+            return
+        pos += length
+        elapsed_us += delta_us
+        yield elapsed_us / 1_000_000, chunk
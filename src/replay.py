@@ -0,0 +1,60 @@
+import argparse
+import os
+import logging
+from monitor import LaserMonitor
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a LaserLink recording through the status pipeline.")
+    parser.add_argument("recording", help="File written by the record_path setting")
+    parser.add_argument("--speed", default="1", help="Playback speed multiplier, or 'max' (Default: 1)")
+    parser.add_argument("--config", default="config.yaml", help="Config file (Default: config.yaml)")
+    parser.add_argument("--mqtt", action="store_true", help="Publish to the configured MQTT broker")
+    parser.add_argument("--telegram", action="store_true", help="Send the configured Telegram notifications")
+    args = parser.parse_args()
+
+    speed = None if args.speed == "max" else float(args.speed)
+
+    # Replay never talks to the laser, and stays off MQTT and Telegram unless asked.
+    # Nor does it take the ports of a daemon running with the same config.
+    os.environ.setdefault("BLUETOOTH_MAC", "00:00:00:00:00:00")
+    os.environ["RECORD_PATH"] = ""
+    os.environ["HISTORY_PATH"] = ""
+    os.environ["OUTBOX_PATH"] = ""
+    os.environ["PROXY_PORT"] = "0"
+    os.environ["PROXY_PTY"] = ""
+    os.environ["LIVE_PORT"] = "0"
+    os.environ["QUERY_INTERVAL"] = "0"
+    os.environ["SAFETY_ENABLED"] = "false" # Its retained topic would overwrite the real machine's
+    os.environ["PIPELINE_QUEUE_SIZE"] = "0" # Every status reaches the sinks, however fast the replay
+    if not args.mqtt:
+        os.environ["MQTT_ENABLED"] = "false"
+    if not args.telegram:
+        os.environ["TELEGRAM_ENABLED"] = "false"
+
+    monitor = LaserMonitor(args.config)
+    jobs = 0
+    handle_state_change = monitor.handle_state_change
+
+    def count_jobs(parsed_data):
+        nonlocal jobs
+        was_in_progress = monitor.job_in_progress
+        handle_state_change(parsed_data)
+        if monitor.job_in_progress and not was_in_progress:
+            jobs += 1
+
+    monitor.handle_state_change = count_jobs
+    try:
+        lines, elapsed = monitor.replay(args.recording, speed)
+    finally:
+        if monitor.proxy:
+            monitor.proxy.stop()
+        if monitor.notifier:
+            monitor.notifier.stop()
+        if monitor.mqtt_client:
+            monitor.mqtt_client.loop_stop()
+
+    rate = lines / elapsed if elapsed > 0 else float("inf")
+    logging.info(f"Replayed {lines} lines in {elapsed:.2f}s ({rate:,.0f} lines/s), {jobs} job(s) started.")
+
+if __name__ == "__main__":
+    main()
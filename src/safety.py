@@ -0,0 +1,170 @@
+"""
+Fast lane for safety-critical states: Alarm, Door and Hold.
+
+Routine statuses go through the publish policy, the line queue and the
+sink queues. Safety states don't wait for any of that: every line is checked
+as soon as it is framed (on the reader in the asyncio run mode), and a change
+of safety state is published right away with QoS 1, retained, to
+`<topic>/safety`, straight to the MQTT client (past the disk outbox, whose
+backlog may be minutes long). While the broker is unreachable the current
+state is republished on reconnect instead, so the retained value is never
+older than what was last seen.
+
+    {"active": true, "state": "Alarm", "code": 1, "substate": null,
+     "description": "Hard limit triggered ...", "timestamp": 1700000000.0}
+
+Routine lines cost one startswith() check. Alarm codes come from GRBL's
+`ALARM:<n>` message, which arrives just before the first <Alarm> report.
+"""
+import json
+import logging
+import threading
+import time
+
+import metrics
+from outbox import BufferedPublisher
+
+SAFETY_STATES = ("Alarm", "Door", "Hold")
+_PREFIXES = ("<Alarm", "<Door", "<Hold", "ALARM:")
+
+# GRBL 1.1, with the grblHAL extensions from 10 on
+ALARM_CODES = {
+    1: "Hard limit triggered. Position is likely lost, re-home the machine.",
+    2: "Soft limit: G-code motion target exceeds machine travel.",
+    3: "Reset while in motion. Position is likely lost, re-home the machine.",
+    4: "Probe fail: probe not in the expected initial state.",
+    5: "Probe fail: probe did not contact the workpiece.",
+    6: "Homing fail: reset during the homing cycle.",
+    7: "Homing fail: safety door opened during the homing cycle.",
+    8: "Homing fail: pull off failed to clear the limit switch.",
+    9: "Homing fail: limit switch not found within the search distance.",
+    10: "Emergency stop asserted (grblHAL), or second limit switch not found on a dual axis (Grbl 1.1h).",
+    11: "Homing required.",
+    12: "Limit switch engaged.",
+    13: "Probe protection triggered.",
+    14: "Spindle at speed timeout.",
+    15: "Homing fail: second limit switch of an auto-squared axis not found.",
+    16: "Power on self test failed.",
+    17: "Motor fault.",
+}
+
+DOOR_STATES = {
+    0: "Door closed, ready to resume.",
+    1: "Door open, machine stopped.",
+    2: "Door opened, hold or parking in progress.",
+    3: "Door closed, resuming.",
+}
+
+HOLD_STATES = {
+    0: "Feed hold complete, ready to resume.",
+    1: "Feed hold in progress.",
+}
+
+
+def describe(state, substate=None, code=None):
+    if state == "Alarm":
+        if code is None:
+            return "Alarm, code unknown."
+        return f"Alarm {code}: {ALARM_CODES.get(code, 'Unknown alarm code.')}"
+    if state == "Door":
+        return DOOR_STATES.get(substate, "Safety door open.")
+    if state == "Hold":
+        return HOLD_STATES.get(substate, "Feed hold.")
+    return state
+
+
+def _state(line):
+    """('Door', 1) for '<Door:1|MPos:...>'."""
+    token = line[1:].split("|", 1)[0].rstrip(">")
+    state, _, substate = token.partition(":")
+    return state, int(substate) if substate.isdigit() else None
+
+
+class SafetyLane:
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.topic = f"{monitor.cfg.mqtt_topic}/safety"
+        self.notify_states = tuple(monitor.cfg.safety_notify)
+        self.lock = threading.Lock()
+        self.key = None # (state, substate, alarm code) while a safety state is active
+        self.alarm_code = None
+        self.payload = None # Last state published, or to publish on reconnect
+        self.published = 0
+        self.metric_latency = metrics.SAFETY_LATENCY.labels(monitor.device_name)
+
+    def check(self, line, received_at=None):
+        """
+        Called with every line as soon as it is framed; `received_at` is when
+        it came off the link (perf_counter). Thread-safe and idempotent.
+        """
+        if line.startswith(_PREFIXES):
+            if line.startswith("ALARM:"):
+                code = line[6:].strip()
+                if not code.isdigit():
+                    return
+                with self.lock:
+                    self.alarm_code = int(code)
+                    self._update("Alarm", None, received_at)
+                return
+            state, substate = _state(line)
+            with self.lock:
+                self._update(state, substate, received_at)
+        elif self.key is not None and line.startswith("<"):
+            state, _ = _state(line)
+            with self.lock:
+                self._update(state, None, received_at)
+
+    def _update(self, state, substate, received_at):
+        if state not in SAFETY_STATES:
+            if self.key is None:
+                return
+            # Back to normal
+            self.key = None
+            self.alarm_code = None
+            logging.info(f"{self.monitor.log_prefix}Safety state cleared, now {state}.")
+            self._publish({"active": False, "state": state, "timestamp": time.time()}, received_at)
+            return
+        code = self.alarm_code if state == "Alarm" else None
+        key = (state, substate, code)
+        if key == self.key:
+            return
+        # Substates (door opening, hold completing) only update the topic
+        entered = self.key is None or self.key[0] != state or self.key[2] != code
+        self.key = key
+        description = describe(state, substate, code)
+        if entered:
+            # A feed hold is usually the operator pausing the job
+            logging.log(logging.INFO if state == "Hold" else logging.WARNING, f"{self.monitor.log_prefix}Safety state: {description}")
+            metrics.SAFETY_EVENTS.labels(self.monitor.device_name, state).inc()
+        else:
+            logging.info(f"{self.monitor.log_prefix}Safety state: {description}")
+        self._publish({"active": True, "state": state, "code": code, "substate": substate,
+                       "description": description, "timestamp": time.time()}, received_at)
+        if entered and state in self.notify_states:
+            self.monitor.send_telegram_notification(f"{self.monitor.cfg.ha_device_name}: {description}", urgent=True)
+
+    def _publish(self, data, received_at):
+        self.payload = json.dumps(data)
+        if self._send() and received_at is not None:
+            self.metric_latency.observe(time.perf_counter() - received_at)
+
+    def _send(self):
+        client = self.monitor.mqtt_client
+        if isinstance(client, BufferedPublisher):
+            client = client.client
+        if client is None or not client.is_connected():
+            return False
+        client.publish(self.topic, self.payload, qos=1, retain=True)
+        self.published += 1
+        return True
+
+    def discovery(self):
+        """State topic and template for a Home Assistant binary sensor, with the details as attributes."""
+        return {"state_topic": self.topic, "value_template": "{{ value_json.active }}",
+                "payload_on": True, "payload_off": False, "json_attributes_topic": self.topic}
+
+    def republish(self):
+        """After (re)connecting to the broker: brings the retained safety state up to date."""
+        with self.lock:
+            if self.payload is not None:
+                self._send()
@@ -0,0 +1,182 @@
+"""
+Poll scheduling helpers.
+
+PollClock hands out deadlines on a fixed grid (start + n * interval) so the
+poll period does not drift by the link round-trip or processing time.
+JitterStats records how far each poll actually landed from its deadline.
+ReconnectBackoff spaces out reconnect attempts to the laser.
+"""
+import math
+import random
+from collections import deque
+
+
+class PollClock:
+    def __init__(self, interval, start):
+        self.interval = interval
+        self.next_deadline = start
+        self.missed = 0
+
+    def advance(self, now):
+        """
+        Moves to the next deadline on the grid and returns it.
+        If we fell more than one interval behind, the missed ticks are skipped
+        (and counted) instead of firing a burst of queries to catch up.
+        """
+        self.next_deadline += self.interval
+        if now - self.next_deadline > self.interval:
+            skipped = math.floor((now - self.next_deadline) / self.interval)
+            self.missed += skipped
+            self.next_deadline += skipped * self.interval
+        return self.next_deadline
+
+    def retime(self, interval, last_sent):
+        """
+        Switches to a new interval.
+        A shorter interval takes effect from the last poll instead of waiting for the
+        deadline that was scheduled with the old, longer one.
+        """
+        self.interval = interval
+        self.next_deadline = min(self.next_deadline, last_sent + interval)
+
+
+class JitterStats:
+    def __init__(self, size=1024):
+        self.lateness = deque(maxlen=size)
+        self.periods = deque(maxlen=size)
+        self.last_send = None
+
+    def record(self, deadline, sent_at):
+        self.lateness.append(sent_at - deadline)
+        if self.last_send is not None:
+            self.periods.append(sent_at - self.last_send)
+        self.last_send = sent_at
+
+    def reset(self):
+        self.lateness.clear()
+        self.periods.clear()
+        self.last_send = None
+
+    @staticmethod
+    def _percentile(ordered, pct):
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        """Returns lateness percentiles and period spread in milliseconds."""
+        if not self.lateness:
+            return {"samples": 0}
+        ordered = sorted(self.lateness)
+        summary = {
+            "samples": len(ordered),
+            "lateness_p50_ms": round(self._percentile(ordered, 50) * 1000, 3),
+            "lateness_p99_ms": round(self._percentile(ordered, 99) * 1000, 3),
+            "lateness_max_ms": round(ordered[-1] * 1000, 3)
+        }
+        if len(self.periods) > 1:
+            mean = sum(self.periods) / len(self.periods)
+            variance = sum((p - mean) ** 2 for p in self.periods) / (len(self.periods) - 1)
+            summary["period_mean_ms"] = round(mean * 1000, 3)
+            summary["period_stddev_ms"] = round(math.sqrt(variance) * 1000, 3)
+        return summary
+
+
+# Poll interval bounds (min, max) in seconds per machine state.
+# Looked up by detailed_status first, then by the GRBL state without its substate.
+DEFAULT_STATE_INTERVALS = {
+    "Idle": (0.5, 5.0),
+    "Lasering": (0.25, 1.0),
+    "Framing": (0.1, 0.5),
+    "Moving": (0.1, 0.5),
+    "Run": (0.1, 0.5),
+    "Jog": (0.2, 1.0),
+    "Home": (0.25, 1.0),
+    "Hold": (0.25, 1.0),
+    "Door": (0.25, 1.0),
+    "Alarm": (0.5, 2.0),
+    "Sleep": (2.0, 10.0),
+}
+
+
+class AdaptivePoller:
+    """
+    Picks the next poll interval from the machine state and link health.
+
+    A state transition snaps the interval to the new state's minimum, so short
+    Framing/Lasering phases are not missed. While the state stays the same the
+    interval grows by `decay` per poll until it reaches the state's maximum.
+    Responses slower than `late_fraction` of the interval multiply a back-off
+    factor (up to `max_backoff`) that recovers as soon as replies are on time.
+    """
+    def __init__(self, default_interval, state_intervals=None, decay=1.1,
+                 late_fraction=0.8, backoff_step=1.5, max_backoff=4.0):
+        self.intervals = dict(DEFAULT_STATE_INTERVALS)
+        self.intervals.update(state_intervals or {})
+        self.default = (default_interval, default_interval)
+        self.decay = decay
+        self.late_fraction = late_fraction
+        self.backoff_step = backoff_step
+        self.max_backoff = max_backoff
+
+        self.state = None
+        self.base_interval = default_interval
+        self.backoff = 1.0
+        self.late_responses = 0
+
+    def bounds(self, state):
+        if state in self.intervals:
+            return self.intervals[state]
+        return self.intervals.get(state.split(":")[0], self.default)
+
+    @property
+    def interval(self):
+        return self.base_interval * self.backoff
+
+    def observe(self, state):
+        """Feeds the state derived from the latest status report. Returns True on a transition."""
+        low, high = self.bounds(state)
+        if state != self.state:
+            self.state = state
+            self.base_interval = low
+            return True
+        self.base_interval = min(high, max(low, self.base_interval * self.decay))
+        return False
+
+    def record_response(self, rtt):
+        """Feeds the time between sending '?' and receiving its status report."""
+        if rtt > self.interval * self.late_fraction:
+            self.record_late()
+        else:
+            self.backoff = max(1.0, self.backoff / self.backoff_step)
+
+    def record_late(self):
+        """A reply arrived late, or not at all before the next poll was due."""
+        self.late_responses += 1
+        self.backoff = min(self.max_backoff, self.backoff * self.backoff_step)
+
+
+class ReconnectBackoff:
+    """
+    Delays between reconnect attempts: a fast first retry (a laser that was
+    just power-cycled is usually back within a second), then exponential
+    growth up to `max_delay`, each with +/- `jitter` so several bridges don't
+    retry in lockstep.
+    """
+    def __init__(self, first=0.2, base=0.5, factor=2.0, max_delay=30.0, jitter=0.2):
+        self.first = first
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.attempts = 0
+
+    def reset(self):
+        self.attempts = 0
+
+    def next_delay(self):
+        if self.attempts == 0:
+            delay = self.first
+        else:
+            delay = min(self.max_delay, self.base * self.factor ** (self.attempts - 1))
+        self.attempts += 1
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
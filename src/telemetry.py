@@ -0,0 +1,153 @@
+"""
+Bounded telemetry history and per-job statistics.
+
+TelemetryBuffer keeps the newest `capacity` samples in preallocated
+array('d') columns. Job totals (lasering time, travel, mean power, peak
+feed) are computed block-wise over the columns: with NumPy the columns are
+wrapped zero-copy and reduced vectorized, without it plain Python loops
+give the same result. A block is folded into the totals before any of its
+samples can be overwritten, so the totals stay exact for jobs of any length
+while memory stays fixed.
+"""
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+COLUMNS = ("t", "x", "y", "z", "feed", "power")
+
+
+def _empty_totals():
+    return {"samples": 0, "lasering_s": 0.0, "travel_mm": 0.0, "lasering_mm": 0.0, "power_s": 0.0, "peak_feed": 0.0}
+
+
+def block_totals(t, x, y, z, feed, power, lasering):
+    """
+    Totals over one chronological block of samples.
+    Each segment (sample i -> i+1) counts as lasering if sample i was lasering.
+    """
+    if np is not None:
+        t, x, y, z, feed, power = (np.asarray(c, dtype=np.float64) for c in (t, x, y, z, feed, power))
+        lasering = np.asarray(lasering, dtype=bool)[:-1]
+        dt = np.diff(t)
+        distance = np.sqrt(np.diff(x) ** 2 + np.diff(y) ** 2 + np.diff(z) ** 2)
+        return {
+            "samples": len(t) - 1,
+            "lasering_s": float(dt[lasering].sum()),
+            "travel_mm": float(distance.sum()),
+            "lasering_mm": float(distance[lasering].sum()),
+            "power_s": float((power[:-1] * dt)[lasering].sum()),
+            "peak_feed": float(feed.max()) if len(feed) else 0.0,
+        }
+
+    totals = _empty_totals()
+    totals["samples"] = len(t) - 1
+    for i in range(len(t) - 1):
+        dt = t[i + 1] - t[i]
+        distance = math.sqrt((x[i + 1] - x[i]) ** 2 + (y[i + 1] - y[i]) ** 2 + (z[i + 1] - z[i]) ** 2)
+        totals["travel_mm"] += distance
+        if lasering[i]:
+            totals["lasering_s"] += dt
+            totals["lasering_mm"] += distance
+            totals["power_s"] += power[i] * dt
+    totals["peak_feed"] = float(max(feed)) if len(feed) else 0.0
+    return totals
+
+
+class TelemetryBuffer:
+    def __init__(self, capacity=2048):
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2")
+        self.capacity = capacity
+        self.columns = {name: array('d', bytes(8 * capacity)) for name in COLUMNS}
+        self.lasering = array('B', bytes(capacity))
+        self.start = 0 # Slot of the oldest sample
+        self.size = 0
+        self.pending = 0 # Newest samples not folded into the totals yet, including the anchor
+        self.totals = _empty_totals()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, t, x, y, z, feed, power, lasering):
+        if self.pending >= self.capacity:
+            # The oldest pending sample is about to be overwritten
+            self._fold()
+        slot = (self.start + self.size) % self.capacity
+        if self.size == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.size += 1
+        columns = self.columns
+        columns["t"][slot] = t
+        columns["x"][slot] = x
+        columns["y"][slot] = y
+        columns["z"][slot] = z
+        columns["feed"][slot] = feed
+        columns["power"][slot] = power
+        self.lasering[slot] = 1 if lasering else 0
+        self.pending += 1
+
+    def mark_gap(self):
+        """
+        Ends the newest segment where it is, e.g. when the link drops: a
+        non-lasering copy of the newest sample, so the time until the next
+        sample is not counted as burn time.
+        """
+        if not self.size:
+            return
+        slot = (self.start + self.size - 1) % self.capacity
+        if not self.lasering[slot]:
+            return
+        columns = self.columns
+        self.append(columns["t"][slot], columns["x"][slot], columns["y"][slot], columns["z"][slot],
+                    columns["feed"][slot], columns["power"][slot], False)
+
+    def window(self, count=None):
+        """
+        The newest `count` samples (default: all) in chronological order,
+        as a dict of column name -> sequence (NumPy arrays when available).
+        """
+        count = self.size if count is None else min(count, self.size)
+        first = (self.start + self.size - count) % self.capacity
+        end = first + count
+        result = {}
+        for name, column in list(self.columns.items()) + [("lasering", self.lasering)]:
+            if np is not None:
+                data = np.frombuffer(column, dtype=np.float64 if name != "lasering" else np.uint8)
+                result[name] = data[first:end] if end <= self.capacity else np.concatenate((data[first:], data[:end - self.capacity]))
+            else:
+                result[name] = column[first:end] if end <= self.capacity else column[first:] + column[:end - self.capacity]
+        return result
+
+    def _fold(self):
+        if self.pending >= 2:
+            block = self.window(self.pending)
+            totals = block_totals(block["t"], block["x"], block["y"], block["z"],
+                                  block["feed"], block["power"], block["lasering"])
+            for key in ("samples", "lasering_s", "travel_mm", "lasering_mm", "power_s"):
+                self.totals[key] += totals[key]
+            self.totals["peak_feed"] = max(self.totals["peak_feed"], totals["peak_feed"])
+        # The newest sample stays pending as the start of the next segment
+        self.pending = min(self.pending, 1)
+
+    def reset_totals(self):
+        """Starts new totals from the newest sample on."""
+        self.totals = _empty_totals()
+        self.pending = min(self.size, 1)
+
+    def summary(self):
+        """Totals since the last reset_totals()."""
+        self._fold()
+        totals = self.totals
+        return {
+            "samples": totals["samples"],
+            "lasering_s": round(totals["lasering_s"], 2),
+            "travel_mm": round(totals["travel_mm"], 1),
+            "lasering_mm": round(totals["lasering_mm"], 1),
+            "mean_power_pct": round(totals["power_s"] / totals["lasering_s"], 1) if totals["lasering_s"] else 0.0,
+            "peak_feed": totals["peak_feed"],
+        }
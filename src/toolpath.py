@@ -0,0 +1,213 @@
+"""
+What a job actually burned, as a compact path and an SVG preview.
+
+During a job every reported machine position is appended to a byte buffer
+as zigzag varint deltas (in `resolution` steps, 0.01 mm by default) from
+the previous point, together with the number of polls since that point and
+whether the laser was on from there. Polls that neither move nor switch the
+laser add nothing, so a point usually takes 3-6 bytes.
+
+Memory is bounded: once the buffer holds 2 * `max_points` points it is
+downsampled to `max_points` with Largest-Triangle-Three-Buckets. The buckets
+are equal spans of polls, not of points, so a multi-hour job keeps the same
+detail at its start as at its end, and in every bucket a point where the
+laser switched on or off wins over the geometrically best one.
+"""
+import struct
+
+HEADER = struct.Struct("<dI") # resolution, point count
+
+LASERING_COLOR = "#d62728"
+MOVING_COLOR = "#9e9e9e"
+
+
+def _put_varint(buffer, value):
+    value = (value << 1) ^ (value >> 63) # Zigzag: small negatives stay small
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _decode(data):
+    """Yields (poll index, x, y, lasering) in resolution steps."""
+    index = x = y = 0
+    position = 0
+    length = len(data)
+    values = [0, 0, 0]
+    while position < length:
+        for i in range(3):
+            value = data[position]
+            position += 1
+            if value > 0x7F:
+                value &= 0x7F
+                shift = 7
+                while True:
+                    byte = data[position]
+                    position += 1
+                    value |= (byte & 0x7F) << shift
+                    if byte < 0x80:
+                        break
+                    shift += 7
+            values[i] = (value >> 1) ^ -(value & 1)
+        index += values[0] >> 1
+        x += values[1]
+        y += values[2]
+        yield index, x, y, values[0] & 1
+
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets over (index, x, y, lasering) points, keeping
+    the first and last. Buckets span equal index ranges; a point that switches
+    the laser is kept in preference to the one with the largest triangle.
+    """
+    if len(points) <= threshold:
+        return list(points)
+    first, last = points[0], points[-1]
+    low, high = points[1][0], points[-2][0]
+    count = threshold - 2
+    scale = count / max(high - low, 1)
+    buckets = [[] for _ in range(count)]
+    for point in points[1:-1]:
+        buckets[min(int((point[0] - low) * scale), count - 1)].append(point)
+    buckets = [bucket for bucket in buckets if bucket]
+    # Each bucket's centroid is the far corner of the previous bucket's triangles
+    centroids = [(sum(p[1] for p in bucket) / len(bucket), sum(p[2] for p in bucket) / len(bucket))
+                 for bucket in buckets[1:]]
+    centroids.append((last[1], last[2]))
+
+    result = [first]
+    _, ax, ay, previous_flag = first # previous_flag: how the path drawn so far ends
+    for bucket, (cx, cy) in zip(buckets, centroids):
+        best, best_area = None, -1.0
+        for point in bucket:
+            if point[3] != previous_flag:
+                best = point
+                break
+            area = abs((ax - cx) * (point[2] - ay) - (ax - point[1]) * (cy - ay))
+            if area > best_area:
+                best, best_area = point, area
+        result.append(best)
+        _, ax, ay, previous_flag = best
+    result.append(last)
+    return result
+
+
+class Toolpath:
+    def __init__(self, max_points=2000, resolution=0.01):
+        if max_points < 16:
+            raise ValueError("max_points must be at least 16")
+        self.max_points = max_points
+        self.resolution = resolution
+        self.reset()
+
+    def reset(self):
+        self.data = bytearray()
+        self.count = 0
+        self.polls = 0
+        self.last = None # (poll index, x, y, lasering) of the newest point
+
+    def __len__(self):
+        return self.count
+
+    def append(self, x, y, lasering):
+        """Adds one reported position (mm). Cheap enough for every poll."""
+        self.polls += 1
+        qx, qy, flag = round(x / self.resolution), round(y / self.resolution), 1 if lasering else 0
+        last = self.last
+        if last is None:
+            last = (0, 0, 0, flag)
+        elif qx == last[1] and qy == last[2] and flag == last[3]:
+            return
+        data = self.data
+        _put_varint(data, ((self.polls - last[0]) << 1) | flag)
+        _put_varint(data, qx - last[1])
+        _put_varint(data, qy - last[2])
+        self.last = (self.polls, qx, qy, flag)
+        self.count += 1
+        if self.count >= 2 * self.max_points:
+            self._encode(lttb(self.points(), self.max_points))
+
+    def points(self):
+        """All points as (poll index, x, y, lasering) in resolution steps."""
+        return list(_decode(self.data))
+
+    def _encode(self, points):
+        data = bytearray()
+        last = (0, 0, 0)
+        for index, x, y, flag in points:
+            _put_varint(data, ((index - last[0]) << 1) | flag)
+            _put_varint(data, x - last[1])
+            _put_varint(data, y - last[2])
+            last = (index, x, y)
+        self.data = data
+        self.count = len(points)
+
+    def snapshot(self):
+        """An independent copy, for sinks to render while the next job is captured."""
+        copy = Toolpath(self.max_points, self.resolution)
+        copy.data = bytearray(self.data)
+        copy.count, copy.polls, copy.last = self.count, self.polls, self.last
+        return copy
+
+    def to_bytes(self):
+        return HEADER.pack(self.resolution, self.count) + bytes(self.data)
+
+    @classmethod
+    def from_bytes(cls, blob, max_points=2000):
+        toolpath = cls(max_points)
+        toolpath.resolution, toolpath.count = HEADER.unpack_from(blob)
+        toolpath.data = bytearray(blob[HEADER.size:])
+        if toolpath.count:
+            toolpath.last = toolpath.points()[-1]
+            toolpath.polls = toolpath.last[0]
+        return toolpath
+
+    def svg(self, size=800, title=None):
+        """
+        Renders the path, lasering solid and moves dashed, with the machine's
+        Y axis pointing up. `size` is the longer side in pixels.
+        """
+        points = self.points()
+        if not points:
+            return None
+        xs = [p[1] for p in points]
+        ys = [p[2] for p in points]
+        span_x, span_y = max(xs) - min(xs), max(ys) - min(ys)
+        pad = max(span_x, span_y, 1) // 25 + 1
+        left, top = min(xs) - pad, -max(ys) - pad
+        width, height = span_x + 2 * pad, span_y + 2 * pad
+        scale = size / max(width, height)
+
+        # One path per run of segments with the laser on, or off
+        runs = {1: [], 0: []}
+        for i in range(len(points) - 1):
+            start, end = points[i], points[i + 1]
+            flag = start[3]
+            if i == 0 or points[i - 1][3] != flag:
+                runs[flag].append(f"M{start[1]} {-start[2]}")
+            runs[flag].append(f"l{end[1] - start[1]} {start[2] - end[2]}")
+
+        mm = self.resolution
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{round(width * scale)}" height="{round(height * scale)}" '
+            f'viewBox="{left} {top} {width} {height}">',
+        ]
+        if title:
+            parts.append(f"<title>{_escape(title)}</title>")
+        parts.append(f'<rect x="{left}" y="{top}" width="{width}" height="{height}" fill="#fff"/>')
+        if runs[0]:
+            parts.append(f'<path d="{"".join(runs[0])}" fill="none" stroke="{MOVING_COLOR}" stroke-width="1" '
+                         f'stroke-dasharray="4 3" vector-effect="non-scaling-stroke"/>')
+        if runs[1]:
+            parts.append(f'<path d="{"".join(runs[1])}" fill="none" stroke="{LASERING_COLOR}" stroke-width="1.5" '
+                         f'stroke-linejoin="round" vector-effect="non-scaling-stroke"/>')
+        parts.append(f'<text x="{left + pad}" y="{top + height - pad // 4}" font-family="sans-serif" '
+                     f'font-size="{pad * 3 // 5}" fill="#555">{span_x * mm:.1f} x {span_y * mm:.1f} mm</text>')
+        parts.append("</svg>")
+        return "\n".join(parts)
+
+
+def _escape(text):
+    return str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
@@ -0,0 +1,213 @@
+"""
+Links to the GRBL controller.
+
+Every transport offers the same blocking calls for the sync run mode
+(open/send/recv/recv_pending/close) and coroutine calls for the asyncio run mode
+(open_async/send_async/recv_async).
+
+    rfcomm  Bluetooth serial (the default)
+    tcp     Wi-Fi/Ethernet GRBL controllers, ser2net bridges and grbl_sim.py
+    serial  USB-serial adapters and pseudo terminals
+"""
+import os
+import select
+import socket
+import termios
+import tty
+
+# Linux values, for Python builds compiled without Bluetooth support
+AF_BLUETOOTH = getattr(socket, "AF_BLUETOOTH", 31)
+BTPROTO_RFCOMM = getattr(socket, "BTPROTO_RFCOMM", 3)
+
+BAUDRATES = {
+    9600: termios.B9600,
+    19200: termios.B19200,
+    38400: termios.B38400,
+    57600: termios.B57600,
+    115200: termios.B115200,
+    230400: termios.B230400,
+}
+
+
+class SocketTransport:
+    family = socket.AF_INET
+    proto = 0
+
+    def __init__(self, address=None, sock=None):
+        self.address = address
+        self.sock = sock
+
+    @property
+    def description(self):
+        return str(self.address)
+
+    def _socket(self):
+        return socket.socket(self.family, socket.SOCK_STREAM, self.proto)
+
+    def open(self):
+        self.sock = self._socket()
+        self.sock.connect(self.address)
+
+    async def open_async(self, loop):
+        self.sock = self._socket()
+        self.sock.setblocking(False)
+        await loop.sock_connect(self.sock, self.address)
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def recv(self, size=1024):
+        return self.sock.recv(size)
+
+    def settimeout(self, timeout):
+        """Makes blocking recv raise TimeoutError after `timeout` seconds (None waits forever)."""
+        self.sock.settimeout(timeout)
+
+    def recv_pending(self, size=4096):
+        """Returns every byte that has already arrived, without blocking."""
+        chunks = []
+        # MSG_DONTWAIT alone still waits out a socket timeout (set by settimeout)
+        timeout = self.sock.gettimeout()
+        self.sock.setblocking(False)
+        try:
+            while True:
+                try:
+                    data = self.sock.recv(size)
+                except BlockingIOError:
+                    break
+                if not data:
+                    break
+                chunks.append(data)
+        finally:
+            self.sock.settimeout(timeout)
+        return b"".join(chunks)
+
+    async def send_async(self, loop, data):
+        await loop.sock_sendall(self.sock, data)
+
+    async def recv_async(self, loop, size=1024):
+        return await loop.sock_recv(self.sock, size)
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+class RfcommTransport(SocketTransport):
+    family = AF_BLUETOOTH
+    proto = BTPROTO_RFCOMM
+
+    def __init__(self, mac, channel=1):
+        super().__init__((mac, channel))
+
+    @property
+    def description(self):
+        return f"{self.address[0]} on channel {self.address[1]}"
+
+
+class TcpTransport(SocketTransport):
+    def __init__(self, host, port):
+        super().__init__((host, port))
+
+    @property
+    def description(self):
+        return f"{self.address[0]}:{self.address[1]} (TCP)"
+
+    def _socket(self):
+        sock = super()._socket()
+        # Status queries are tiny, don't let Nagle hold them back
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+
+class SerialTransport:
+    def __init__(self, device, baudrate=115200):
+        self.device = device
+        self.baudrate = baudrate
+        self.fd = None
+        self.timeout = None
+
+    @property
+    def description(self):
+        return f"{self.device} at {self.baudrate} baud"
+
+    def open(self):
+        self.fd = os.open(self.device, os.O_RDWR | os.O_NOCTTY)
+        try:
+            tty.setraw(self.fd)
+            attrs = termios.tcgetattr(self.fd)
+            speed = BAUDRATES.get(self.baudrate, termios.B115200)
+            attrs[4] = attrs[5] = speed # ispeed, ospeed
+            termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        except termios.error:
+            # Not a real tty (e.g. a FIFO in tests), raw bytes work anyway
+            pass
+
+    async def open_async(self, loop):
+        self.open()
+        os.set_blocking(self.fd, False)
+
+    def send(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def recv(self, size=1024):
+        if self.timeout is not None and not select.select([self.fd], [], [], self.timeout)[0]:
+            raise TimeoutError(f"No data from {self.device} for {self.timeout} s")
+        return os.read(self.fd, size)
+
+    def settimeout(self, timeout):
+        """Makes blocking recv raise TimeoutError after `timeout` seconds (None waits forever)."""
+        self.timeout = timeout
+
+    def recv_pending(self, size=4096):
+        """Returns every byte that has already arrived, without blocking."""
+        chunks = []
+        while select.select([self.fd], [], [], 0)[0]:
+            try:
+                data = os.read(self.fd, size)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            chunks.append(data)
+        return b"".join(chunks)
+
+    async def _wait(self, loop, add, remove):
+        ready = loop.create_future()
+        add(self.fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            remove(self.fd)
+
+    async def send_async(self, loop, data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.fd, view):]
+            except BlockingIOError:
+                await self._wait(loop, loop.add_writer, loop.remove_writer)
+
+    async def recv_async(self, loop, size=1024):
+        while True:
+            try:
+                return os.read(self.fd, size)
+            except BlockingIOError:
+                await self._wait(loop, loop.add_reader, loop.remove_reader)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def create_transport(cfg):
+    """Builds the transport selected by the `transport` setting."""
+    if cfg.transport == "tcp":
+        return TcpTransport(cfg.tcp_host, cfg.tcp_port)
+    if cfg.transport == "serial":
+        return SerialTransport(cfg.serial_port, cfg.serial_baudrate)
+    return RfcommTransport(cfg.bluetooth_mac, cfg.rfcomm_port)
@@ -0,0 +1,30 @@
+import sys
+import os
+from unittest.mock import patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from config import Config, DeviceConfig
+
+def make_config(**overrides):
+    """
+    A real Config with the built-in defaults (no config file, no environment)
+    and `overrides` set, so a setting a test doesn't mention is the default,
+    never a truthy Mock. Sinks run inline, so their effects are seen right away.
+    Tests patch monitor.Config to return it.
+    """
+    with patch.dict(os.environ, {}, clear=True):
+        cfg = Config("/nonexistent.yaml")
+    cfg.pipeline_queue_size = 0
+    cfg.bluetooth_mac = "00:00:00:00:00:00" # Passes validate()
+    for name, value in overrides.items():
+        setattr(cfg, name, value)
+    return cfg
+
+def make_device(name="laser", base=None, **overrides):
+    """A DeviceConfig for LaserMonitor(device=...), publishing to laser/status as node laserlink."""
+    device = DeviceConfig(base or make_config(), {"name": name, "topic": "laser/status", "node_id": "laserlink"})
+    for key, value in overrides.items():
+        setattr(device, key, value)
+    return device
@@ -0,0 +1,129 @@
+import sys
+import os
+import unittest
+import asyncio
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_config
+from monitor import LaserMonitor, LineQueue
+from transport import SocketTransport
+
+def fake_laser(sock, replies):
+    """Answers every '?' with the next status line, then hangs up."""
+    with sock:
+        for reply in replies:
+            if not sock.recv(16):
+                return
+            sock.sendall(reply.encode('utf-8'))
+
+class TestAsyncRunMode(unittest.TestCase):
+    @patch('monitor.Config')
+    def test_poll_session(self, mock_config_cls):
+        mock_config_cls.return_value = make_config(polling_interval=0.02)
+
+        monitor = LaserMonitor()
+        monitor.handle_state_change = MagicMock()
+
+        ours, theirs = socket.socketpair()
+        ours.setblocking(False)
+        replies = ["<Idle|MPos:0.000,0.000,0.000|FS:0,0>\n"] * 5 + [
+            # A status line split across two writes
+            "<Run|MPos:1.000,2.0", "00,0.000|FS:1000,500|A:S>\nok\n",
+        ]
+        laser = threading.Thread(target=fake_laser, args=(theirs, replies))
+        laser.start()
+
+        async def session():
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                await monitor._poll_session(loop, SocketTransport(sock=ours), executor)
+
+        with self.assertRaises(ConnectionError):
+            asyncio.run(asyncio.wait_for(session(), timeout=5))
+        laser.join()
+        ours.close()
+
+        states = [c.args[0]["detailed_status"] for c in monitor.handle_state_change.call_args_list]
+        self.assertEqual(states[:5], ["Idle"] * 5)
+        self.assertIn("Lasering", states)
+        self.assertGreaterEqual(monitor.poll_stats.summary()["samples"], 6)
+
+    @patch('monitor.Config')
+    def test_full_line_queue_keeps_replies(self, mock_config_cls):
+        mock_config_cls.return_value = make_config()
+        monitor = LaserMonitor()
+        dropped_before = monitor.metric_dropped.value
+
+        class Link:
+            def __init__(self, chunks):
+                self.chunks = list(chunks)
+
+            async def recv_async(self, loop, size):
+                if self.chunks:
+                    return self.chunks.pop(0)
+                await asyncio.Event().wait()
+
+        async def session():
+            loop = asyncio.get_running_loop()
+            lines = LineQueue(maxsize=3)
+            link = Link([b"<Idle|FS:0,1>\n[GC:G0 G54]\n<Idle|FS:0,2>\n<Idle|FS:0,3>\n<Idle|FS:0,4>\nALARM:1\n"])
+            reader = asyncio.create_task(monitor._link_reader(loop, link, lines))
+            await asyncio.sleep(0.01)
+            # The newest status stands in for the ones before it, the alarm waits for room
+            self.assertEqual(list(lines._queue), ["<Idle|FS:0,1>", "[GC:G0 G54]", "<Idle|FS:0,4>"])
+            self.assertFalse(reader.done())
+            lines.get_nowait()
+            lines.task_done()
+            await asyncio.sleep(0.01)
+            self.assertEqual(list(lines._queue), ["[GC:G0 G54]", "<Idle|FS:0,4>", "ALARM:1"])
+            reader.cancel()
+
+        with self.assertLogs(level='WARNING'):
+            asyncio.run(asyncio.wait_for(session(), timeout=5))
+        self.assertEqual(monitor.lines_dropped, 2)
+        self.assertEqual(monitor.metric_dropped.value - dropped_before, 2)
+
+    @patch('monitor.Config')
+    def test_session_ends_after_running_batch(self, mock_config_cls):
+        mock_config_cls.return_value = make_config()
+        monitor = LaserMonitor()
+        handled = threading.Event()
+
+        def slow_handle_lines(lines, safety_checked=False):
+            time.sleep(0.2)
+            handled.set()
+        monitor.handle_lines = slow_handle_lines
+
+        class Link:
+            def __init__(self):
+                self.reads = 0
+
+            async def send_async(self, loop, data):
+                pass
+
+            async def recv_async(self, loop, size):
+                self.reads += 1
+                if self.reads == 1:
+                    return b"<Run|MPos:0,0,0|FS:100,500|A:S>\n"
+                await asyncio.sleep(0.05)
+                raise ConnectionResetError("Connection reset by peer")
+
+        async def session():
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                with self.assertRaises(ConnectionResetError):
+                    await monitor._poll_session(loop, Link(), executor)
+                # Nothing is left running that could race the offline handling
+                self.assertTrue(handled.is_set())
+
+        asyncio.run(asyncio.wait_for(session(), timeout=5))
+
+if __name__ == '__main__':
+    unittest.main()
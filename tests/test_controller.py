@@ -0,0 +1,130 @@
+import sys
+import os
+import json
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_config, make_device
+from config import Config
+from controller import ERROR_RETRY
+from grbl_sim import SimulatorServer
+from monitor import LaserMonitor
+
+IDLE = "<Idle|MPos:0,0,0|FS:0,0>"
+
+class TestControllerCache(unittest.TestCase):
+    def setUp(self):
+        cfg = make_device("ortur", query_interval=300, pipeline_sinks=["mqtt"])
+        self.client = MagicMock()
+        self.monitor = LaserMonitor(device=cfg, mqtt_client=self.client)
+        self.cache = self.monitor.controller
+
+    def tearDown(self):
+        self.monitor.pipeline.close()
+
+    def published(self):
+        return [json.loads(c.args[1]) for c in self.client.publish.call_args_list if c.args[0] == "laser/status/controller"]
+
+    def test_one_query_per_poll_while_idle(self):
+        self.assertIsNone(self.cache.next_query(0.0, "Run"))
+        self.assertEqual(self.cache.next_query(0.0, "Idle"), b"$I\n")
+        # Nothing more until the reply is complete
+        self.assertIsNone(self.cache.next_query(0.1, "Idle"))
+        self.monitor.handle_lines([IDLE, "[VER:1.1h.20190825:Ortur]", "[OPT:V,15,128]"])
+        self.assertIsNone(self.cache.next_query(0.2, "Idle"))
+        self.monitor.handle_lines(["ok"])
+        self.assertEqual([self.cache.next_query(1.0, "Idle") for _ in range(2)], [b"$$\n", None])
+        self.monitor.handle_lines(["$30=255", "$32=1", "ok"])
+        self.assertEqual(self.cache.next_query(2.0, "Idle"), b"$G\n")
+        self.monitor.handle_lines(["[GC:G0 G54 G17 G21 G90 G94 M5 M9 T0 F0 S0]", "ok"])
+        self.assertEqual(self.cache.next_query(3.0, "Idle"), b"$#\n")
+        self.monitor.handle_lines(["[G54:1.000,2.000,0.000]", "[TLO:0.000]", "ok"])
+
+        # All fresh: nothing until query_interval has passed, and $I only once per connection
+        self.assertIsNone(self.cache.next_query(300.0, "Idle"))
+        self.assertEqual(self.cache.next_query(301.0, "Idle"), b"$$\n")
+
+        snapshot = self.published()[-1]
+        self.assertEqual(snapshot["build"], {"version": "1.1h.20190825", "name": "Ortur", "options": "V",
+                                             "planner_blocks": 15, "rx_buffer": 128})
+        self.assertEqual(snapshot["settings"], {"30": 255, "32": 1})
+        self.assertEqual(snapshot["modal"]["wcs"], "G54")
+        self.assertEqual(snapshot["offsets"], {"G54": {"x": 1.0, "y": 2.0, "z": 0.0}, "TLO": 0.0})
+        self.assertEqual(len(self.published()), 4)
+
+    def test_unchanged_replies_are_not_republished(self):
+        for _ in range(2):
+            self.cache.due["$$"] = 0.0
+            self.cache.next_query(0.0, "Idle")
+            self.monitor.handle_lines(["ok", "$30=1000", "ok"])
+        self.assertEqual(len(self.published()), 1)
+
+    def test_power_follows_30(self):
+        self.cache.pending = "$$"
+        self.monitor.handle_lines(["$30=255", "ok"])
+        self.assertEqual(self.monitor.parse_response("<Run|MPos:0,0,0|FS:1000,51>")["laser_power_pct"], 20.0)
+
+    def test_alarm_and_reconnect_invalidate(self):
+        self.cache.due = dict.fromkeys(self.cache.due, 1000.0)
+        self.cache.modal = {"wcs": "G55"}
+        self.monitor.handle_line("<Alarm|MPos:0,0,0|FS:0,0>")
+        self.assertEqual(self.cache.modal, {})
+        self.assertEqual(self.cache.next_query(1.0, "Alarm"), b"$$\n")
+
+        self.cache.settings = {30: 255}
+        self.monitor.note_connected()
+        self.assertEqual((self.cache.settings, self.cache.pending), ({}, None))
+        self.assertEqual(self.cache.next_query(1.0, "Idle"), b"$I\n")
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_off_unless_configured(self):
+        # Upgraded installs must not start querying the controller, nor lose their max_spindle_speed to $30
+        self.assertEqual(Config("/nonexistent.yaml").query_interval, 0)
+
+    def test_rejected_and_lost_queries(self):
+        self.assertEqual(self.cache.next_query(0.0, "Idle"), b"$I\n")
+        with patch("controller.time.monotonic", return_value=0.0):
+            self.monitor.handle_lines(["error:8"])
+        self.assertEqual(self.cache.due["$I"], ERROR_RETRY)
+        self.assertEqual(self.cache.next_query(0.0, "Idle"), b"$$\n")
+        # Never answered
+        self.assertIsNone(self.cache.next_query(5.0, "Idle"))
+        self.assertEqual(self.cache.next_query(11.0, "Idle"), b"$G\n")
+
+class TestWithSimulator(unittest.TestCase):
+    @patch('monitor.Config')
+    def test_cache_filled_without_slowing_polls(self, mock_config_cls):
+        sim = SimulatorServer().start()
+        mock_config_cls.return_value = make_config(query_interval=300, pipeline_sinks=["mqtt"], transport="tcp",
+                                                   tcp_host="127.0.0.1", tcp_port=sim.port, polling_interval=0.05,
+                                                   max_spindle_speed=255)
+
+        monitor = LaserMonitor()
+        monitor.pipeline.emit = MagicMock()
+
+        async def run_for(seconds):
+            try:
+                await asyncio.wait_for(monitor._run_async(), seconds)
+            except asyncio.TimeoutError:
+                pass
+
+        try:
+            asyncio.run(run_for(1.0))
+        finally:
+            sim.stop()
+
+        snapshots = [c.args[1] for c in monitor.pipeline.emit.call_args_list if c.args[0] == "controller"]
+        self.assertEqual(len(snapshots), 4)
+        self.assertEqual(snapshots[-1]["build"]["version"], "1.1h.20190825")
+        self.assertEqual(snapshots[-1]["settings"]["30"], 1000)
+        self.assertEqual(sorted(snapshots[-1]["offsets"])[:2], ["G28", "G30"])
+        self.assertEqual(monitor.max_spindle_speed, 1000)
+        self.assertEqual(monitor.controller.queries_sent, 4)
+        self.assertGreaterEqual(monitor.poll_stats.summary()["samples"], 15)
+
+if __name__ == '__main__':
+    unittest.main()
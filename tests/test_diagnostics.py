@@ -0,0 +1,75 @@
+import sys
+import os
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import diagnostics
+from diagnostics import LinkProbe, recommend_interval, percentiles
+from debug_env import main
+from grbl_sim import SimulatorServer, LinkFaults
+from helpers import make_config
+from transport import TcpTransport
+
+class TestRecommendation(unittest.TestCase):
+    def test_headroom_and_rounding(self):
+        self.assertEqual(recommend_interval(0.012, 0.05), 0.1)
+        # A slow link: twice its p99 round trip
+        self.assertEqual(recommend_interval(0.180, 0.1), 0.4)
+        self.assertEqual(recommend_interval(0.001, None), 0.05)
+
+    def test_percentiles(self):
+        stats = percentiles([i / 1000 for i in range(1, 101)])
+        self.assertEqual((stats["samples"], stats["p50_ms"], stats["max_ms"]), (100, 51.0, 100.0))
+        self.assertEqual(percentiles([]), {"samples": 0})
+
+class TestLinkProbe(unittest.TestCase):
+    def probe(self, faults=None):
+        self.sim = SimulatorServer(faults=faults).start()
+        self.addCleanup(self.sim.stop)
+        probe = LinkProbe(TcpTransport("127.0.0.1", self.sim.port), timeout=0.5)
+        self.addCleanup(probe.close)
+        probe.open()
+        return probe
+
+    def test_round_trips_and_reconnect(self):
+        probe = self.probe(LinkFaults(latency=0.02))
+        rtts, lost = probe.round_trips(10, pause=0)
+        self.assertEqual((len(rtts), lost), (10, 0))
+        self.assertTrue(all(0.015 < rtt < 0.5 for rtt in rtts))
+        self.assertGreater(probe.reconnect(), 0.015)
+
+    def test_lost_replies(self):
+        # The queries never reach the laser
+        probe = self.probe()
+        probe.link.send = MagicMock()
+        rtts, lost = probe.round_trips(2, pause=0)
+        self.assertEqual((rtts, lost), ([], 2))
+
+    def test_max_rate_stops_where_replies_fall_behind(self):
+        probe = self.probe(LinkFaults(latency=0.03))
+        results = probe.max_rate(intervals=(0.2, 0.1, 0.02), duration=0.5)
+        self.assertEqual([r["sustainable"] for r in results], [True, True, False])
+        self.assertEqual(results[0]["answered"], results[0]["sent"])
+
+class TestDebugEnv(unittest.TestCase):
+    def test_link_report(self):
+        sim = SimulatorServer().start()
+        self.addCleanup(sim.stop)
+        cfg = make_config(transport="tcp", tcp_host="127.0.0.1", tcp_port=sim.port, link_timeout=1.0)
+        output = io.StringIO()
+        with patch("debug_env.Config", return_value=cfg), \
+             patch.object(diagnostics, "PROBE_INTERVALS", (0.1, 0.05)), redirect_stdout(output):
+            main(["--link", "--samples", "5", "--duration", "0.3"])
+        text = output.getvalue()
+        self.assertIn("'?' round trip: p50", text)
+        self.assertIn("Unanswered: 0 (0.0%)", text)
+        self.assertIn("Fastest sustainable interval: 0.05 s", text)
+        self.assertIn("Recommended polling_interval: 0.1 (configured: 0.5)", text)
+
+if __name__ == '__main__':
+    unittest.main()
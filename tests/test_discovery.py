@@ -0,0 +1,170 @@
+import sys
+import os
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import paho.mqtt.client as mqtt
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_config
+from discovery import DiscoveryRegistry, wait_for_publish
+from monitor import LaserMonitor
+
+class FakeBroker:
+    """A paho client connected to an in-memory broker that keeps retained messages."""
+    def __init__(self, retained=None):
+        self.retained = dict(retained or {})
+        self.callbacks = {}
+        self.subscriptions = set()
+        self.published = []
+
+    def message_callback_add(self, sub, callback):
+        self.callbacks[sub] = callback
+
+    def subscribe(self, filters):
+        for sub, _ in filters:
+            self.subscriptions.add(sub)
+            for topic, payload in list(self.retained.items()):
+                if mqtt.topic_matches_sub(sub, topic):
+                    self._deliver(sub, topic, payload, retain=True)
+
+    def unsubscribe(self, filters):
+        self.subscriptions.difference_update(filters)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        payload = payload.encode() if isinstance(payload, str) else payload
+        self.published.append((topic, payload, qos, retain))
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        for sub in list(self.subscriptions):
+            if mqtt.topic_matches_sub(sub, topic):
+                self._deliver(sub, topic, payload, retain=False)
+        return SimpleNamespace(rc=0, is_published=lambda: True, wait_for_publish=lambda timeout=None: None)
+
+    def _deliver(self, sub, topic, payload, retain):
+        self.callbacks[sub](self, None, SimpleNamespace(topic=topic, payload=payload, retain=retain))
+
+    def configs(self):
+        return [topic for topic, _, _, _ in self.published if topic.endswith("/config")]
+
+    # What LaserMonitor.setup_mqtt calls besides
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def socket(self):
+        return None
+
+    def connect(self):
+        self.on_connect(self, None, {}, 0)
+
+def make_registry():
+    registry = DiscoveryRegistry("homeassistant", "laserlink", "laser/status/discovery/sync")
+    registry.add("sensor", "status", {"name": "Laser Status", "state_topic": "laser/status"})
+    registry.add("sensor", "speed", {"name": "Laser Speed", "state_topic": "laser/status"})
+    registry.add("binary_sensor", "job_active", {"name": "Laser Job Active", "state_topic": "laser/status"})
+    return registry
+
+class TestDiscoveryRegistry(unittest.TestCase):
+    def test_only_changed_configs_are_published(self):
+        registry, broker = make_registry(), FakeBroker()
+        self.assertEqual(len(registry.publish(broker)), 3)
+        self.assertEqual(registry.publish(broker), [])
+        self.assertTrue(all(qos == 1 and retain for _, _, qos, retain in broker.published))
+
+        registry.add("sensor", "speed", {"name": "Laser Speed", "state_topic": "laser/status", "unit_of_measurement": "mm/min"})
+        registry.publish(broker)
+        self.assertEqual(broker.configs()[3:], ["homeassistant/sensor/laserlink/speed/config"])
+
+    def test_sync_repairs_lost_and_clears_stale_configs(self):
+        registry = make_registry()
+        registry.publish(FakeBroker())
+        # A broker that lost one config and still has one of a sensor that was removed
+        broker = FakeBroker({
+            "homeassistant/sensor/laserlink/status/config": registry.entities["homeassistant/sensor/laserlink/status/config"].encode(),
+            "homeassistant/binary_sensor/laserlink/job_active/config": registry.entities["homeassistant/binary_sensor/laserlink/job_active/config"].encode(),
+            "homeassistant/sensor/laserlink/spindle_speed/config": b'{"name": "old"}',
+            "homeassistant/sensor/other_node/status/config": b'{"name": "not ours"}',
+        })
+        registry.sync(broker)
+        self.assertTrue(registry.synced.is_set())
+        self.assertEqual(broker.configs(), ["homeassistant/sensor/laserlink/spindle_speed/config",
+                                            "homeassistant/sensor/laserlink/speed/config"])
+        self.assertEqual(sorted(broker.retained), sorted(registry.entities) + ["homeassistant/sensor/other_node/status/config"])
+        self.assertEqual(broker.subscriptions, set())
+
+    def test_unanswered_sync_changes_nothing(self):
+        registry, broker = make_registry(), FakeBroker()
+        registry.publish(broker)
+        broker.callbacks = {}
+        broker.subscribe = MagicMock()
+        registry.sync(broker)
+        self.assertFalse(registry.synced.is_set())
+        self.assertEqual(registry.changed(), [])
+
+    def test_clear_everything_of_the_node(self):
+        broker = FakeBroker({
+            "homeassistant/sensor/laserlink/status/config": b"{}",
+            "homeassistant/sensor/laserlink/pos_z/config": b"{}",
+            "homeassistant/binary_sensor/laserlink/job_active/config": b"{}",
+            "homeassistant/sensor/other_node/status/config": b"{}",
+        })
+        registry = DiscoveryRegistry("homeassistant", "laserlink", "sync")
+        registry.sync(broker, repair=False)
+        self.assertEqual(broker.configs(), [])
+        infos = registry.clear(broker)
+        self.assertEqual(wait_for_publish(infos, 1), 3)
+        self.assertEqual(list(broker.retained), ["homeassistant/sensor/other_node/status/config"])
+
+    def test_wait_for_publish_gives_up_at_the_deadline(self):
+        unacked = MagicMock(rc=0)
+        unacked.is_published.return_value = False
+        failed = MagicMock(rc=4)
+        self.assertEqual(wait_for_publish([unacked, failed], 0.01), 0)
+        failed.wait_for_publish.assert_not_called()
+
+class TestMonitorDiscovery(unittest.TestCase):
+    @patch('monitor.Config')
+    def make_monitor(self, broker, mock_config_cls):
+        mock_config_cls.return_value = make_config(mqtt_enabled=True, ha_enabled=True, ha_device_name="Laser",
+                                                   query_interval=0, pipeline_sinks=[])
+        with patch('monitor.mqtt.Client', return_value=broker):
+            return LaserMonitor()
+
+    def test_connect_publishes_only_what_the_broker_lacks(self):
+        broker = FakeBroker()
+        self.make_monitor(broker)
+        broker.connect()
+        configs = broker.configs()
+        self.assertEqual(len(configs), 7)
+        self.assertIn("homeassistant/binary_sensor/laserlink/safety/config", configs)
+        self.assertEqual(json.loads(broker.retained["homeassistant/sensor/laserlink/status/config"])["name"], "Laser Status")
+
+    def test_retained_configs_are_not_republished(self):
+        broker = FakeBroker()
+        self.make_monitor(broker)
+        broker.connect()
+        broker.published.clear()
+
+        # Reconnecting, and a restarted daemon that knows nothing yet, find every config retained
+        broker.connect()
+        self.make_monitor(broker)
+        broker.connect()
+        self.assertEqual(broker.configs(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import sys
+import os
+import socket
+import time
+import unittest
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_device
+from framing import LineFramer
+from transport import SocketTransport
+from monitor import LaserMonitor
+
+class TestLineFramer(unittest.TestCase):
+    def test_lines_split_across_reads(self):
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b"<Idle|MPos:0,0"), [])
+        self.assertEqual(framer.feed(b",0>\r\nok\r\n<Run"), ["<Idle|MPos:0,0,0>", "ok"])
+        self.assertEqual(framer.feed(b"|MPos:1,2,3>\r\n\r\n"), ["<Run|MPos:1,2,3>"])
+        self.assertEqual(len(framer.buffer), 0)
+
+    def test_multibyte_sequence_split_across_reads(self):
+        framer = LineFramer()
+        message = "[MSG:Température]\n".encode()
+        split = message.index(b"\xc3") + 1
+        self.assertEqual(framer.feed(message[:split]), [])
+        self.assertEqual(framer.feed(message[split:]), ["[MSG:Température]"])
+
+    def test_buffer_is_capped(self):
+        framer = LineFramer(max_buffer=64)
+        self.assertEqual(framer.feed(b"x" * 100), [])
+        self.assertEqual(framer.overflows, 1)
+        self.assertEqual(len(framer.buffer), 0)
+        # The rest of the overlong line is dropped, the next line is intact
+        self.assertEqual(framer.feed(b"yyy\nok\n"), ["ok"])
+
+class TestRecvPending(unittest.TestCase):
+    def test_drains_without_blocking(self):
+        ours, theirs = socket.socketpair()
+        link = SocketTransport(sock=ours)
+        try:
+            self.assertEqual(link.recv_pending(), b"")
+            theirs.sendall(b"a" * 5000)
+            theirs.sendall(b"b" * 10)
+            self.assertEqual(len(link.recv_pending()), 5010)
+        finally:
+            link.close()
+            theirs.close()
+
+    def test_ignores_the_link_timeout(self):
+        ours, theirs = socket.socketpair()
+        link = SocketTransport(sock=ours)
+        link.settimeout(5)
+        try:
+            start = time.monotonic()
+            self.assertEqual(link.recv_pending(), b"")
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual(ours.gettimeout(), 5)
+        finally:
+            link.close()
+            theirs.close()
+
+class TestHandleLines(unittest.TestCase):
+    def setUp(self):
+        cfg = make_device()
+        self.monitor = LaserMonitor(device=cfg, mqtt_client=MagicMock())
+        self.monitor.handle_state_change = MagicMock()
+
+    def handled(self):
+        return [c.args[0]["mpos"]["x"] for c in self.monitor.handle_state_change.call_args_list]
+
+    def test_only_newest_status_is_handled(self):
+        self.monitor.handle_lines([
+            "<Run|MPos:1,0,0|FS:1000,800|A:S>", "ok",
+            "<Run|MPos:2,0,0|FS:1000,800|A:S>",
+            "<Run|MPos:3,0,0|FS:1000,800|A:S>",
+        ])
+        self.assertEqual(self.handled(), [3.0])
+        self.assertEqual(self.monitor.status_skipped, 2)
+
+    def test_transitions_are_kept(self):
+        self.monitor.handle_lines([
+            "<Idle|MPos:0,0,0|FS:0,0>",
+            "<Run|MPos:1,0,0|FS:1000,800|A:S>",
+            "<Run|MPos:2,0,0|FS:1000,800|A:S>",
+            "<Idle|MPos:3,0,0|FS:0,0>",
+        ])
+        self.assertEqual(self.handled(), [0.0, 2.0, 3.0])
+        self.assertEqual(self.monitor.status_skipped, 1)
+
+if __name__ == '__main__':
+    unittest.main()
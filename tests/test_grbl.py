@@ -0,0 +1,122 @@
+import sys
+import os
+import unittest
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from grbl import FieldCache, parse_status, parse_setting, parse_modal, parse_offset, parse_build_info
+
+class TestParseStatus(unittest.TestCase):
+    def test_basic_fields(self):
+        data = parse_status("<Run|MPos:34.900,53.963,0.000|FS:1000,100|Ov:100,90,80|A:SF>")
+        self.assertEqual(data["state"], "Run")
+        self.assertEqual(data["mpos"], {"x": 34.9, "y": 53.963, "z": 0.0})
+        self.assertEqual(data["feed_rate"], 1000)
+        self.assertEqual(data["spindle_speed"], 100)
+        self.assertEqual(data["laser_power_pct"], 10.0)
+        self.assertEqual(data["overrides"], {"feed": 100, "rapid": 90, "spindle": 80})
+        self.assertTrue(data["accessories"]["spindle_enabled"])
+        self.assertTrue(data["accessories"]["flood_coolant"])
+        self.assertFalse(data["accessories"]["mist_coolant"])
+        self.assertEqual(data["detailed_status"], "Lasering")
+
+    def test_all_grbl_fields(self):
+        line = "<Hold:1|WPos:1.000,2.000,3.000|Bf:15,128|Ln:99|F:500|WCO:10.000,20.000,0.000|Pn:XYP>"
+        data = parse_status(line)
+        self.assertEqual(data["state"], "Hold:1")
+        self.assertEqual(data["substate"], 1)
+        self.assertEqual(data["wpos"], {"x": 1.0, "y": 2.0, "z": 3.0})
+        self.assertEqual(data["wco"], {"x": 10.0, "y": 20.0, "z": 0.0})
+        self.assertEqual(data["buffer"], {"planner_blocks": 15, "rx_bytes": 128})
+        self.assertEqual(data["line_number"], 99)
+        self.assertEqual(data["feed_rate"], 500)
+        self.assertEqual(data["pins"], "XYP")
+        self.assertNotIn("spindle_speed", data)
+        self.assertEqual(data["detailed_status"], "Hold:1")
+
+    def test_grblhal_extensions(self):
+        data = parse_status("<Idle|MPos:0.000,0.000,0.000,90.000|FS:0.0,0|SD:12.5,job.nc|H:1,7>")
+        self.assertEqual(data["mpos"]["a"], 90.0)
+        self.assertEqual(data["feed_rate"], 0.0)
+        self.assertEqual(data["extra"], {"SD": "12.5,job.nc", "H": "1,7"})
+
+    def test_detailed_status(self):
+        self.assertEqual(parse_status("<Run|MPos:0,0,0|FS:100,0>")["detailed_status"], "Moving")
+        self.assertEqual(parse_status("<Run|MPos:0,0,0|FS:100,10|A:S>")["detailed_status"], "Framing")
+        self.assertEqual(parse_status("<Run|MPos:0,0,0|FS:100,10|A:SM>")["detailed_status"], "Lasering")
+        self.assertEqual(parse_status("<Run|MPos:0,0,0|FS:100,500|A:S>", framing_threshold=20)["detailed_status"], "Lasering")
+
+    def test_missing_accessories_default_off(self):
+        data = parse_status("<Idle|MPos:0,0,0|FS:0,0>")
+        self.assertEqual(data["accessories"], {
+            "spindle_enabled": False, "flood_coolant": False, "mist_coolant": False
+        })
+
+    def test_garbled_field_is_skipped(self):
+        data = parse_status("<Run|MPos:1.0,2.0,3.0|FS:12x,0|A:S>")
+        self.assertEqual(data["mpos"]["x"], 1.0)
+        self.assertNotIn("feed_rate", data)
+        self.assertTrue(data["accessories"]["spindle_enabled"])
+
+    def test_field_cache_shares_unchanged_fields(self):
+        cache = FieldCache()
+        first = parse_status("<Run|MPos:1.000,2.000,0.000|Bf:15,128|FS:1000,100|Ov:100,100,100|A:SF>", cache=cache)
+        second = parse_status("<Run|MPos:1.500,2.000,0.000|Bf:15,128|FS:1000,100|Ov:100,100,100|A:SF>", cache=cache)
+        self.assertIsNot(first, second)
+        self.assertIs(first["overrides"], second["overrides"])
+        self.assertIs(first["buffer"], second["buffer"])
+        self.assertIs(first["accessories"], second["accessories"])
+        self.assertIsNot(first["mpos"], second["mpos"])
+        self.assertEqual(first["mpos"], {"x": 1.0, "y": 2.0, "z": 0.0})
+        # Same result as without the cache
+        line = "<Idle|WPos:1,2,3|WCO:0,0,1|Bf:15,128|FS:0,0|Pn:XZ>"
+        self.assertEqual(parse_status(line, cache=cache), parse_status(line))
+
+    def test_field_cache_repeated_report(self):
+        cache = FieldCache()
+        line = "<Idle|MPos:0.000,0.000,0.000|FS:0,500>"
+        first = parse_status(line, cache=cache)
+        first["timestamp"] = 1.0
+        second = parse_status(line, cache=cache)
+        # A new dict every time, without what the caller added to the previous one
+        self.assertIsNot(first, second)
+        self.assertNotIn("timestamp", second)
+        self.assertEqual(second["laser_power_pct"], 50.0)
+        # $30 changed, the same report is worth another power
+        self.assertEqual(parse_status(line, 500, cache=cache)["laser_power_pct"], 100.0)
+
+    def test_not_a_status_report(self):
+        self.assertIsNone(parse_status("ok"))
+        self.assertIsNone(parse_status("[MSG:'$H'|'$X' to unlock]"))
+        self.assertIsNone(parse_status("<>"))
+
+class TestQueryReplies(unittest.TestCase):
+    def test_settings(self):
+        self.assertEqual(parse_setting("$30=1000"), (30, 1000))
+        self.assertEqual(parse_setting("$110=6000.000"), (110, 6000.0))
+        self.assertEqual(parse_setting("$300=grblHAL"), (300, "grblHAL"))
+        self.assertIsNone(parse_setting("$N0="))
+        self.assertIsNone(parse_setting("ok"))
+
+    def test_parser_state(self):
+        modal = parse_modal("[GC:G1 G55 G17 G21 G91 G94 M0 M4 M7 M8 T1 F1500 S800.5]")
+        self.assertEqual(modal, {"motion": "G1", "wcs": "G55", "plane": "G17", "units": "G21", "distance": "G91",
+                                 "feed_mode": "G94", "program": "M0", "spindle": "M4", "coolant": "M7 M8",
+                                 "tool": 1, "feed": 1500, "spindle_speed": 800.5})
+        self.assertIsNone(parse_modal("[G54:0.000,0.000,0.000]"))
+
+    def test_offsets(self):
+        self.assertEqual(parse_offset("[G54:-10.000,5.500,0.000]"), ("G54", {"x": -10.0, "y": 5.5, "z": 0.0}))
+        self.assertEqual(parse_offset("[TLO:1.250]"), ("TLO", 1.25))
+        self.assertEqual(parse_offset("[PRB:1.000,2.000,3.000:1]"), ("PRB", {"x": 1.0, "y": 2.0, "z": 3.0, "success": True}))
+        self.assertIsNone(parse_offset("[GC:G0 G54]"))
+        self.assertIsNone(parse_offset("[MSG:Caution: Unlocked]"))
+
+    def test_build_info(self):
+        self.assertEqual(parse_build_info("[VER:1.1h.20190825:Ortur]"), {"version": "1.1h.20190825", "name": "Ortur"})
+        self.assertEqual(parse_build_info("[OPT:VL,35,254]"), {"options": "VL", "planner_blocks": 35, "rx_buffer": 254})
+        self.assertIsNone(parse_build_info("ok"))
+
+if __name__ == '__main__':
+    unittest.main()
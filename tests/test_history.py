@@ -0,0 +1,122 @@
+import sys
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from history import JobHistory, jobs_per_day, utilization, longest_jobs
+
+def status(detailed, x=0.0):
+    return {"state": "Run", "detailed_status": detailed, "mpos": {"x": x, "y": 0.0, "z": 0.0},
+            "feed_rate": 1500, "laser_power_pct": 80.0}
+
+def job(ended, duration, lasering):
+    return {"started": ended - duration, "ended": ended, "duration_s": duration, "lasering_s": lasering,
+            "travel_mm": 100.0, "lasering_mm": 50.0, "mean_power_pct": 80.0, "peak_feed": 1500}
+
+class TestJobHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "history.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_batched_writes_and_queries(self):
+        history = JobHistory(self.path, flush_interval=60, sample_interval=5)
+        history.start()
+        now = time.time()
+        # Same status within the sample interval is thinned out, a change is always kept
+        for i in range(10):
+            history.record_status("sculpfun", now + i, status("Lasering", x=i), True)
+        history.record_status("sculpfun", now + 10, status("Idle"), False)
+        history.record_job("sculpfun", job(now - 3600, 1800, 1200))
+        history.record_job("sculpfun", job(now, 600, 300))
+        history.record_job("ortur", job(now, 3600, 3000))
+
+        # Nothing is written until the flush interval or stop()
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0], 0)
+        history.stop()
+
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0], 3)
+        self.assertEqual(history.flushes, 1)
+
+        days = jobs_per_day(conn, days=2)
+        self.assertEqual(sum(day["jobs"] for day in days), 3)
+        self.assertEqual(jobs_per_day(conn, days=2, device="ortur")[0]["job_minutes"], 60.0)
+
+        usage = {row["device"]: row for row in utilization(conn, days=1)}
+        self.assertEqual(usage["sculpfun"]["job_pct"], round(2400 / 86400 * 100, 2))
+        self.assertEqual(usage["ortur"]["lasering_pct"], round(3000 / 86400 * 100, 2))
+
+        longest = longest_jobs(conn, limit=2)
+        self.assertEqual([row["duration_s"] for row in longest], [3600, 1800])
+        conn.close()
+
+    @patch('history.PRUNE_BATCH', 4)
+    def test_old_telemetry_is_deleted(self):
+        now = time.time()
+        history = JobHistory(self.path, flush_interval=60, retention_days=30)
+        history.start()
+        history.stop()
+        conn = sqlite3.connect(self.path)
+        with conn:
+            conn.executemany("INSERT INTO telemetry (device, t, status) VALUES ('sculpfun', ?, 'Idle')",
+                             [(now - (day + 0.5) * 86400,) for day in range(0, 60, 5)])
+        history.record_job("sculpfun", job(now - 50 * 86400, 600, 300))
+        history.start()
+        history.stop()
+
+        # 30.5..55.5 days old: six rows, in two batches
+        self.assertEqual(history.pruned, 6)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0], 6)
+        self.assertEqual(conn.execute("SELECT MIN(t) FROM telemetry").fetchone()[0], now - 25.5 * 86400)
+        # Jobs are kept
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0], 1)
+        conn.close()
+
+    def test_full_queue_never_blocks(self):
+        history = JobHistory(self.path, sample_interval=0, queue_size=5)
+        # Writer not started, so nothing drains the queue
+        start = time.monotonic()
+        for i in range(20):
+            history.record_status("sculpfun", float(i), status("Lasering"), True)
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertEqual(history.dropped, 15)
+
+    def test_stop_with_full_queue(self):
+        history = JobHistory(self.path, sample_interval=0, batch_size=2, queue_size=5)
+        flushing = threading.Event()
+        flush = history._flush
+
+        def slow_flush(conn, batch):
+            flushing.set()
+            time.sleep(0.2)
+            flush(conn, batch)
+        history._flush = slow_flush
+
+        for i in range(5):
+            history.record_status("sculpfun", float(i), status("Lasering"), True)
+        history.start()
+        flushing.wait(5)
+        # The writer is busy with the first batch, fill the queue again
+        for i in range(5, 7):
+            history.record_status("sculpfun", float(i), status("Lasering"), True)
+        self.assertTrue(history.queue.full())
+
+        start = time.monotonic()
+        history.stop()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(history.dropped, 0)
+        self.assertEqual(history.written, 7)
+
+if __name__ == '__main__':
+    unittest.main()
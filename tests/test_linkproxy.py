@@ -0,0 +1,166 @@
+import sys
+import os
+import socket
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from grbl_sim import SimulatorServer
+from linkproxy import LinkProxy, ProxyTransport
+from transport import TcpTransport
+
+def read_lines(sock, count, buffer=b""):
+    """Returns (first `count` lines, rest of the buffer)."""
+    while buffer.count(b"\n") < count:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError("closed")
+        buffer += chunk
+    lines = buffer.split(b"\r\n")
+    return [line.decode() for line in lines[:count]], b"\r\n".join(lines[count:])
+
+class FakeClient:
+    def __init__(self, monitor=False):
+        self.monitor = monitor
+        self.name = "fake"
+        self.buffer = bytearray()
+        self.wants_status = False
+        self.received = []
+
+    def write(self, data):
+        self.received.append(data.decode().strip())
+
+class TestRouting(unittest.TestCase):
+    """The routing rules, without a loop or a laser."""
+    def setUp(self):
+        self.proxy = LinkProxy(rx_buffer=28)
+        self.proxy.link = object()
+        self.proxy.wake = MagicMock()
+        self.monitor, self.lightburn = FakeClient(monitor=True), FakeClient()
+        self.proxy.clients = {self.monitor, self.lightburn}
+
+    def sent(self):
+        data = b"".join(chunk for chunk, _ in self.proxy.outgoing)
+        self.proxy.outgoing.clear()
+        return data
+
+    def test_replies_go_to_the_sender(self):
+        self.proxy._from_client(self.lightburn, b"G1 X1\n$G\n")
+        self.proxy._from_client(self.monitor, b"?\n")
+        self.assertEqual(self.sent(), b"G1 X1\n$G\n?")
+        # The monitor's empty line is answered by the proxy
+        self.assertEqual(self.monitor.received, ["ok"])
+
+        for line in ["<Idle|MPos:0,0,0|FS:0,0>", "ok", "[GC:G0 G54 G17 G21 G90 G94 M5 M9 T0 F0 S0]", "ok", "ALARM:1"]:
+            self.proxy._route(line)
+        self.assertEqual(self.monitor.received, ["ok", "<Idle|MPos:0,0,0|FS:0,0>", "ALARM:1"])
+        self.assertEqual(self.lightburn.received, ["ok", "[GC:G0 G54 G17 G21 G90 G94 M5 M9 T0 F0 S0]", "ok", "ALARM:1"])
+
+    def test_status_only_to_clients_that_asked(self):
+        self.proxy._from_client(self.lightburn, b"?")
+        self.proxy._route("<Run|MPos:1,0,0|FS:1000,800>")
+        self.proxy._route("<Run|MPos:2,0,0|FS:1000,800>")
+        self.assertEqual(len(self.lightburn.received), 1)
+        self.assertEqual(len(self.monitor.received), 2)
+
+    def test_realtime_bytes_jump_the_line(self):
+        self.proxy._from_client(self.lightburn, b"G1 X1")
+        self.proxy._from_client(self.monitor, b"?")
+        self.proxy._from_client(self.lightburn, b"0!\r\n")
+        self.assertEqual(self.sent(), b"?!G1 X10\n")
+        # \r and \n each end a line in GRBL: the empty one is answered here
+        self.assertEqual(self.lightburn.received, ["ok"])
+
+    def test_shared_receive_buffer(self):
+        # Each sender fills the buffer on its own; together they would overflow it
+        self.proxy._from_client(self.lightburn, b"G1 X10 Y10 F1000\n") # 17 bytes
+        self.proxy._from_client(self.monitor, b"$G\n$#\n$I\n$$\n") # 12 bytes
+        self.assertEqual(self.sent(), b"G1 X10 Y10 F1000\n$G\n$#\n$I\n")
+        self.assertEqual(self.proxy.in_flight, 26)
+        self.proxy._route("ok")
+        self.assertEqual(self.sent(), b"$$\n")
+        self.assertEqual((self.proxy.held, self.proxy.in_flight), (1, 12))
+
+        # A reset empties GRBL's buffer: no replies will come for what was in flight
+        self.proxy._from_client(self.lightburn, b"\x18")
+        self.assertEqual((len(self.proxy.pending), self.proxy.in_flight), (0, 0))
+
+class TestLinkProxy(unittest.TestCase):
+    def setUp(self):
+        self.sim = SimulatorServer().start()
+        self.proxy = LinkProxy("127.0.0.1", 0, device="test").start()
+
+    def tearDown(self):
+        self.proxy.stop()
+        self.sim.stop()
+
+    def test_monitor_and_control_software_share_the_laser(self):
+        link = ProxyTransport(TcpTransport("127.0.0.1", self.sim.port), self.proxy)
+        link.open()
+        link.settimeout(5)
+        lightburn = socket.create_connection(("127.0.0.1", self.proxy.port), timeout=5)
+
+        link.send(b"?\n")
+        lines, monitor_rest = read_lines(link.sock, 2)
+        self.assertEqual(sorted(line[0] for line in lines), ["<", "o"])
+
+        lightburn.sendall(b"G1 X5 F1000\n$I\n")
+        lines, _ = read_lines(lightburn, 4)
+        self.assertEqual(lines, ["ok", "[VER:1.1h.20190825:LaserLink simulator]", "[OPT:V,15,128]", "ok"])
+        # None of it reached the monitor
+        link.sock.settimeout(0.2)
+        with self.assertRaises(socket.timeout):
+            link.sock.recv(4096)
+        self.assertEqual(self.proxy.stats()["lines"], 2)
+
+        # The monitor closing its link closes the laser link, and the control software hears about it
+        link.close()
+        lines, _ = read_lines(lightburn, 1)
+        self.assertEqual(lines, ["[MSG:LaserLink: laser link closed]"])
+        self.assertTrue(wait_for(lambda: self.proxy.link is None))
+        lightburn.close()
+
+    def test_pseudo_terminal(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ttyLaser")
+            proxy = LinkProxy(port=None, pty_link=path, device="pty").start()
+            try:
+                link = ProxyTransport(TcpTransport("127.0.0.1", self.sim.port), proxy)
+                link.open()
+                fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+                os.write(fd, b"$I\n")
+                received = b""
+                while received.count(b"\n") < 3:
+                    received += os.read(fd, 1024)
+                self.assertTrue(received.endswith(b"ok\r\n"))
+                os.close(fd)
+                link.close()
+            finally:
+                proxy.stop()
+            self.assertFalse(os.path.lexists(path))
+
+    def test_laser_going_away_closes_the_monitor_link(self):
+        laser = socket.create_server(("127.0.0.1", 0))
+        link = ProxyTransport(TcpTransport(*laser.getsockname()), self.proxy)
+        link.open()
+        link.settimeout(5)
+        laser.accept()[0].close()
+        self.assertEqual(link.recv(), b"")
+        self.assertTrue(wait_for(lambda: self.proxy.link is None))
+        link.close()
+        laser.close()
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import sys
+import os
+import json
+import socket
+import struct
+import time
+import unittest
+import urllib.request
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_device
+import liveserver
+from liveserver import LiveServer
+from monitor import LaserMonitor
+
+STATUS = {"state": "Run", "detailed_status": "Lasering", "mpos": {"x": 1.0, "y": 2.0, "z": 0.0}, "raw": "<Run|...>"}
+
+def connect(port, request):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    sock.sendall(request)
+    return sock
+
+def read_until(sock, marker, buffer=b""):
+    while marker not in buffer:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("closed")
+        buffer += chunk
+    return buffer
+
+def read_at_least(sock, buffer, size):
+    while len(buffer) < size:
+        buffer += sock.recv(65536)
+    return buffer
+
+def read_sse(sock, buffer):
+    """Returns (message, rest of the buffer)."""
+    buffer = read_until(sock, b"\n\n", buffer)
+    event, rest = buffer.split(b"\n\n", 1)
+    return json.loads(event[len(b"data: "):]), rest
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+class TestLiveServer(unittest.TestCase):
+    def setUp(self):
+        self.server = LiveServer("127.0.0.1", 0).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get(self, path):
+        return urllib.request.urlopen(f"http://127.0.0.1:{self.server.port}{path}", timeout=5)
+
+    def test_latest_status(self):
+        self.server.publish("ortur", "status", STATUS)
+        self.server.publish("ortur", "job_started", {"started": 1.0})
+        self.assertTrue(wait_for(lambda: "ortur" in self.server.latest))
+
+        everything = json.loads(self.get("/status").read())
+        self.assertEqual(everything["ortur"]["detailed_status"], "Lasering")
+        self.assertNotIn("raw", everything["ortur"])
+        self.assertEqual(json.loads(self.get("/status/ortur").read())["mpos"]["x"], 1.0)
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.get("/status/other")
+        self.assertEqual(cm.exception.code, 404)
+
+    def test_sse_stream(self):
+        self.server.publish("ortur", "status", STATUS)
+        self.assertTrue(wait_for(lambda: "ortur" in self.server.latest))
+        sock = connect(self.server.port, b"GET /events?device=ortur HTTP/1.1\r\nHost: x\r\n\r\n")
+        head, rest = read_until(sock, b"\r\n\r\n").split(b"\r\n\r\n", 1)
+        self.assertIn(b"text/event-stream", head)
+
+        # The current state first, then new events; other lasers are filtered out
+        first, rest = read_sse(sock, rest)
+        self.assertEqual((first["device"], first["event"]), ("ortur", "status"))
+        self.assertTrue(wait_for(lambda: len(self.server.clients) == 1))
+        self.server.publish("xtool", "status", STATUS)
+        self.server.publish("ortur", "job_finished", {"duration_s": 12.5})
+        second, rest = read_sse(sock, rest)
+        self.assertEqual(second, {"device": "ortur", "event": "job_finished", "data": {"duration_s": 12.5}})
+        sock.close()
+        self.assertTrue(wait_for(lambda: not self.server.clients))
+
+    def test_websocket_stream(self):
+        key = "dGhlIHNhbXBsZSBub25jZQ=="
+        sock = connect(self.server.port, (
+            "GET /ws HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        head, rest = read_until(sock, b"\r\n\r\n").split(b"\r\n\r\n", 1)
+        self.assertIn(b"101 Switching Protocols", head)
+        # The example handshake from RFC 6455
+        self.assertIn(b"Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=", head)
+        self.assertTrue(wait_for(lambda: len(self.server.clients) == 1))
+
+        self.server.publish("ortur", "status", STATUS)
+        buffer = read_at_least(sock, rest, 2)
+        self.assertEqual(buffer[0], 0x81) # Final text frame
+        length, offset = buffer[1], 2
+        if length == 126:
+            buffer = read_at_least(sock, buffer, 4)
+            length, offset = struct.unpack("!H", buffer[2:4])[0], 4
+        buffer = read_at_least(sock, buffer, offset + length)
+        message = json.loads(buffer[offset:offset + length])
+        self.assertEqual(message["data"]["state"], "Run")
+
+        # Masked close frame from the client is answered and ends the stream
+        sock.sendall(bytes([0x88, 0x82, 1, 2, 3, 4, 0x03 ^ 1, 0xE8 ^ 2]))
+        self.assertTrue(wait_for(lambda: not self.server.clients))
+        sock.close()
+
+    def test_slow_client_is_dropped(self):
+        self.server.client_buffer = 64 * 1024
+        slow = socket.socket()
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        slow.connect(("127.0.0.1", self.server.port))
+        slow.sendall(b"GET /events HTTP/1.1\r\n\r\n")
+        fast = connect(self.server.port, b"GET /events HTTP/1.1\r\n\r\n")
+        fast_buffer = read_until(fast, b"\r\n\r\n").split(b"\r\n\r\n", 1)[1]
+        self.assertTrue(wait_for(lambda: len(self.server.clients) == 2))
+
+        big = dict(STATUS, raw=None, comment="x" * 16384)
+        for i in range(300):
+            self.server.publish("ortur", "status", dict(big, n=i))
+            # The fast client reads everything as it arrives
+            message, fast_buffer = read_sse(fast, fast_buffer)
+            self.assertEqual(message["data"]["n"], i)
+
+        self.assertEqual(self.server.dropped, 1)
+        self.assertEqual(len(self.server.clients), 1)
+        slow.close()
+        fast.close()
+
+class TestLiveSink(unittest.TestCase):
+    def test_monitor_events_reach_the_server(self):
+        cfg = make_device(pipeline_sinks=["live"], live_host="127.0.0.1")
+        self.assertIsNone(liveserver_sink(LaserMonitor(device=cfg, mqtt_client=MagicMock())))
+
+        # Stand in a server on a free port for the one shared on port 1
+        cfg.live_port = 1
+        server = LiveServer("127.0.0.1", 0).start()
+        liveserver._servers[("127.0.0.1", 1)] = server
+        try:
+            cfg.name = "ortur"
+            monitor = LaserMonitor(device=cfg, mqtt_client=MagicMock())
+            self.assertIs(liveserver_sink(monitor).server, server)
+            monitor.handle_line("<Run|MPos:5,0,0|FS:1500,800|A:S>")
+            self.assertTrue(wait_for(lambda: "ortur" in server.latest))
+            self.assertEqual(json.loads(server.latest["ortur"])["detailed_status"], "Lasering")
+        finally:
+            del liveserver._servers[("127.0.0.1", 1)]
+            server.stop()
+
+def liveserver_sink(monitor):
+    return next((sink for sink in monitor.pipeline.sinks if sink.name == "live"), None)
+
+if __name__ == '__main__':
+    unittest.main()
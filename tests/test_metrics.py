@@ -0,0 +1,100 @@
+import sys
+import os
+import unittest
+import threading
+import urllib.request
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_device
+import metrics
+from metrics import Registry, Counter, Gauge, Histogram
+from monitor import LaserMonitor
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        registry = Registry()
+        requests_total = registry.register(Counter("app_requests", "Requests.", ("path",)))
+        temperature = registry.register(Gauge("app_temperature", "Temperature."))
+        latency = registry.register(Histogram("app_latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+
+        requests_total.labels('/a"b').inc(2)
+        temperature.set(21.5)
+        for value in (0.05, 0.5, 0.5, 5.0):
+            latency.observe(value)
+
+        text = registry.render()
+        self.assertIn('# TYPE app_requests counter', text)
+        self.assertIn('app_requests_total{path="/a\\"b"} 2', text)
+        self.assertIn('app_temperature 21.5', text)
+        self.assertIn('app_latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('app_latency_seconds_bucket{le="1.0"} 3', text)
+        self.assertIn('app_latency_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn('app_latency_seconds_sum 6.05', text)
+        self.assertIn('app_latency_seconds_count 4', text)
+
+    def test_concurrent_writers_and_scrape(self):
+        registry = Registry()
+        errors = registry.register(Counter("app_errors", "Errors.", ("device",)))
+        state = registry.register(Gauge("app_state", "State.", ("state",)))
+        latency = registry.register(Histogram("app_latency_seconds", "Latency.", buckets=(0.1,)))
+        shared = errors.labels("laser")
+
+        def writer(n):
+            for i in range(2000):
+                shared.inc()
+                latency.observe(0.05)
+                state.labels(f"s{n}-{i % 50}").set(1)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            registry.render()
+        for thread in threads:
+            thread.join()
+
+        text = registry.render()
+        self.assertIn('app_errors_total{device="laser"} 8000', text)
+        self.assertIn('app_latency_seconds_count 8000', text)
+        self.assertEqual(len(state.children), 200)
+
+    def test_http_endpoint(self):
+        registry = Registry()
+        registry.register(Counter("app_hits", "Hits.")).inc()
+        server = metrics.serve("127.0.0.1", 0, registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertIn("text/plain", response.headers["Content-Type"])
+                self.assertIn("app_hits_total 1", response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_monitor_instrumentation(self):
+        cfg = make_device("metrics-test")
+        monitor = LaserMonitor(device=cfg, mqtt_client=MagicMock())
+
+        monitor.note_poll_sent(10.0)
+        monitor.note_status_received(10.05)
+        monitor.handle_lines(["<Run|MPos:1,0,0|FS:1000,800|A:S>", "<Run|MPos:2,0,0|FS:1000,800|A:S>", "<|MPos:1,2,3>"])
+
+        text = metrics.REGISTRY.render()
+        self.assertIn('laserlink_poll_rtt_seconds_count{device="metrics-test"} 1', text)
+        self.assertIn('laserlink_parse_seconds_count{device="metrics-test"} 2', text)
+        self.assertIn('laserlink_mqtt_publish_seconds_count{device="metrics-test"} 1', text)
+        self.assertIn('laserlink_parse_failures_total{device="metrics-test"} 1', text)
+        self.assertIn('laserlink_status_skipped_total{device="metrics-test"} 1', text)
+        self.assertIn('laserlink_state{device="metrics-test",state="Lasering"} 1', text)
+        self.assertIn('laserlink_job_in_progress{device="metrics-test"} 1', text)
+
+        monitor.handle_line("<Idle|MPos:0,0,0|FS:0,0>")
+        text = metrics.REGISTRY.render()
+        self.assertIn('laserlink_state{device="metrics-test",state="Lasering"} 0', text)
+        self.assertIn('laserlink_jobs_total{device="metrics-test"} 1', text)
+
+if __name__ == '__main__':
+    unittest.main()
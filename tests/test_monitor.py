@@ -21,13 +21,13 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'
 
 from monitor import LaserMonitor
 from config import Config
+from helpers import make_config
 
 class TestLaserMonitor(unittest.TestCase):
     @patch('monitor.Config')
     def setUp(self, mock_config_cls):
         # Mock config
-        self.mock_config = MagicMock()
-        self.mock_config.validate.return_value = (True, "")
+        self.mock_config = make_config(telegram_token="token", telegram_chat_id="1")
         self.mock_config.mqtt_enabled = True
         self.mock_config.ha_enabled = True
         self.mock_config.ha_discovery_prefix = "homeassistant"
@@ -67,13 +67,33 @@ class TestLaserMonitor(unittest.TestCase):
             data = monitor.parse_response(line)
             self.assertEqual(data["laser_power_pct"], 100.0)
 
+    def test_parse_wpos_derives_mpos(self):
+        with patch('monitor.Config', return_value=self.mock_config), \
+             patch('monitor.mqtt.Client'):
+            monitor = LaserMonitor()
+
+            # No WCO seen yet, MPos can't be derived
+            data = monitor.parse_response("<Idle|WPos:1.000,2.000,0.000|FS:0,0>")
+            self.assertNotIn("mpos", data)
+
+            data = monitor.parse_response("<Idle|WPos:1.000,2.000,0.000|FS:0,0|WCO:10.000,20.000,0.000>")
+            self.assertEqual(data["mpos"], {"x": 11.0, "y": 22.0, "z": 0.0})
+
+            # WCO is remembered for the following reports
+            data = monitor.parse_response("<Idle|WPos:2.000,2.000,0.000|FS:0,0>")
+            self.assertEqual(data["mpos"]["x"], 12.0)
+
+            # Standing still, the derived MPos is shared with the previous report
+            self.assertIs(monitor.parse_response("<Idle|WPos:2.000,2.000,0.000|FS:0,0>")["mpos"], data["mpos"])
+
     def test_ha_discovery_sensors(self):
         # Configure manual mock
         import paho.mqtt.client as mock_mqtt_module
         mock_client_instance = MagicMock()
         mock_mqtt_module.Client.return_value = mock_client_instance
         
-        with patch('monitor.Config', return_value=self.mock_config):
+        with patch('monitor.Config', return_value=self.mock_config), \
+             patch('monitor.mqtt.Client', return_value=mock_client_instance):
             monitor = LaserMonitor()
             monitor.publish_ha_discovery()
             
@@ -0,0 +1,116 @@
+import sys
+import os
+import unittest
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from config import Config
+from monitor import MultiLaserMonitor
+
+YAML_DATA = {
+    'laser': {'polling_interval': 0.25, 'max_spindle_speed': 1000},
+    'mqtt': {'enabled': True, 'topic': 'laser/status'},
+    'homeassistant': {'enabled': True, 'node_id': 'laserlink'},
+    'devices': [
+        {'name': 'sculpfun', 'bluetooth_mac': 'AA:BB:CC:DD:EE:01'},
+        {'name': 'ortur', 'bluetooth_mac': 'AA:BB:CC:DD:EE:02', 'rfcomm_port': 2,
+         'max_spindle_speed': 255, 'topic': 'shop/ortur', 'device_name': 'Ortur LM3'},
+    ]
+}
+
+def load_config(yaml_data):
+    with patch('yaml.safe_load', return_value=yaml_data), \
+         patch('os.path.exists', return_value=True), \
+         patch('builtins.open', unittest.mock.mock_open(read_data="data")):
+        return Config("dummy.yaml")
+
+class TestDeviceConfig(unittest.TestCase):
+    def test_device_defaults_and_overrides(self):
+        cfg = load_config(YAML_DATA)
+        sculpfun, ortur = cfg.devices
+
+        self.assertEqual(sculpfun.mqtt_topic, "laser/status/sculpfun")
+        self.assertEqual(sculpfun.ha_node_id, "laserlink_sculpfun")
+        self.assertEqual(sculpfun.polling_interval, 0.25)
+        self.assertEqual(sculpfun.rfcomm_port, 1)
+
+        self.assertEqual(ortur.mqtt_topic, "shop/ortur")
+        self.assertEqual(ortur.rfcomm_port, 2)
+        self.assertEqual(ortur.max_spindle_speed, 255)
+        self.assertEqual(ortur.telegram_message_started, "Ortur LM3: Laser Job Started!")
+
+        # Global settings fall through
+        self.assertTrue(ortur.mqtt_enabled)
+        self.assertEqual(ortur.mqtt_broker, cfg.mqtt_broker)
+
+        # The top-level bluetooth_mac isn't needed when devices are listed
+        self.assertEqual(cfg.validate(), (True, ""))
+
+    def test_duplicate_names_rejected(self):
+        data = dict(YAML_DATA, devices=[
+            {'name': 'a', 'bluetooth_mac': 'AA:BB:CC:DD:EE:01'},
+            {'name': 'a', 'bluetooth_mac': 'AA:BB:CC:DD:EE:02'},
+        ])
+        valid, msg = load_config(data).validate()
+        self.assertFalse(valid)
+
+    def test_missing_mac_rejected(self):
+        data = dict(YAML_DATA, devices=[{'name': 'a'}])
+        valid, msg = load_config(data).validate()
+        self.assertFalse(valid)
+        self.assertIn("'a'", msg)
+
+class TestMultiLaserMonitor(unittest.TestCase):
+    @patch('monitor.mqtt.Client')
+    def test_shared_client_and_discovery(self, mock_client_cls):
+        client = mock_client_cls.return_value
+        cfg = load_config(YAML_DATA)
+        with patch('monitor.Config', return_value=cfg):
+            multi = MultiLaserMonitor()
+
+        mock_client_cls.assert_called_once()
+        self.assertEqual(len(multi.monitors), 2)
+        for monitor in multi.monitors:
+            self.assertIs(monitor.mqtt_client, client)
+
+        client.on_connect(client, None, {}, 0)
+        # The configs follow once the broker echoes each laser's sync token
+        callbacks = {c.args[0]: c.args[1] for c in client.message_callback_add.call_args_list}
+        for c in list(client.publish.call_args_list):
+            if c.args[0] in callbacks:
+                callbacks[c.args[0]](client, None, SimpleNamespace(topic=c.args[0], payload=c.args[1].encode(), retain=False))
+        topics = [c.args[0] for c in client.publish.call_args_list]
+        self.assertIn("homeassistant/sensor/laserlink_sculpfun/status/config", topics)
+        self.assertIn("homeassistant/sensor/laserlink_ortur/status/config", topics)
+
+        ortur_status = next(c for c in client.publish.call_args_list
+                            if c.args[0] == "homeassistant/sensor/laserlink_ortur/status/config")
+        payload = json.loads(ortur_status.args[1])
+        self.assertEqual(payload["state_topic"], "shop/ortur")
+        self.assertEqual(payload["availability_topic"], "laser/status/availability")
+
+    @patch('monitor.mqtt.Client')
+    def test_independent_state_machines(self, mock_client_cls):
+        cfg = load_config(YAML_DATA)
+        with patch('monitor.Config', return_value=cfg):
+            multi = MultiLaserMonitor()
+        sculpfun, ortur = multi.monitors
+
+        # 200 of 255 is lasering on the Ortur
+        ortur.handle_line("<Run|MPos:0,0,0|FS:1000,200|A:S>")
+        self.assertTrue(ortur.job_in_progress)
+        self.assertFalse(sculpfun.job_in_progress)
+
+        # Sinks publish from their own threads
+        self.assertTrue(ortur.pipeline.flush(5))
+        publish = mock_client_cls.return_value.publish
+        topic, payload = publish.call_args.args
+        self.assertEqual(topic, "shop/ortur")
+        self.assertEqual(json.loads(payload)["laser_power_pct"], 78.4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import sys
+import os
+import unittest
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from notifier import TelegramNotifier
+
+class FakeTelegramAPI(ThreadingHTTPServer):
+    """Local stand-in for api.telegram.org."""
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeTelegramHandler)
+        self.messages = []
+        self.failures = 0 # Number of requests to answer with 502
+        self.delay = 0 # Seconds to wait before answering
+        self.connections = set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        # sendDocument is multipart; keep it raw
+        body = body if self.headers["Content-Type"].startswith("multipart/") else json.loads(body)
+        time.sleep(self.server.delay)
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            status, reply = 502, {"ok": False}
+        else:
+            self.server.messages.append((self.path, body))
+            status, reply = 200, {"ok": True}
+        data = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class TestTelegramNotifier(unittest.TestCase):
+    def setUp(self):
+        self.api = FakeTelegramAPI()
+        threading.Thread(target=self.api.serve_forever, args=(0.05,), daemon=True).start()
+
+    def tearDown(self):
+        self.api.shutdown()
+        self.api.server_close()
+
+    def make_notifier(self, **kwargs):
+        kwargs.setdefault("coalesce_window", 0)
+        kwargs.setdefault("retry_base", 0.01)
+        notifier = TelegramNotifier("TOKEN", "42", api_url=self.api.url, **kwargs)
+        notifier.start()
+        return notifier
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_delivers_over_one_session(self):
+        notifier = self.make_notifier()
+        notifier.notify("one")
+        self.wait_for(lambda: len(self.api.messages) == 1)
+        notifier.notify("two")
+        self.wait_for(lambda: len(self.api.messages) == 2)
+        notifier.stop()
+
+        path, body = self.api.messages[0]
+        self.assertEqual(path, "/botTOKEN/sendMessage")
+        self.assertEqual(body, {"chat_id": "42", "text": "one"})
+        # Keep-alive: both requests came over the same connection
+        self.assertEqual(len(self.api.connections), 1)
+        stats = notifier.stats()
+        self.assertEqual(stats["sent"], 2)
+        self.assertIn("latency_p50_ms", stats)
+
+    def test_document_sent_with_caption(self):
+        notifier = self.make_notifier(coalesce_window=0.2)
+        notifier.notify("Laser Job Started!")
+        notifier.notify("Laser Job Completed!", ("job.svg", b"<svg/>", "image/svg+xml"))
+        self.wait_for(lambda: notifier.sent == 1)
+        notifier.stop()
+        path, body = self.api.messages[0]
+        self.assertEqual(path, "/botTOKEN/sendDocument")
+        self.assertIn(b'filename="job.svg"', body)
+        self.assertIn(b"<svg/>", body)
+        self.assertIn(b"Laser Job Started!\nLaser Job Completed!", body)
+
+    def test_notify_does_not_block(self):
+        self.api.delay = 0.5
+        notifier = self.make_notifier()
+        start = time.monotonic()
+        notifier.notify("Job Started")
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.wait_for(lambda: notifier.sent == 1)
+        notifier.stop()
+        self.assertGreaterEqual(notifier.stats()["latency_max_ms"], 500)
+
+    def test_retries_with_backoff(self):
+        self.api.failures = 2
+        notifier = self.make_notifier()
+        notifier.notify("Job Completed")
+        self.wait_for(lambda: notifier.sent == 1)
+        notifier.stop()
+        self.assertEqual([body["text"] for _, body in self.api.messages], ["Job Completed"])
+        self.assertEqual(notifier.failed, 0)
+
+    def test_gives_up_after_max_retries(self):
+        self.api.failures = 10
+        notifier = self.make_notifier(max_retries=2)
+        with self.assertLogs(level='WARNING') as logs:
+            notifier.notify("lost")
+            self.wait_for(lambda: notifier.failed == 1)
+            notifier.stop()
+        self.assertEqual(self.api.messages, [])
+        # No retry announced for the last attempt
+        self.assertEqual([r.levelname for r in logs.records], ["WARNING", "WARNING", "ERROR"])
+        self.assertIn("giving up after 3 attempt(s)", logs.records[-1].getMessage())
+
+    def test_coalesces_bursts(self):
+        notifier = self.make_notifier(coalesce_window=0.2)
+        notifier.notify("Laser Job Started!")
+        notifier.notify("Laser Job Completed!")
+        notifier.notify("Laser Job Completed!")
+        self.wait_for(lambda: notifier.sent == 1)
+        notifier.stop()
+        self.assertEqual(len(self.api.messages), 1)
+        self.assertEqual(self.api.messages[0][1]["text"], "Laser Job Started!\nLaser Job Completed!")
+        self.assertEqual(notifier.coalesced, 2)
+
+    def test_urgent_skips_the_coalescing_window(self):
+        notifier = self.make_notifier(coalesce_window=30)
+        notifier.notify("Laser Job Started!")
+        start = time.monotonic()
+        notifier.notify("Alarm 1: Hard limit triggered.", urgent=True)
+        self.wait_for(lambda: notifier.sent == 1)
+        self.assertLess(time.monotonic() - start, 5)
+        notifier.stop()
+        self.assertEqual(self.api.messages[0][1]["text"], "Laser Job Started!\nAlarm 1: Hard limit triggered.")
+
+    def test_bounded_queue_drops_oldest(self):
+        # No worker running, so nothing leaves the queue
+        notifier = TelegramNotifier("TOKEN", "42", api_url=self.api.url, queue_size=2)
+        for message in ("a", "b", "c"):
+            notifier.notify(message)
+        self.assertEqual(notifier.dropped, 1)
+        self.assertEqual([notifier.queue.get_nowait()[0] for _ in range(2)], ["b", "c"])
+
+    def test_stop_flushes_queue(self):
+        notifier = self.make_notifier()
+        notifier.notify("last words")
+        notifier.stop()
+        self.assertEqual(len(self.api.messages), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,7 @@ import socket
 # Add src to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
+from helpers import make_config
 from monitor import LaserMonitor
 
 class TestOfflineStatus(unittest.TestCase):
@@ -18,8 +19,7 @@ class TestOfflineStatus(unittest.TestCase):
     @patch('monitor.time.sleep') # Mock sleep to speed up test
     def test_publish_offline_on_socket_error(self, mock_sleep, mock_socket_cls, mock_mqtt_cls, mock_config_cls):
         # Setup Config
-        mock_config = mock_config_cls.return_value
-        mock_config.validate.return_value = (True, "")
+        mock_config = mock_config_cls.return_value = make_config()
         mock_config.mqtt_enabled = True
         mock_config.mqtt_topic = "laser/status"
         mock_config.bluetooth_mac = "00:00:00:00:00:00"
@@ -0,0 +1,195 @@
+import sys
+import os
+import time
+import tempfile
+import threading
+import unittest
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from outbox import DiskOutbox, BufferedPublisher
+
+class FakeInfo:
+    def __init__(self, rc=0):
+        self.rc = rc
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return self.rc == 0
+
+class FakeClient:
+    """Records what reaches the broker; publishing fails while disconnected, like paho."""
+    def __init__(self):
+        self.connected = False
+        self.sent = []
+        self.fail_after = None # Disconnect after this many more messages
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if self.fail_after is not None:
+            if self.fail_after == 0:
+                self.connected = False
+            self.fail_after -= 1
+        if not self.connected:
+            return FakeInfo(rc=4)
+        self.sent.append((topic, payload if isinstance(payload, bytes) else str(payload).encode(), qos, retain))
+        return FakeInfo()
+
+def drain(outbox, count=1000):
+    batch, position = outbox.read_batch(count)
+    outbox.commit(position)
+    return batch
+
+class TestDiskOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "outbox")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_replays_in_order_across_segments_and_restarts(self):
+        outbox = DiskOutbox(self.path, max_bytes=64 * 1024, segment_bytes=256)
+        for i in range(50):
+            outbox.append("laser/status/job", f"job {i}", qos=1, retain=True)
+        self.assertGreater(len(outbox.segments), 1)
+
+        batch, position = outbox.read_batch(20)
+        outbox.commit(position)
+        self.assertEqual([payload for _, payload, _, _ in batch], [f"job {i}".encode() for i in range(20)])
+        self.assertEqual(batch[0][2:], (1, True))
+        outbox.close()
+
+        # A restart continues after the last committed batch
+        outbox = DiskOutbox(self.path, max_bytes=64 * 1024, segment_bytes=256)
+        outbox.append("laser/status/job", "job 50")
+        rest = drain(outbox)
+        self.assertEqual([payload for _, payload, _, _ in rest], [f"job {i}".encode() for i in range(20, 51)])
+        self.assertTrue(outbox.empty)
+        self.assertEqual(outbox.size, 0)
+        self.assertEqual([name for name in os.listdir(self.path) if name.endswith(".seg")], [])
+
+    def test_telemetry_is_thinned_while_buffering(self):
+        outbox = DiskOutbox(self.path, telemetry_interval=60)
+        self.assertTrue(outbox.append("laser/status", "first", low_priority=True))
+        self.assertFalse(outbox.append("laser/status", "second", low_priority=True))
+        self.assertTrue(outbox.append("other/status", "first", low_priority=True))
+        self.assertTrue(outbox.append("laser/status/job", "job"))
+        self.assertEqual(len(drain(outbox)), 3)
+        self.assertEqual(outbox.thinned, 1)
+
+    def test_drop_oldest_keeps_the_newest_messages(self):
+        outbox = DiskOutbox(self.path, max_bytes=4096, telemetry_interval=0)
+        for i in range(500):
+            outbox.append("laser/status", f"{i:04d}", low_priority=True)
+        self.assertLessEqual(outbox.size, 4096)
+        self.assertGreater(outbox.dropped, 0)
+        payloads = [payload for _, payload, _, _ in drain(outbox)]
+        self.assertEqual(payloads[-1], b"0499")
+        self.assertEqual(payloads, sorted(payloads))
+
+    def test_drop_newest_rejects_telemetry_but_keeps_events(self):
+        outbox = DiskOutbox(self.path, max_bytes=4096, drop_policy="newest", telemetry_interval=0)
+        for i in range(500):
+            outbox.append("laser/status", f"{i:04d}", low_priority=True)
+        # Once full, new telemetry is rejected and the oldest stays
+        self.assertEqual(outbox.read_batch(1)[0][0][1], b"0000")
+        self.assertGreater(outbox.dropped, 0)
+
+        # An event still gets in, at the expense of the oldest telemetry
+        self.assertTrue(outbox.append("laser/status/job", "job"))
+        payloads = [payload for _, payload, _, _ in drain(outbox)]
+        self.assertEqual(payloads[-1], b"job")
+        self.assertNotIn(b"0000", payloads)
+        self.assertNotIn(b"0499", payloads)
+        self.assertEqual(payloads[:-1], sorted(payloads[:-1]))
+
+    def test_torn_tail_is_skipped(self):
+        outbox = DiskOutbox(self.path)
+        outbox.append("laser/status/job", "complete")
+        outbox.close()
+        with open(os.path.join(self.path, "00000001.seg"), 'ab') as f:
+            f.write(b"\x00\x00\x10") # Crash in the middle of a header
+
+        outbox = DiskOutbox(self.path)
+        self.assertEqual([payload for _, payload, _, _ in drain(outbox)], [b"complete"])
+        self.assertTrue(outbox.empty)
+
+class TestBufferedPublisher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = FakeClient()
+        self.publisher = BufferedPublisher(self.client, DiskOutbox(self.tmp.name, telemetry_interval=0), batch_size=7)
+        self.publisher.telemetry_topics.add("laser/status")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def wait_for_replay(self):
+        deadline = time.monotonic() + 5
+        while self.publisher.replaying and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_direct_while_connected(self):
+        self.client.connected = True
+        self.publisher.publish("laser/status", "live")
+        self.assertEqual(self.client.sent, [("laser/status", b"live", 0, False)])
+        self.assertTrue(self.publisher.outbox.empty)
+
+    def test_outage_is_replayed_in_order_before_new_messages(self):
+        for i in range(30):
+            self.publisher.publish("laser/status", f"status {i}")
+        self.publisher.publish("laser/status/job", "job", retain=True)
+        self.assertEqual(self.client.sent, [])
+
+        self.client.connected = True
+        self.publisher.resume()
+        self.wait_for_replay()
+        self.publisher.publish("laser/status", "live")
+
+        payloads = [payload for _, payload, _, _ in self.client.sent]
+        self.assertEqual(payloads, [f"status {i}".encode() for i in range(30)] + [b"job", b"live"])
+        self.assertEqual(self.client.sent[30], ("laser/status/job", b"job", 0, True))
+        self.assertEqual(self.publisher.replayed, 31)
+        self.assertTrue(self.publisher.outbox.empty)
+
+    def test_interrupted_replay_keeps_the_rest(self):
+        for i in range(30):
+            self.publisher.publish("laser/status/job", f"job {i}")
+        self.client.connected = True
+        self.client.fail_after = 10
+        self.publisher.resume()
+        self.wait_for_replay()
+        self.assertFalse(self.client.connected)
+        self.assertFalse(self.publisher.outbox.empty)
+
+        # Only whole batches are committed, so the interrupted one is sent again
+        self.client.connected = True
+        self.client.fail_after = None
+        self.publisher.resume()
+        self.wait_for_replay()
+        payloads = [payload for _, payload, _, _ in self.client.sent]
+        self.assertEqual(payloads[:10], [f"job {i}".encode() for i in range(10)])
+        self.assertEqual(payloads[10:], [f"job {i}".encode() for i in range(7, 30)])
+        self.assertTrue(self.publisher.outbox.empty)
+
+    def test_concurrent_publishes_during_replay_stay_ordered(self):
+        for i in range(100):
+            self.publisher.publish("laser/status/job", f"old {i}")
+        self.client.connected = True
+        self.publisher.resume()
+        publishing = threading.Thread(target=lambda: [self.publisher.publish("laser/status/job", f"new {i}") for i in range(100)])
+        publishing.start()
+        publishing.join()
+        self.wait_for_replay()
+
+        payloads = [payload.decode() for _, payload, _, _ in self.client.sent]
+        self.assertEqual(payloads, [f"old {i}" for i in range(100)] + [f"new {i}" for i in range(100)])
+
+if __name__ == '__main__':
+    unittest.main()
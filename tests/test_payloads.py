@@ -0,0 +1,135 @@
+import sys
+import os
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_device
+import payloads
+from payloads import PayloadEncoder, FragmentEncoder, compact
+from grbl import FieldCache, parse_status
+from monitor import LaserMonitor
+
+def status(line):
+    return parse_status(line, 1000, 20)
+
+def make_monitor(payload_format):
+    cfg = make_device(payload_format=payload_format, ha_device_name="Laser")
+    return LaserMonitor(device=cfg, mqtt_client=MagicMock())
+
+class TestPayloadEncoder(unittest.TestCase):
+    def test_compact_is_smaller_and_drops_raw(self):
+        data = status("<Run|MPos:12.5,3,0|FS:1500,800|Ov:100,100,100|A:S>")
+        full = PayloadEncoder("json", "laser/status").encode(data)[0][1]
+        topic, small, retain = PayloadEncoder("compact", "laser/status").encode(data)[0]
+        self.assertEqual(topic, "laser/status")
+        self.assertFalse(retain)
+        self.assertLess(len(small), len(full) * 0.8)
+        decoded = json.loads(small)
+        self.assertNotIn("raw", decoded)
+        self.assertNotIn("substate", decoded) # None values are left out
+        self.assertEqual(decoded["mpos"], {"x": 12.5, "y": 3.0, "z": 0.0})
+
+    def test_fields_only_publish_changes(self):
+        encoder = PayloadEncoder("fields", "laser/status")
+        first = dict((topic, payload) for topic, payload, _ in encoder.encode(status("<Run|MPos:1,2,0|FS:1500,800|A:S>")))
+        self.assertEqual(first["laser/status/detailed_status"], "Lasering")
+        self.assertEqual(first["laser/status/mpos/x"], "1.0")
+        self.assertEqual(first["laser/status/laser_power_pct"], "80.0")
+
+        # Only X moved
+        second = encoder.encode(status("<Run|MPos:1.5,2,0|FS:1500,800|A:S>"))
+        self.assertEqual(second, [("laser/status/mpos/x", "1.5", True)])
+
+        encoder.reset()
+        self.assertEqual(len(encoder.encode(status("<Run|MPos:1.5,2,0|FS:1500,800|A:S>"))), len(first))
+
+    @unittest.skipUnless(payloads.msgpack, "msgpack not installed")
+    def test_msgpack(self):
+        data = status("<Idle|MPos:0,0,0|FS:0,0>")
+        payload = PayloadEncoder("msgpack", "laser/status").encode(data)[0][1]
+        self.assertEqual(payloads.msgpack.unpackb(payload)["state"], "Idle")
+
+    @unittest.skipUnless(payloads.cbor2, "cbor2 not installed")
+    def test_cbor(self):
+        data = status("<Idle|MPos:0,0,0|FS:0,0>")
+        payload = PayloadEncoder("cbor", "laser/status").encode(data)[0][1]
+        self.assertEqual(payloads.cbor2.loads(payload)["state"], "Idle")
+
+    def test_missing_dependency(self):
+        with patch.object(payloads, "msgpack", None):
+            self.assertEqual(payloads.missing_dependency("msgpack"), "msgpack")
+        self.assertIsNone(payloads.missing_dependency("fields"))
+
+class TestFragmentEncoder(unittest.TestCase):
+    LINES = (
+        "<Idle|MPos:0.000,0.000,0.000|Bf:15,128|FS:0,0>",
+        "<Run|MPos:34.900,53.963,0.000|Bf:15,128|FS:1000,100|Ov:100,100,100|A:SF>",
+        "<Hold:0|WPos:1.5,2,3|WCO:0,0,0|FS:1000.5,100|Pn:XZ|H:1>",
+        "<Run|MPos:nan,inf,-inf|FS:0,0>",
+    )
+
+    def test_same_json_as_json_dumps(self):
+        cache = FieldCache()
+        full, small = FragmentEncoder(), FragmentEncoder((",", ":"), skip=payloads.COMPACT_SKIP, skip_none=True)
+        for line in self.LINES * 2:
+            data = parse_status(line, cache=cache)
+            data.update(timestamp=1700000000.123, job_in_progress=False, toolpath=[[1, 2]])
+            self.assertEqual(full.encode(data), json.dumps(data))
+            self.assertEqual(small.encode(data), json.dumps(compact(data), separators=(",", ":")))
+
+    def test_unchanged_objects_reuse_their_json(self):
+        encoder = FragmentEncoder()
+        data = status("<Idle|MPos:0,0,0|FS:0,0>")
+        encoder.encode(data)
+        # The same object is not encoded again, a new one is
+        data["mpos"] = mpos = {"x": 1.0}
+        encoder.fragments["mpos"] = (mpos, '{"x": 2.0}')
+        self.assertIn('"mpos": {"x": 2.0}', encoder.encode(data))
+        data["mpos"] = {"x": 1.0}
+        self.assertIn('"mpos": {"x": 1.0}', encoder.encode(data))
+
+class TestMonitorPayloads(unittest.TestCase):
+    def test_fields_mode_publishes_retained_fields(self):
+        monitor = make_monitor("fields")
+        monitor.handle_line("<Idle|MPos:0,0,0|FS:0,0>")
+        monitor.mqtt_client.publish.reset_mock()
+        monitor.handle_line("<Idle|MPos:0,0,0|FS:0,0>")
+        # Nothing changed, nothing to send
+        monitor.mqtt_client.publish.assert_not_called()
+
+        monitor.handle_line("<Run|MPos:5,0,0|FS:1500,800|A:S>")
+        published = {c.args[0]: c.args[1] for c in monitor.mqtt_client.publish.call_args_list}
+        self.assertEqual(published["laser/status/detailed_status"], "Lasering")
+        self.assertNotIn("laser/status", published)
+        self.assertTrue(all(c.kwargs["retain"] for c in monitor.mqtt_client.publish.call_args_list))
+
+        # The job started with that report, so the next one carries the flag
+        monitor.mqtt_client.publish.reset_mock()
+        monitor.handle_line("<Run|MPos:6,0,0|FS:1500,800|A:S>")
+        published = {c.args[0]: c.args[1] for c in monitor.mqtt_client.publish.call_args_list}
+        self.assertEqual(published, {"laser/status/job_in_progress": "true", "laser/status/mpos/x": "6.0"})
+
+    def test_discovery_points_at_field_topics(self):
+        monitor = make_monitor("fields")
+        monitor.publish_ha_discovery()
+        configs = {c.args[0]: json.loads(c.args[1]) for c in monitor.mqtt_client.publish.call_args_list}
+        pos_x = configs["homeassistant/sensor/laserlink/pos_x/config"]
+        self.assertEqual(pos_x["state_topic"], "laser/status/mpos/x")
+        self.assertNotIn("value_template", pos_x)
+        job = configs["homeassistant/binary_sensor/laserlink/job_active/config"]
+        self.assertEqual((job["state_topic"], job["payload_on"]), ("laser/status/job_in_progress", "true"))
+
+    def test_discovery_uses_templates_for_documents(self):
+        monitor = make_monitor("compact")
+        monitor.publish_ha_discovery()
+        configs = {c.args[0]: json.loads(c.args[1]) for c in monitor.mqtt_client.publish.call_args_list}
+        pos_x = configs["homeassistant/sensor/laserlink/pos_x/config"]
+        self.assertEqual(pos_x["state_topic"], "laser/status")
+        self.assertEqual(pos_x["value_template"], "{{ value_json.mpos.x }}")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import sys
+import os
+import time
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_device
+import metrics
+from pipeline import Pipeline, Sink, SINK_TYPES
+from monitor import LaserMonitor
+
+class RecordingSink(Sink):
+    name = "recording"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.events = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def handle(self, event):
+        self.gate.wait()
+        time.sleep(self.delay)
+        self.events.append((event.kind, event.data))
+
+def make_sink(monitor):
+    """Plugin factory, loaded by name as '<module>:make_sink'."""
+    return RecordingSink()
+
+class TestPipeline(unittest.TestCase):
+    def test_inline_without_queues(self):
+        pipeline = Pipeline("laser", queue_size=0)
+        sink = RecordingSink()
+        pipeline.add(sink)
+        pipeline.emit("status", {"n": 1})
+        self.assertEqual(sink.events, [("status", {"n": 1})])
+
+    def test_slow_sink_never_delays_emit(self):
+        pipeline = Pipeline("slow", queue_size=8)
+        slow, fast = RecordingSink(delay=0.05), RecordingSink()
+        slow.name = "slow_sink"
+        pipeline.add(slow)
+        pipeline.add(fast)
+
+        slowest = 0.0
+        pipeline.emit("job_started", {})
+        for i in range(200):
+            start = time.perf_counter()
+            pipeline.emit("status", {"n": i})
+            slowest = max(slowest, time.perf_counter() - start)
+            time.sleep(0.001) # Statuses arrive at poll rate
+        pipeline.emit("job_finished", {})
+        self.assertLess(slowest, 0.01)
+
+        self.assertTrue(pipeline.flush(5))
+        pipeline.close()
+        # The fast sink kept up, the slow one lost old statuses but no job event
+        self.assertEqual(len(fast.events), 202)
+        kinds = [kind for kind, _ in slow.events]
+        self.assertEqual((kinds[0], kinds[-1]), ("job_started", "job_finished"))
+        self.assertLess(len(slow.events), 50)
+        numbers = [data["n"] for kind, data in slow.events if kind == "status"]
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(numbers[-1], 199)
+        self.assertEqual(pipeline.stats()["slow_sink"]["dropped"], 200 - len(numbers))
+        self.assertIn('laserlink_queue_dropped_total{device="slow",stage="slow_sink"}', metrics.REGISTRY.render())
+
+    def test_job_events_wait_for_room(self):
+        pipeline = Pipeline("stuck", queue_size=2, block_timeout=0.1)
+        sink = RecordingSink()
+        sink.gate.clear()
+        pipeline.add(sink)
+        for i in range(4):
+            pipeline.emit("job_finished", {"n": i})
+        # One is being handled, two are queued; the fourth waited block_timeout and was dropped
+        self.assertEqual(pipeline.queues[0].dropped, 1)
+
+        # With a working sink a job event waits instead of being dropped
+        sink.gate.set()
+        self.assertTrue(pipeline.flush(5))
+        sink.delay = 0.02
+        for i in range(4, 8):
+            pipeline.emit("job_finished", {"n": i})
+        pipeline.close()
+        self.assertEqual([data["n"] for _, data in sink.events], [0, 1, 2, 4, 5, 6, 7])
+
+    def test_plugin_loaded_by_module_path(self):
+        cfg = make_device(pipeline_sinks=[f"{__name__}:make_sink"])
+        monitor = MagicMock(cfg=cfg, device_name="laser")
+        pipeline = Pipeline.from_config(monitor)
+        self.assertIsInstance(pipeline.sinks[0], RecordingSink)
+        self.assertIn("mqtt", SINK_TYPES)
+
+class TestMonitorPipeline(unittest.TestCase):
+    def test_slow_mqtt_publish_does_not_block_the_state_machine(self):
+        cfg = make_device(pipeline_queue_size=64, pipeline_sinks=["mqtt", "telegram"])
+        client = MagicMock()
+        client.publish.side_effect = lambda *args, **kwargs: time.sleep(0.05)
+        monitor = LaserMonitor(device=cfg, mqtt_client=client)
+        monitor.send_telegram_notification = MagicMock()
+
+        start = time.perf_counter()
+        for x in range(20):
+            monitor.handle_line(f"<Run|MPos:{x},0,0|FS:1500,800|A:S>")
+        monitor.handle_line("<Idle|MPos:19,0,0|FS:0,0>")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertFalse(monitor.job_in_progress)
+
+        self.assertTrue(monitor.pipeline.flush(10))
+        monitor.pipeline.close()
+        self.assertEqual(monitor.send_telegram_notification.call_count, 2)
+        topics = [c.args[0] for c in client.publish.call_args_list]
+        self.assertEqual(topics[-1], "laser/status/job")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_config
+from publish_policy import PublishPolicy
+from monitor import LaserMonitor
+
+def status(state="Idle", detailed=None, x=0.0, y=0.0, power=0.0, feed=0, **extra):
+    data = {
+        "raw": f"<{state}|...>",
+        "state": state,
+        "detailed_status": detailed or state,
+        "mpos": {"x": x, "y": y, "z": 0.0},
+        "laser_power_pct": power,
+        "feed_rate": feed,
+        "job_in_progress": False,
+    }
+    data.update(extra)
+    return data
+
+class TestPublishPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = PublishPolicy(deadband_mpos=0.5, deadband_power=1.0, deadband_feed=10, heartbeat_interval=60)
+
+    def test_idle_is_suppressed_until_heartbeat(self):
+        self.assertTrue(self.policy.should_publish(status(), 0))
+        for t in range(1, 60):
+            self.assertFalse(self.policy.should_publish(status(), t))
+        self.assertTrue(self.policy.should_publish(status(), 60))
+        stats = self.policy.stats()
+        self.assertEqual(stats["sent"], 2)
+        self.assertEqual(stats["heartbeats"], 1)
+        self.assertEqual(stats["suppressed"], 59)
+
+    def test_state_change_always_published(self):
+        self.policy.should_publish(status(), 0)
+        self.assertTrue(self.policy.should_publish(status("Run", "Lasering", power=50), 1))
+        self.assertTrue(self.policy.should_publish(status("Run", "Lasering", power=50, job_in_progress=True), 2))
+
+    def test_deadbands(self):
+        self.policy.should_publish(status("Run", x=10.0, power=50, feed=1000), 0)
+        # Inside every deadband
+        self.assertFalse(self.policy.should_publish(status("Run", x=10.4, power=50.5, feed=1005), 1))
+        # Position past 0.5 mm
+        self.assertTrue(self.policy.should_publish(status("Run", x=10.6, power=50, feed=1000), 2))
+        # Power past 1 %
+        self.assertTrue(self.policy.should_publish(status("Run", x=10.6, power=51.5, feed=1000), 3))
+        # Feed past 10 mm/min
+        self.assertTrue(self.policy.should_publish(status("Run", x=10.6, power=51.5, feed=1020), 4))
+
+    def test_small_step_back_to_zero_is_published(self):
+        policy = PublishPolicy(deadband_power=5.0)
+        policy.should_publish(status("Run", power=2.0), 0)
+        self.assertTrue(policy.should_publish(status("Run", power=0.0), 1))
+
+    def test_intermittent_fields_do_not_trigger(self):
+        self.policy.should_publish(status(overrides={"feed": 100, "rapid": 100, "spindle": 100}), 0)
+        # Ov is only sent every few reports
+        self.assertFalse(self.policy.should_publish(status(), 1))
+        self.assertTrue(self.policy.should_publish(status(overrides={"feed": 120, "rapid": 100, "spindle": 100}), 2))
+
+    def test_reset(self):
+        self.policy.should_publish(status(), 0)
+        self.policy.reset()
+        self.assertTrue(self.policy.should_publish(status(), 1))
+
+class TestMonitorPublishPolicy(unittest.TestCase):
+    @patch('monitor.mqtt.Client')
+    @patch('monitor.Config')
+    def test_idle_publishes_once(self, mock_config_cls, mock_client_cls):
+        mock_config_cls.return_value = make_config(mqtt_enabled=True, publish_on_change=True)
+
+        monitor = LaserMonitor()
+        client = mock_client_cls.return_value
+        client.publish.reset_mock()
+
+        for _ in range(10):
+            monitor.handle_line("<Idle|MPos:0.000,0.000,0.000|FS:0,0>")
+        status_publishes = [c for c in client.publish.call_args_list if c.args[0] == "laser/status"]
+        self.assertEqual(len(status_publishes), 1)
+        self.assertEqual(monitor.publish_policy.stats()["suppressed"], 9)
+
+        # After going offline the next status is published again
+        monitor.publish_offline_status()
+        monitor.handle_line("<Idle|MPos:0.000,0.000,0.000|FS:0,0>")
+        status_publishes = [c for c in client.publish.call_args_list if c.args[0] == "laser/status"]
+        self.assertEqual(len(status_publishes), 3)
+
+    @patch('monitor.mqtt.Client')
+    @patch('monitor.Config')
+    def test_every_poll_published_by_default(self, mock_config_cls, mock_client_cls):
+        mock_config_cls.return_value = make_config(mqtt_enabled=True)
+
+        monitor = LaserMonitor()
+        self.assertIsNone(monitor.publish_policy)
+        client = mock_client_cls.return_value
+        client.publish.reset_mock()
+
+        for _ in range(3):
+            monitor.handle_line("<Idle|MPos:0.000,0.000,0.000|FS:0,0>")
+        status_publishes = [c for c in client.publish.call_args_list if c.args[0] == "laser/status"]
+        self.assertEqual(len(status_publishes), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import sys
+import os
+import time
+import socket
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_config
+from scheduler import ReconnectBackoff
+from monitor import LaserMonitor
+from transport import SocketTransport
+
+def configure(mock_config_cls, **overrides):
+    settings = dict(mqtt_enabled=True, polling_interval=0.02, link_timeout=0.2, reconnect_max_delay=8)
+    settings.update(overrides)
+    mock_config_cls.return_value = make_config(**settings)
+
+class TestReconnectBackoff(unittest.TestCase):
+    def test_fast_first_retry_then_exponential(self):
+        backoff = ReconnectBackoff(first=0.2, base=0.5, max_delay=4.0, jitter=0.0)
+        self.assertEqual([backoff.next_delay() for _ in range(7)], [0.2, 0.5, 1.0, 2.0, 4.0, 4.0, 4.0])
+        backoff.reset()
+        self.assertEqual(backoff.next_delay(), 0.2)
+
+    def test_jitter(self):
+        delays = [ReconnectBackoff(first=1.0, jitter=0.2).next_delay() for _ in range(50)]
+        self.assertTrue(all(0.8 <= d <= 1.2 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+class TestLaserReconnect(unittest.TestCase):
+    @patch('monitor.Config')
+    @patch('monitor.mqtt.Client')
+    @patch('monitor.socket.socket')
+    @patch('monitor.time.sleep')
+    def test_mqtt_survives_laser_reconnects(self, mock_sleep, mock_socket_cls, mock_mqtt_cls, mock_config_cls):
+        configure(mock_config_cls)
+        mock_socket = mock_socket_cls.return_value
+        mock_socket.connect.side_effect = [socket.error("Host is down")] * 3 + [KeyboardInterrupt]
+
+        monitor = LaserMonitor()
+        monitor.run()
+
+        # The MQTT network loop is only stopped on shutdown
+        mock_mqtt_cls.return_value.loop_stop.assert_called_once()
+        delays = [c.args[0] for c in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 3)
+        self.assertLess(delays[0], 0.3)
+        self.assertTrue(delays[0] < delays[1] < delays[2])
+
+    @patch('monitor.Config')
+    def test_recovery_time_is_measured(self, mock_config_cls):
+        configure(mock_config_cls, mqtt_enabled=False)
+        monitor = LaserMonitor()
+        monitor.backoff.next_delay()
+
+        monitor.publish_offline_status()
+        time.sleep(0.05)
+        monitor.note_status_received(time.monotonic())
+        self.assertGreaterEqual(monitor.last_recovery, 0.05)
+        self.assertIsNone(monitor.link_down_since)
+        self.assertEqual(monitor.backoff.attempts, 0)
+
+    @patch('monitor.Config')
+    def test_silent_laser_is_dropped(self, mock_config_cls):
+        configure(mock_config_cls, mqtt_enabled=False)
+        monitor = LaserMonitor()
+        ours, theirs = socket.socketpair()
+        ours.setblocking(False)
+
+        async def session():
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                await monitor._poll_session(loop, SocketTransport(sock=ours), executor)
+
+        start = time.monotonic()
+        try:
+            # The laser never answers, like one that was switched off without closing the link
+            with self.assertRaises(ConnectionError):
+                asyncio.run(asyncio.wait_for(session(), timeout=5))
+        finally:
+            ours.close()
+            theirs.close()
+        self.assertLess(time.monotonic() - start, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
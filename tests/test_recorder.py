@@ -0,0 +1,104 @@
+import sys
+import os
+import unittest
+import tempfile
+import time
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_config
+from recorder import SessionRecorder, read_records, MAGIC
+from monitor import LaserMonitor
+
+class TestSessionRecorder(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".llrec")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        recorder = SessionRecorder(self.path)
+        recorder.mark_session()
+        recorder.write(b"<Idle|MPos:0.000,0.000,0.000|FS:0,0>\r\n")
+        time.sleep(0.05)
+        recorder.write(b"ok\r\n" * 100)
+        recorder.close()
+
+        records = list(read_records(self.path))
+        self.assertEqual([chunk for _, chunk in records], [
+            b"", b"<Idle|MPos:0.000,0.000,0.000|FS:0,0>\r\n", b"ok\r\n" * 100
+        ])
+        self.assertGreaterEqual(records[2][0] - records[1][0], 0.05)
+
+    def test_append_keeps_single_header(self):
+        for _ in range(2):
+            recorder = SessionRecorder(self.path)
+            recorder.mark_session()
+            recorder.write(b"ok\n")
+            recorder.close()
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read().count(MAGIC), 1)
+        self.assertEqual([chunk for _, chunk in read_records(self.path)], [b"", b"ok\n", b"", b"ok\n"])
+
+    def test_truncated_record_is_ignored(self):
+        recorder = SessionRecorder(self.path)
+        recorder.write(b"complete\n")
+        recorder.write(b"cut short\n")
+        recorder.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+        self.assertEqual([chunk for _, chunk in read_records(self.path)], [b"complete\n"])
+
+    def test_rejects_foreign_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b"not a recording")
+        with self.assertRaises(ValueError):
+            list(read_records(self.path))
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".llrec")
+        os.close(fd)
+        # A short job with status lines split across chunks
+        recorder = SessionRecorder(self.path)
+        recorder.mark_session()
+        chunks = [b"<Idle|MPos:0.000,0.000,0.000|FS:0,0>\r\nok\r\n",
+                  b"<Run|MPos:1.000,1.000,0.000|FS:1000,", b"800|A:S>\r\n",
+                  b"<Run|MPos:5.000,1.000,0.000|FS:1000,800|A:S>\r\n",
+                  b"<Idle|MPos:5.000,1.000,0.000|FS:0,0>\r\n"]
+        for chunk in chunks:
+            recorder.write(chunk)
+            time.sleep(0.02)
+        recorder.close()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    @patch('monitor.Config')
+    def make_monitor(self, mock_config_cls):
+        mock_config_cls.return_value = make_config()
+        return LaserMonitor()
+
+    def test_replay_through_pipeline(self):
+        monitor = self.make_monitor()
+        monitor.send_telegram_notification = MagicMock()
+        lines, elapsed = monitor.replay(self.path, speed=None)
+
+        self.assertEqual(lines, 5)
+        self.assertFalse(monitor.job_in_progress)
+        # Job started and completed
+        self.assertEqual(monitor.send_telegram_notification.call_count, 2)
+
+    def test_replay_speed(self):
+        monitor = self.make_monitor()
+        _, realtime = monitor.replay(self.path, speed=1)
+        _, fast = monitor.replay(self.path, speed=10)
+        self.assertGreaterEqual(realtime, 0.06)
+        self.assertLess(fast, realtime / 2)
+
+if __name__ == '__main__':
+    unittest.main()
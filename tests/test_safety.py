@@ -0,0 +1,99 @@
+import sys
+import os
+import json
+import unittest
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_device
+from safety import describe
+from outbox import BufferedPublisher
+from monitor import LaserMonitor
+
+class TestDescribe(unittest.TestCase):
+    def test_codes_and_substates(self):
+        self.assertEqual(describe("Alarm", code=1), "Alarm 1: Hard limit triggered. Position is likely lost, re-home the machine.")
+        self.assertEqual(describe("Alarm", code=99), "Alarm 99: Unknown alarm code.")
+        self.assertEqual(describe("Door", 1), "Door open, machine stopped.")
+        self.assertEqual(describe("Hold", 0), "Feed hold complete, ready to resume.")
+        self.assertEqual(describe("Hold"), "Feed hold.")
+
+class TestSafetyLane(unittest.TestCase):
+    def setUp(self):
+        # Change-driven publishing with huge deadbands: they must not hold safety states back
+        cfg = make_device("ortur", ha_device_name="Ortur", publish_on_change=True, publish_deadband_mpos=1000,
+                          publish_deadband_power=1000, publish_deadband_feed=1000, publish_heartbeat=3600,
+                          pipeline_queue_size=16, pipeline_sinks=["mqtt"])
+        self.client = MagicMock()
+        self.client.is_connected.return_value = True
+        self.monitor = LaserMonitor(device=cfg, mqtt_client=self.client)
+        self.monitor.send_telegram_notification = MagicMock()
+
+    def tearDown(self):
+        self.monitor.pipeline.close()
+
+    def safety_messages(self, client=None):
+        client = client or self.client
+        messages = []
+        for c in client.publish.call_args_list:
+            if c.args[0] == "laser/status/safety":
+                self.assertEqual(c.kwargs, {"qos": 1, "retain": True})
+                messages.append(json.loads(c.args[1]))
+        return messages
+
+    def test_alarm_published_at_once_and_cleared(self):
+        self.monitor.handle_lines(["<Idle|MPos:0,0,0|FS:0,0>"])
+        self.assertEqual(self.safety_messages(), [])
+
+        self.monitor.handle_lines(["ALARM:1", "<Alarm|MPos:0,0,0|FS:0,0>"])
+        self.monitor.handle_lines(["<Alarm|MPos:0,0,0|FS:0,0>"])
+        messages = self.safety_messages()
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0]["active"])
+        self.assertEqual((messages[0]["state"], messages[0]["code"]), ("Alarm", 1))
+        self.assertIn("Hard limit", messages[0]["description"])
+        self.monitor.send_telegram_notification.assert_called_once_with(
+            "Ortur: Alarm 1: Hard limit triggered. Position is likely lost, re-home the machine.", urgent=True)
+
+        self.monitor.handle_lines(["<Idle|MPos:0,0,0|FS:0,0>"])
+        cleared = self.safety_messages()[-1]
+        self.assertEqual((cleared["active"], cleared["state"]), (False, "Idle"))
+
+    def test_substate_changes(self):
+        for line in ["<Door:2|MPos:0,0,0|FS:0,0>", "<Door:1|MPos:0,0,0|FS:0,0>", "<Door:1|MPos:0,0,0|FS:0,0>",
+                     "<Door:3|MPos:0,0,0|FS:0,0>", "<Hold:1|MPos:0,0,0|FS:0,0>", "<Hold:0|MPos:0,0,0|FS:0,0>"]:
+            self.monitor.handle_line(line)
+        messages = self.safety_messages()
+        self.assertEqual([(m["state"], m["substate"]) for m in messages],
+                         [("Door", 2), ("Door", 1), ("Door", 3), ("Hold", 1), ("Hold", 0)])
+        # Notified once when the door opened, Hold is not in safety_notify
+        self.monitor.send_telegram_notification.assert_called_once_with("Ortur: Door opened, hold or parking in progress.", urgent=True)
+
+    def test_new_alarm_code_notifies_again(self):
+        self.monitor.handle_lines(["ALARM:1", "<Alarm|MPos:0,0,0|FS:0,0>", "ALARM:2", "<Alarm|MPos:0,0,0|FS:0,0>"])
+        self.assertEqual([m["code"] for m in self.safety_messages()], [1, 2])
+        self.assertEqual(self.monitor.send_telegram_notification.call_count, 2)
+
+    def test_republished_on_reconnect(self):
+        self.client.is_connected.return_value = False
+        self.monitor.handle_line("<Door:1|MPos:0,0,0|FS:0,0>")
+        self.monitor.handle_line("<Door:0|MPos:0,0,0|FS:0,0>")
+        self.assertEqual(self.safety_messages(), [])
+
+        self.client.is_connected.return_value = True
+        self.monitor.safety.republish()
+        messages = self.safety_messages()
+        self.assertEqual([(m["state"], m["substate"]) for m in messages], [("Door", 0)])
+
+    def test_bypasses_the_outbox(self):
+        buffered = MagicMock(spec=BufferedPublisher)
+        buffered.client = self.client
+        self.monitor.mqtt_client = buffered
+        self.monitor.handle_line("<Hold:0|MPos:0,0,0|FS:0,0>")
+        self.assertEqual(len(self.safety_messages()), 1)
+        self.assertNotIn("laser/status/safety", [c.args[0] for c in buffered.publish.call_args_list])
+
+if __name__ == '__main__':
+    unittest.main()
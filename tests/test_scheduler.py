@@ -0,0 +1,88 @@
+import sys
+import os
+import unittest
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from scheduler import PollClock, JitterStats, AdaptivePoller
+
+class TestPollClock(unittest.TestCase):
+    def test_deadlines_stay_on_grid(self):
+        clock = PollClock(0.5, 100.0)
+        # Each poll takes a variable amount of time, deadlines must not drift
+        self.assertEqual(clock.advance(100.2), 100.5)
+        self.assertEqual(clock.advance(100.9), 101.0)
+        self.assertEqual(clock.advance(101.05), 101.5)
+        self.assertEqual(clock.missed, 0)
+
+    def test_missed_ticks_are_skipped(self):
+        clock = PollClock(0.5, 100.0)
+        # A 2 second stall skips the ticks we can't catch up on
+        deadline = clock.advance(102.1)
+        self.assertEqual(deadline, 102.0)
+        self.assertEqual(clock.missed, 3)
+
+    def test_retime_to_shorter_interval(self):
+        clock = PollClock(5.0, 100.0)
+        clock.advance(100.0)
+        clock.retime(0.25, 100.0)
+        self.assertEqual(clock.next_deadline, 100.25)
+        # A longer interval only applies from the next deadline
+        clock.retime(1.0, 100.25)
+        self.assertEqual(clock.next_deadline, 100.25)
+
+class TestJitterStats(unittest.TestCase):
+    def test_summary(self):
+        stats = JitterStats()
+        self.assertEqual(stats.summary(), {"samples": 0})
+        for i in range(11):
+            stats.record(i * 0.5, i * 0.5 + 0.001 * i)
+        summary = stats.summary()
+        self.assertEqual(summary["samples"], 11)
+        self.assertAlmostEqual(summary["lateness_max_ms"], 10.0)
+        self.assertAlmostEqual(summary["lateness_p50_ms"], 5.0)
+        self.assertAlmostEqual(summary["period_mean_ms"], 501.0)
+
+class TestAdaptivePoller(unittest.TestCase):
+    def test_transition_ramps_up_and_decays(self):
+        poller = AdaptivePoller(0.5, {"Idle": (0.5, 2.0), "Lasering": (0.2, 1.0)}, decay=2.0)
+        self.assertTrue(poller.observe("Idle"))
+        self.assertEqual(poller.interval, 0.5)
+        poller.observe("Idle")
+        poller.observe("Idle")
+        self.assertEqual(poller.interval, 2.0)
+        poller.observe("Idle")
+        self.assertEqual(poller.interval, 2.0)
+
+        # Straight to the fastest rate when the job starts
+        self.assertTrue(poller.observe("Lasering"))
+        self.assertEqual(poller.interval, 0.2)
+
+        # Fast again right after the job ends, then slowing down
+        poller.observe("Idle")
+        self.assertEqual(poller.interval, 0.5)
+        poller.observe("Idle")
+        self.assertEqual(poller.interval, 1.0)
+
+    def test_state_lookup(self):
+        poller = AdaptivePoller(0.7)
+        self.assertEqual(poller.bounds("Hold:1"), poller.bounds("Hold"))
+        self.assertEqual(poller.bounds("Tool"), (0.7, 0.7))
+
+    def test_late_responses_back_off(self):
+        poller = AdaptivePoller(0.5, {"Idle": (0.5, 0.5)})
+        poller.observe("Idle")
+        poller.record_response(0.45)
+        self.assertEqual(poller.interval, 0.75)
+        poller.record_late()
+        self.assertEqual(poller.interval, 1.125)
+        self.assertEqual(poller.late_responses, 2)
+
+        # Recovers once replies are on time again
+        for _ in range(5):
+            poller.record_response(0.05)
+        self.assertEqual(poller.interval, 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
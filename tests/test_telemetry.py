@@ -0,0 +1,123 @@
+import sys
+import json
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_device
+from telemetry import TelemetryBuffer
+from monitor import LaserMonitor
+
+def fill(buffer, count):
+    # 1 sample per second moving 1 mm along X; lasering at 50% on even seconds
+    for i in range(count):
+        buffer.append(float(i), float(i), 0.0, 0.0, 1000 + i, 50.0 if i % 2 == 0 else 0.0, i % 2 == 0)
+
+class TelemetryTests:
+    def test_totals(self):
+        buffer = TelemetryBuffer(capacity=16)
+        fill(buffer, 11)
+        summary = buffer.summary()
+        self.assertEqual(summary["samples"], 10)
+        self.assertEqual(summary["travel_mm"], 10.0)
+        self.assertEqual(summary["lasering_s"], 5.0)
+        self.assertEqual(summary["lasering_mm"], 5.0)
+        self.assertEqual(summary["mean_power_pct"], 50.0)
+        self.assertEqual(summary["peak_feed"], 1010)
+
+    def test_totals_survive_wraparound(self):
+        buffer = TelemetryBuffer(capacity=8)
+        fill(buffer, 1001)
+        self.assertEqual(len(buffer), 8)
+        summary = buffer.summary()
+        self.assertEqual(summary["samples"], 1000)
+        self.assertEqual(summary["travel_mm"], 1000.0)
+        self.assertEqual(summary["lasering_s"], 500.0)
+        self.assertEqual(summary["peak_feed"], 2000)
+
+    def test_window_is_chronological(self):
+        buffer = TelemetryBuffer(capacity=4)
+        fill(buffer, 6)
+        self.assertEqual(list(buffer.window()["t"]), [2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(list(buffer.window(2)["x"]), [4.0, 5.0])
+
+    def test_reset_starts_from_newest_sample(self):
+        buffer = TelemetryBuffer(capacity=4)
+        fill(buffer, 10)
+        buffer.reset_totals()
+        buffer.append(10.0, 12.0, 0.0, 0.0, 0, 0.0, False)
+        summary = buffer.summary()
+        self.assertEqual(summary["samples"], 1)
+        self.assertEqual(summary["travel_mm"], 3.0)
+
+    def test_gap_is_not_lasering(self):
+        buffer = TelemetryBuffer(capacity=4)
+        buffer.append(0.0, 0.0, 0.0, 0.0, 1000, 80.0, True)
+        buffer.append(1.0, 1.0, 0.0, 0.0, 1000, 80.0, True)
+        buffer.mark_gap()
+        buffer.mark_gap()
+        # Back after a 60 s outage, 5 mm further
+        buffer.append(61.0, 6.0, 0.0, 0.0, 1000, 80.0, True)
+        buffer.append(62.0, 7.0, 0.0, 0.0, 1000, 80.0, True)
+        summary = buffer.summary()
+        self.assertEqual(summary["lasering_s"], 2.0)
+        self.assertEqual(summary["travel_mm"], 7.0)
+        self.assertEqual(summary["lasering_mm"], 2.0)
+        self.assertEqual(summary["mean_power_pct"], 80.0)
+
+class TestTelemetry(TelemetryTests, unittest.TestCase):
+    pass
+
+@patch('telemetry.np', None)
+class TestTelemetryWithoutNumpy(TelemetryTests, unittest.TestCase):
+    pass
+
+class TestJobSummary(unittest.TestCase):
+    def make_monitor(self):
+        cfg = make_device(telemetry_capacity=4)
+        self.client = MagicMock()
+        return LaserMonitor(device=cfg, mqtt_client=self.client)
+
+    def job_summaries(self):
+        return [c for c in self.client.publish.call_args_list if c.args[0] == "laser/status/job"]
+
+    def test_summary_published_when_job_ends(self):
+        monitor = self.make_monitor()
+
+        monitor.handle_line("<Idle|MPos:0,0,0|FS:0,0>")
+        for x in range(10):
+            monitor.handle_line(f"<Run|MPos:{x},0,0|FS:1500,800|A:S>")
+        monitor.handle_line("<Idle|MPos:9,0,0|FS:0,0>")
+
+        jobs = self.job_summaries()
+        self.assertEqual(len(jobs), 1)
+        self.assertTrue(jobs[0].kwargs["retain"])
+        summary = json.loads(jobs[0].args[1])
+        self.assertEqual(summary["travel_mm"], 9.0)
+        self.assertEqual(summary["peak_feed"], 1500)
+        self.assertEqual(summary["mean_power_pct"], 80.0)
+
+    @patch('monitor.time.monotonic')
+    def test_link_outage_is_not_lasering_time(self, monotonic):
+        monotonic.return_value = 0.0
+        monitor = self.make_monitor()
+        monitor.handle_line("<Idle|MPos:0,0,0|FS:0,0>")
+        for x in range(3):
+            monotonic.return_value = float(x)
+            monitor.handle_line(f"<Run|MPos:{x},0,0|FS:1500,800|A:S>")
+        monitor.publish_offline_status()
+        # Back five minutes later, still in the job
+        for x in range(3, 5):
+            monotonic.return_value = 300.0 + x
+            monitor.handle_line(f"<Run|MPos:{x},0,0|FS:1500,800|A:S>")
+        monotonic.return_value = 306.0
+        monitor.handle_line("<Idle|MPos:4,0,0|FS:0,0>")
+
+        summary = json.loads(self.job_summaries()[0].args[1])
+        self.assertEqual(summary["lasering_s"], 5.0) # Not the 301 s outage
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import sys
+import os
+import math
+import sqlite3
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_device
+from toolpath import Toolpath, lttb
+from history import JobHistory, job_toolpath
+from pipeline import HistorySink
+from monitor import LaserMonitor
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+class TestToolpath(unittest.TestCase):
+    def test_delta_encoding_round_trip(self):
+        toolpath = Toolpath()
+        toolpath.append(10.0, 20.0, False)
+        toolpath.append(10.0, 20.0, False) # Standing still adds nothing
+        toolpath.append(10.5, 19.25, True)
+        toolpath.append(10.5, 19.25, False) # Laser switched off in place
+        self.assertEqual(toolpath.points(), [(1, 1000, 2000, 0), (3, 1050, 1925, 1), (4, 1050, 1925, 0)])
+        self.assertLess(len(toolpath.data), 6 * len(toolpath))
+
+        copy = Toolpath.from_bytes(toolpath.to_bytes())
+        self.assertEqual(copy.points(), toolpath.points())
+        copy.append(11.0, 19.25, False)
+        self.assertEqual(copy.points()[-1], (5, 1100, 1925, 0))
+
+    def test_memory_stays_bounded_and_covers_the_whole_job(self):
+        toolpath = Toolpath(max_points=200)
+        polls = 100000
+        for i in range(polls):
+            angle = i / 200
+            toolpath.append(100 + 80 * math.cos(angle), 100 + 80 * math.sin(angle), (i // 1000) % 2 == 0)
+        self.assertLess(len(toolpath), 400)
+        self.assertLess(len(toolpath.data), 400 * 9)
+
+        points = toolpath.points()
+        self.assertEqual(points[-1][0], polls)
+        # Every tenth of the job keeps its share of points, however often it was downsampled
+        tenths = [0] * 10
+        for index, _, _, _ in points:
+            tenths[min((index - 1) * 10 // polls, 9)] += 1
+        self.assertGreater(min(tenths), len(points) / 20)
+
+    def test_lttb_keeps_laser_switches(self):
+        points = [(i, i, i % 3, 1 if 500 <= i < 600 else 0) for i in range(1000)]
+        kept = lttb(points, 50)
+        self.assertEqual(len(kept), 50)
+        self.assertIn((500, 500, 2, 1), kept)
+        self.assertIn((600, 600, 0, 0), kept)
+        self.assertEqual((kept[0], kept[-1]), (points[0], points[-1]))
+
+    def test_svg(self):
+        toolpath = Toolpath()
+        for x, y, lasering in [(0, 0, False), (10, 0, True), (10, 10, True), (0, 10, True), (0, 0, False)]:
+            toolpath.append(x, y, lasering)
+        root = ET.fromstring(toolpath.svg(size=400, title="ortur & co"))
+        self.assertEqual((root.get("width"), root.get("height")), ("400", "400"))
+        paths = root.findall(f"{SVG}path")
+        self.assertEqual(len(paths), 2)
+        moving, lasering = paths
+        self.assertEqual(lasering.get("d"), "M1000 0l0 -1000l-1000 0l0 1000")
+        self.assertEqual(moving.get("d"), "M0 0l1000 0")
+        self.assertEqual(root.find(f"{SVG}title").text, "ortur & co")
+        self.assertIsNone(Toolpath().svg())
+
+class TestMonitorToolpath(unittest.TestCase):
+    def make_monitor(self, history=None):
+        cfg = make_device("ortur", toolpath_max_points=100, telegram_enabled=True)
+        monitor = LaserMonitor(device=cfg, mqtt_client=MagicMock())
+        if history:
+            monitor.history = history
+            monitor.pipeline.add(HistorySink(history))
+        monitor.send_telegram_notification = MagicMock()
+        return monitor
+
+    def run_job(self, monitor):
+        monitor.handle_line("<Idle|MPos:50,50,0|FS:0,0>")
+        monitor.handle_line("<Run|MPos:0,0,0|FS:1500,800|A:S>")
+        for x in range(1, 11):
+            monitor.handle_line(f"<Run|MPos:{x},{x % 2},0|FS:1500,800|A:S>")
+        monitor.handle_line("<Run|MPos:20,20,0|FS:3000,0>")
+        monitor.handle_line("<Run|MPos:30,20,0|FS:3000,0>")
+        monitor.handle_line("<Idle|MPos:30,20,0|FS:0,0>")
+
+    def test_completed_notification_carries_the_svg(self):
+        monitor = self.make_monitor()
+        self.run_job(monitor)
+        calls = monitor.send_telegram_notification.call_args_list
+        self.assertEqual(len(calls), 2)
+        name, svg, mime = calls[1].args[1]
+        self.assertTrue(name.startswith("ortur-") and name.endswith(".svg"))
+        self.assertEqual(mime, "image/svg+xml")
+        root = ET.fromstring(svg)
+        # The job started at the origin: the position before it is not part of the path
+        self.assertTrue(root.find(f"{SVG}path[@stroke='#d62728']").get("d").startswith("M0 0l100 -100"))
+        self.assertIsNotNone(root.find(f"{SVG}path[@stroke='#9e9e9e']"))
+
+        # The next job starts from a clean path
+        monitor.send_telegram_notification.reset_mock()
+        monitor.handle_line("<Run|MPos:30,30,0|FS:1500,800|A:S>")
+        monitor.handle_line("<Run|MPos:31,30,0|FS:1500,800|A:S>")
+        monitor.handle_line("<Idle|MPos:31,30,0|FS:0,0>")
+        self.assertEqual(len(monitor.toolpath), 3)
+        self.assertEqual(monitor.toolpath.points()[0][1:3], (3000, 3000))
+
+    def test_toolpath_stored_with_the_job(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.db")
+            history = JobHistory(path, flush_interval=60)
+            history.start()
+            monitor = self.make_monitor(history)
+            self.run_job(monitor)
+            history.stop()
+
+            conn = sqlite3.connect(path)
+            svg = job_toolpath(conn, device="ortur")
+            self.assertIn("ortur job 1", svg)
+            self.assertIsNone(job_toolpath(conn, job=2))
+            conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
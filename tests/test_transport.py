@@ -0,0 +1,138 @@
+import sys
+import os
+import unittest
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from helpers import make_config
+from grbl import parse_status
+from grbl_sim import GrblSimulator, LinkFaults, SimulatorServer
+from transport import TcpTransport, SerialTransport, RfcommTransport, create_transport
+from monitor import LaserMonitor
+
+SCRIPT = [
+    {"state": "Idle", "duration": 0.2},
+    {"state": "Run", "duration": 0.4, "spindle": 800, "feed": 1500, "accessories": "SF", "to": [10, 0]},
+    {"state": "Idle", "duration": 10},
+]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestGrblSimulator(unittest.TestCase):
+    def test_follows_script(self):
+        clock = FakeClock()
+        sim = GrblSimulator(SCRIPT, clock=clock)
+        self.assertEqual(parse_status(sim.status_report().decode().strip())["state"], "Idle")
+
+        clock.now = 0.4 # Halfway through the job
+        data = parse_status(sim.status_report().decode().strip())
+        self.assertEqual(data["detailed_status"], "Lasering")
+        self.assertAlmostEqual(data["mpos"]["x"], 5.0)
+
+        clock.now = 20 # Past the end of the script
+        self.assertEqual(parse_status(sim.status_report().decode().strip())["state"], "Idle")
+
+    def test_replies(self):
+        sim = GrblSimulator(SCRIPT)
+        replies = sim.handle(b"G1 X1\n?$I\n")
+        self.assertEqual(replies[0], b"ok\r\n")
+        self.assertTrue(replies[1].startswith(b"<Idle|"))
+        self.assertTrue(replies[2].startswith(b"[VER:"))
+
+    def test_drop_bytes(self):
+        faults = LinkFaults(drop=0.5, seed=1)
+        mangled = faults.mangle(b"x" * 1000)
+        self.assertTrue(300 < len(mangled) < 700)
+        self.assertEqual(LinkFaults().mangle(b"abc"), b"abc")
+
+class TestTransports(unittest.TestCase):
+    def setUp(self):
+        self.sim = SimulatorServer(script=SCRIPT, faults=LinkFaults(latency=0.05)).start()
+
+    def tearDown(self):
+        self.sim.stop()
+
+    def test_tcp_sync(self):
+        link = TcpTransport("127.0.0.1", self.sim.port)
+        link.open()
+        try:
+            start = time.monotonic()
+            link.send(b"?")
+            reply = link.recv(1024)
+            self.assertGreaterEqual(time.monotonic() - start, 0.05)
+            self.assertTrue(reply.startswith(b"<Idle|"))
+        finally:
+            link.close()
+
+    def test_tcp_async(self):
+        async def query():
+            loop = asyncio.get_running_loop()
+            link = TcpTransport("127.0.0.1", self.sim.port)
+            await link.open_async(loop)
+            try:
+                await link.send_async(loop, b"?")
+                return await link.recv_async(loop, 1024)
+            finally:
+                link.close()
+        self.assertTrue(asyncio.run(query()).startswith(b"<Idle|"))
+
+    def test_serial_pty(self):
+        master, slave = os.openpty()
+        link = SerialTransport(os.ttyname(slave))
+        try:
+            async def query():
+                loop = asyncio.get_running_loop()
+                await link.open_async(loop)
+                await link.send_async(loop, b"?")
+                self.assertEqual(os.read(master, 16), b"?")
+                os.write(master, b"<Idle|MPos:0,0,0>\r\n")
+                return await link.recv_async(loop, 1024)
+            self.assertEqual(asyncio.run(query()), b"<Idle|MPos:0,0,0>\r\n")
+        finally:
+            link.close()
+            os.close(master)
+            os.close(slave)
+
+    def test_create_transport(self):
+        cfg = MagicMock(transport="tcp", tcp_host="laser.local", tcp_port=23)
+        self.assertIsInstance(create_transport(cfg), TcpTransport)
+        cfg = MagicMock(transport="serial", serial_port="/dev/ttyUSB0", serial_baudrate=115200)
+        self.assertIsInstance(create_transport(cfg), SerialTransport)
+        cfg = MagicMock(transport="rfcomm", bluetooth_mac="00:11:22:33:44:55", rfcomm_port=1)
+        self.assertIsInstance(create_transport(cfg), RfcommTransport)
+
+class TestEndToEnd(unittest.TestCase):
+    @patch('monitor.Config')
+    def test_monitor_detects_simulated_job(self, mock_config_cls):
+        sim = SimulatorServer(script=SCRIPT).start()
+        mock_config = make_config(transport="tcp", tcp_host="127.0.0.1", tcp_port=sim.port, polling_interval=0.05)
+        mock_config_cls.return_value = mock_config
+
+        monitor = LaserMonitor()
+        monitor.send_telegram_notification = MagicMock()
+
+        async def run_for(seconds):
+            try:
+                await asyncio.wait_for(monitor._run_async(), seconds)
+            except asyncio.TimeoutError:
+                pass
+
+        try:
+            asyncio.run(run_for(1.0))
+        finally:
+            sim.stop()
+
+        messages = [c.args[0] for c in monitor.send_telegram_notification.call_args_list]
+        self.assertEqual(messages, [mock_config.telegram_message_started, mock_config.telegram_message_completed])
+
+if __name__ == '__main__':
+    unittest.main()